@@ -0,0 +1,280 @@
+#! /usr/bin/env python
+
+__author__ = 'zieghailo'
+
+"""
+Renders many images with one pool of worker processes. Every worker anneals one image at a time,
+with its own RasterContext, so a worker goes through many images.
+The images are read ahead of the workers by a prefetch thread.
+With --mmap-cache the images are decoded into memory mapped files, and the workers get their paths instead of copies.
+
+The input is either a directory of images, or a manifest with one JSON object per line:
+    {"image": "cats/1.jpg", "focus": "cats/1_focus.png", "output": "out/1.png", "settings": {"STARTING_POINTS": 2000}}
+Only "image" is required. The settings override settings.default_settings.C for that job,
+except for the ones in UNSUPPORTED, a job that sets one of those, or an unknown setting, fails.
+
+    python batch.py images/ -o results/ -f png -j 8 --report report.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import traceback
+from argparse import Namespace
+from multiprocessing import Pool, cpu_count
+from Queue import Queue
+
+import numpy as np
+
+from pyramid import Pyramid
+from support import exporter
+import stainedglass
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+# a job runs headless in a single worker process, and only saves its result
+UNSUPPORTED = ('PARALLEL', 'BACKEND', 'HEADLESS', 'PRINT', 'PRINT_COUNTER', 'PRINT_CONSOLE', 'PRINT_ERROR_COUNTER',
+               'TRIANGLE_ALPHA', 'PLOT_ARROWS', 'SAVE_BEST', 'ASYNC_SAVE', 'CHECKPOINT', 'CHECKPOINT_INTERVAL',
+               'CHECKPOINT_CACHE', 'RESUME', 'METRICS', 'METRICS_INTERVAL', 'METRICS_PORT')
+
+
+def read_jobs(source, output_dir, extension='svg'):
+    """
+    :param source: directory of images, or a manifest file
+    :param output_dir: where the results go when the job doesn't name its output
+    :return: list of job dicts with image, focus, output and settings keys
+    """
+    if os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTENSIONS))
+        jobs = [{'image': os.path.join(source, name)} for name in names]
+    else:
+        with open(source) as f:
+            jobs = [json.loads(line) for line in f if line.strip()]
+
+    for job in jobs:
+        job.setdefault('focus', None)
+        job.setdefault('settings', {})
+        stem = os.path.splitext(os.path.basename(job['image']))[0]
+        job.setdefault('output', os.path.join(output_dir, '%s.%s' % (stem, extension)))
+    return jobs
+
+
+def job_settings(defaults, job):
+    """
+    :return: copy of the default settings, with the overrides of the job
+    :raises ValueError: if the job sets a setting the batch doesn't honor
+    """
+    C = Namespace(**vars(defaults))
+    keys = [key.upper() for key in job['settings']]
+    ignored = sorted(key for key in keys if key in UNSUPPORTED or not hasattr(defaults, key))
+    if ignored:
+        raise ValueError("The batch jobs don't support the settings %s." % ', '.join(ignored))
+    for key, value in zip(keys, job['settings'].values()):
+        setattr(C, key, value)
+
+    # the job is a single process, the parallelism is between the jobs
+    C.PARALLEL = False
+    C.HEADLESS = True
+    C.IMAGE_URI, C.FOCUS_MAP, C.OUTPUT = job['image'], job['focus'], job['output']
+    return C
+
+
+def render(C, img, focus):
+    """
+    Anneals a single image and saves the result, runs in the worker processes.
+    :return: report dict of the job
+    """
+    report = {'image': C.IMAGE_URI, 'output': C.OUTPUT, 'pid': os.getpid()}
+    try:
+        start = time.time()
+        # forked workers share the state of the random generator, without a seed every job would draw the same numbers
+        np.random.seed(C.SEED)
+        pyramid = Pyramid(img, focus, C.PYRAMID_LEVELS, C.PYRAMID_SWITCH)
+        level = pyramid.level_for(C.TEMPERATURE)
+        context, pool, mesh, annealer = stainedglass.start_level(C, pyramid, level)
+        levels = [level]
+
+        schedule = stainedglass.make_schedule(C)
+        schedule.enter_level(level > 0)
+        while not schedule.done:
+            switched = stainedglass.next_level(C, pyramid, level, schedule, mesh, pool)
+            if switched is not None:
+                level, context, pool, mesh, annealer = switched
+                levels.append(level)
+            stainedglass.anneal_step(C, mesh, annealer, schedule.temperature, pyramid.scale(level))
+            schedule.update(mesh._error, mesh.points.accepted, mesh.points.rejected)
+        mesh.retriangulate(absolute_error=C.ABSOLUTE_ERROR, parallel=False, engine=C.ERROR_ENGINE)
+        anneal_time = time.time() - start
+
+        directory = os.path.dirname(C.OUTPUT)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass  # created by another worker in the meantime
+        # the anneal may have stopped on a coarse level, its result is scaled up to the original size
+        size = (mesh.image.shape[1], mesh.image.shape[0])
+        exporter.save(mesh._triangulation, C.OUTPUT, size, C.OUTPUT_SCALE * pyramid.scale(level))
+
+        report.update(status='done', iterations=schedule.iteration, stop_reason=schedule.stop_reason, levels=levels,
+                      points=len(mesh.points), error=float(mesh._error),
+                      anneal_time=anneal_time, save_time=time.time() - start - anneal_time)
+    except Exception:
+        report.update(status='failed', traceback=traceback.format_exc())
+    return report
+
+
+class Prefetcher(object):
+    """
+    Reads the images of the jobs in a background thread, at most lookahead images ahead of the consumer.
+    Iterating over it yields (job, img, focus) tuples, img is None if the image couldn't be read.
+    With the default settings given, the focus maps of the jobs without one are generated as the settings say.
+    """
+
+    def __init__(self, jobs, lookahead=2, defaults=None):
+        self._jobs = jobs
+        self._defaults = defaults
+        self._queue = Queue(maxsize=max(1, lookahead))
+        self._thread = threading.Thread(target=self._run, name='Prefetcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        for job in self._jobs:
+            start = time.time()
+            try:
+                generator, cache_dir, mapped_dir = None, None, None
+                if self._defaults is not None:
+                    C = job_settings(self._defaults, job)
+                    generator, cache_dir, mapped_dir = C.FOCUS_GENERATOR, C.FOCUS_CACHE, C.MMAP_CACHE
+                img, focus = stainedglass.load_images(job['image'], job['focus'], generator, cache_dir, mapped_dir)
+            except Exception as e:
+                img, focus = None, str(e)
+            job['load_time'] = time.time() - start
+            self._queue.put((job, img, focus))
+        self._queue.put(None)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            yield item
+
+
+def run(jobs, defaults, processes=None, lookahead=2, callback=None):
+    """
+    Renders the jobs in a pool of worker processes.
+    :param defaults: settings the jobs override
+    :param processes: number of worker processes, all the cores if None
+    :param lookahead: images read ahead, on top of the ones the workers are busy with
+    :param callback: called with the report of every finished job
+    :return: list of the job reports, in the order of the jobs
+    """
+    processes = processes or cpu_count()
+    pool = Pool(processes)
+    # bounds the images held in memory, the pool would otherwise queue up every prefetched image
+    slots = threading.BoundedSemaphore(processes + lookahead)
+    reports = [None] * len(jobs)
+
+    def finished(index, job):
+        def store(report):
+            report['load_time'] = job['load_time']
+            reports[index] = report
+            slots.release()
+            if callback is not None:
+                callback(report)
+        return store
+
+    index_of = dict((id(job), i) for i, job in enumerate(jobs))
+    try:
+        for job, img, focus in Prefetcher(jobs, lookahead, defaults):
+            index = index_of[id(job)]
+            if img is None:
+                reports[index] = {'image': job['image'], 'output': job['output'], 'status': 'failed',
+                                  'traceback': focus, 'load_time': job['load_time']}
+                if callback is not None:
+                    callback(reports[index])
+                continue
+            slots.acquire()
+            pool.apply_async(render, (job_settings(defaults, job), img, focus), callback=finished(index, job))
+        pool.close()
+        pool.join()
+    except:
+        pool.terminate()
+        raise
+    return reports
+
+
+def write_report(reports, uri):
+    """
+    Writes one line per job, csv if the uri ends with .csv, JSON lines otherwise.
+    """
+    with open(uri, 'w') as f:
+        if uri.lower().endswith('.csv'):
+            columns = ['image', 'output', 'status', 'stop_reason', 'iterations', 'points', 'error',
+                       'load_time', 'anneal_time', 'save_time']
+            f.write(','.join(columns) + '\n')
+            for report in reports:
+                f.write(','.join(str(report.get(column, '')) for column in columns) + '\n')
+        else:
+            for report in reports:
+                f.write(json.dumps(report) + '\n')
+
+
+def parse_arguments(default_settings):
+    import argparse
+    parser = argparse.ArgumentParser(prog='Stained Glass batch',
+                                     description='Create low poly versions of many images.')
+    parser.add_argument('source', help='directory of images, or a manifest with one JSON job per line')
+    parser.add_argument('-o', '--output-dir',  type=str,   default='results')
+    parser.add_argument('-f', '--format',      type=str,   default='svg', help='extension of the outputs')
+    parser.add_argument('-j', '--jobs',        type=int,   default=None, help='worker processes')
+    parser.add_argument('-l', '--lookahead',   type=int,   default=2, help='images read ahead')
+    parser.add_argument('-r', '--report',      type=str,   default=None)
+    parser.add_argument('-n', '--points',      type=int,   dest='STARTING_POINTS')
+    parser.add_argument('--init',              choices=['random', 'importance', 'poisson', 'corners'], dest='INITIALIZER')
+    parser.add_argument('-t', '--temperature', type=float, dest='TEMPERATURE')
+    parser.add_argument('-m', '--multiplier',  type=float, dest='TEMP_MULTIPLIER')
+    parser.add_argument('--engine',            choices=['exact', 'squared', 'prefix', 'gradient'], dest='ERROR_ENGINE')
+    parser.add_argument('--anneal',            choices=['global', 'local', 'tiled'], dest='ANNEAL_MODE')
+    parser.add_argument('--focus',             choices=['gradient', 'edges', 'variance'], dest='FOCUS_GENERATOR')
+    parser.add_argument('--focus-cache',       type=str,   dest='FOCUS_CACHE')
+    parser.add_argument('--mmap-cache',        type=str,   dest='MMAP_CACHE')
+    parser.add_argument('--max-iterations',    type=int,   dest='MAX_ITERATIONS')
+    parser.add_argument('--output-scale',      type=float, dest='OUTPUT_SCALE')
+
+    args = parser.parse_args()
+    for key, value in vars(args).items():
+        if key.isupper() and value is not None:
+            setattr(default_settings, key, value)
+    return args
+
+
+def main():
+    from settings.default_settings import C
+    args = parse_arguments(C)
+
+    jobs = read_jobs(args.source, args.output_dir, args.format)
+    start = time.time()
+
+    def progress(report):
+        if report['status'] == 'done':
+            print("%s: error %.1f, %d points, %.2fs" % (report['image'], report['error'], report['points'],
+                                                        report['anneal_time'] + report['save_time']))
+        else:
+            print("%s: failed\n%s" % (report['image'], report['traceback']))
+        sys.stdout.flush()
+
+    reports = run(jobs, C, args.jobs, args.lookahead, progress)
+    done = sum(1 for report in reports if report['status'] == 'done')
+    print("%d of %d jobs done in %.2fs" % (done, len(jobs), time.time() - start))
+
+    if args.report is not None:
+        write_report(reports, args.report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+__author__ = 'zieghailo'
+
+"""
+Convergence of the anneal from every initializer. Every run anneals the same image with the same
+schedule and seed, and records the error along the way. The target is the final error of the random
+placement, each initializer is timed to the moment it gets there.
+
+    python -m benchmarks.initial_placement images/lion.jpg --focus gradient -n 2000 -i 500
+"""
+
+import time
+import argparse
+from argparse import Namespace
+
+import numpy as np
+
+import stainedglass
+from pyramid import Pyramid
+from settings.default_settings import C as defaults
+
+CHECKPOINTS = (0, 0.1, 0.25, 0.5, 1.0)  # parts of the run the error is reported at
+
+
+def run(C, img, focus):
+    """
+    :return: (seconds spent placing the points, list of (elapsed seconds, error) after every iteration)
+    """
+    np.random.seed(C.SEED)
+    start = time.time()
+    context, pool, mesh, annealer = stainedglass.start_level(C, Pyramid(img, focus), 0)
+    mesh.retriangulate(absolute_error=C.ABSOLUTE_ERROR, parallel=False, engine=C.ERROR_ENGINE)
+    placed = time.time() - start
+
+    schedule = stainedglass.make_schedule(C)
+    trace = [(placed, mesh._error)]
+    while not schedule.done:
+        stainedglass.anneal_step(C, mesh, annealer, schedule.temperature)
+        schedule.update(mesh._error, mesh.points.accepted, mesh.points.rejected)
+        trace.append((time.time() - start, mesh._error))
+    mesh.retriangulate(absolute_error=C.ABSOLUTE_ERROR, parallel=False, engine=C.ERROR_ENGINE)
+    trace[-1] = (time.time() - start, mesh._error)
+    return placed, trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convergence of the anneal from every initializer.')
+    parser.add_argument('image')
+    parser.add_argument('focus', nargs='?')
+    parser.add_argument('--focus', dest='generator', choices=['gradient', 'edges', 'variance'], default='gradient')
+    parser.add_argument('-n', '--points', type=int, default=2000)
+    parser.add_argument('-i', '--iterations', type=int, default=500)
+    parser.add_argument('-t', '--temperature', type=float, default=5)
+    parser.add_argument('--anneal', choices=['global', 'local', 'tiled'], default='local')
+    parser.add_argument('--initializers', nargs='+', default=['random', 'importance', 'poisson', 'corners'])
+    args = parser.parse_args()
+
+    img, focus = stainedglass.load_images(args.image, args.focus, args.generator)
+    C = Namespace(**vars(defaults))
+    C.STARTING_POINTS, C.TEMPERATURE, C.MAX_ITERATIONS = args.points, args.temperature, args.iterations
+    C.ANNEAL_MODE, C.PARALLEL, C.HEADLESS, C.SEED = args.anneal, False, True, 0
+    # the same number of points all the way, so that only the placement differs
+    C.PURGE_MULTIPLIER = 0
+    C.TEMP_MULTIPLIER = (0.1 / args.temperature) ** (1.0 / args.iterations)
+
+    results = []
+    for name in args.initializers:
+        C.INITIALIZER = name
+        results.append((name,) + run(C, img, focus))
+
+    target = dict((name, trace) for name, _, trace in results).get('random', results[0][2])[-1][1]
+    print 'target error: %.1f' % target
+    print '%12s %8s %10s ' % ('initializer', 'place s', 'to target') + \
+        ' '.join('%12s' % ('error@%d%%' % (100 * part)) for part in CHECKPOINTS)
+    for name, placed, trace in results:
+        reached = [seconds for seconds, error in trace if error <= target]
+        errors = [trace[int(part * (len(trace) - 1))][1] for part in CHECKPOINTS]
+        print '%12s %8.3f %10s ' % (name, placed, '%.2f' % reached[0] if reached else '-') + \
+            ' '.join('%12.4g' % error for error in errors)
+
+
+if __name__ == '__main__':
+    main()
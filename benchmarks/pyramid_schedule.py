@@ -0,0 +1,89 @@
+__author__ = 'zieghailo'
+
+"""
+Time to a target error of the coarse to fine anneal, against the single resolution loop of stainedglass.main.
+Every pyramid depth anneals the same image from the same seed, with the same schedule. The target is the
+final error of the single resolution run, loosened by the tolerance, and only the errors measured
+on the original image count.
+
+    python -m benchmarks.pyramid_schedule images/lion.jpg -n 2000 -t 20 -l 1 2 3
+"""
+
+import time
+import argparse
+from argparse import Namespace
+
+import numpy as np
+
+import stainedglass
+from pyramid import Pyramid
+from settings.default_settings import C as defaults
+
+
+def run(C, img, focus):
+    """
+    :return: (elapsed seconds, error) of every iteration annealed on the original image, and the total seconds
+    """
+    np.random.seed(C.SEED)
+    pyramid = Pyramid(img, focus, C.PYRAMID_LEVELS, C.PYRAMID_SWITCH)
+    schedule = stainedglass.make_schedule(C)
+    level = pyramid.level_for(schedule.temperature)
+
+    start = time.time()
+    context, pool, mesh, annealer = stainedglass.start_level(C, pyramid, level)
+    trace = []
+    while not schedule.done:
+        if pyramid.level_for(schedule.temperature) < level:
+            level = pyramid.level_for(schedule.temperature)
+            context, pool, mesh, annealer = stainedglass.start_level(C, pyramid, level,
+                                                                     pyramid.rescale(mesh.points, level))
+            schedule.reset_best()
+        stainedglass.anneal_step(C, mesh, annealer, schedule.temperature, pyramid.scale(level))
+        schedule.update(mesh._error, mesh.points.accepted, mesh.points.rejected)
+        if level == 0:
+            trace.append((time.time() - start, mesh._error))
+    return trace, time.time() - start
+
+
+def time_to(trace, target):
+    for seconds, error in trace:
+        if error <= target:
+            return seconds
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time to a target error of the coarse to fine anneal.')
+    parser.add_argument('image')
+    parser.add_argument('focus', nargs='?')
+    parser.add_argument('-n', '--points', type=int, default=2000)
+    parser.add_argument('-l', '--levels', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('-t', '--temperature', type=float, default=20)
+    parser.add_argument('-m', '--multiplier', type=float, default=0.99)
+    parser.add_argument('-s', '--switch', type=float, default=2.0)
+    parser.add_argument('--anneal', choices=['global', 'local', 'tiled'], default='global')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='relative to the single resolution error')
+    args = parser.parse_args()
+
+    img, focus = stainedglass.load_images(args.image, args.focus)
+    C = Namespace(**vars(defaults))
+    C.STARTING_POINTS, C.TEMPERATURE, C.TEMP_MULTIPLIER = args.points, args.temperature, args.multiplier
+    C.ANNEAL_MODE, C.PYRAMID_SWITCH = args.anneal, args.switch
+    C.PARALLEL, C.HEADLESS, C.SEED = False, True, 0
+
+    results = []
+    for levels in args.levels:
+        C.PYRAMID_LEVELS = levels
+        results.append((levels,) + run(C, img, focus))
+
+    # the runs are compared against the first depth, the single resolution loop with the default arguments
+    target = results[0][1][-1][1] * (1 + args.tolerance)
+    print 'target error: %.1f' % target
+    print '%8s %12s %12s %16s' % ('levels', 'to target', 'total', 'final error')
+    for levels, trace, total in results:
+        seconds = time_to(trace, target)
+        print '%8d %12s %12.2f %16.1f' % (levels, '-' if seconds is None else '%.2f' % seconds, total, trace[-1][1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+__author__ = 'zieghailo'
+
+"""
+Benchmark suite of the annealing hot paths, with fixed seeds, written to JSON.
+Every hot path is timed on its own for every mesh size, with a cold triangle cache, and the whole
+anneal is recorded as a time to error curve. Two result files can be compared to catch regressions,
+the comparison fails when a hot path got slower than the threshold and the floor allow.
+
+    python -m benchmarks.suite run images/lion.jpg -o base.json
+    python -m benchmarks.suite run images/lion.jpg -o new.json
+    python -m benchmarks.suite compare base.json new.json --threshold 0.1
+"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+from argparse import Namespace
+
+import numpy as np
+
+import trimath
+import stainedglass
+from mesh import Mesh
+from pyramid import Pyramid
+from triangulation import Triangulation
+from support import triangle_cache
+from settings.default_settings import C as defaults
+
+SIZES = (100, 1000, 10000)
+SEED = 0
+
+
+def _timed(setup, call, repeat):
+    """
+    :param setup: called before every timed call, with the result passed on to call, not timed
+    :return: dict of the min and median seconds of the calls
+    """
+    seconds = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.time()
+        call(*args)
+        seconds.append(time.time() - start)
+    return {'min': min(seconds), 'median': float(np.median(seconds)), 'repeat': repeat}
+
+
+def _mesh(context, n, seed=SEED):
+    """
+    :return: mesh of n random points, triangulated and colorized, with a cold cache
+    """
+    triangle_cache.configure(max(triangle_cache.CAPACITY, 4 * n), triangle_cache.QUANTUM)
+    np.random.seed(seed)
+    mesh = Mesh(context.image, n, parallel=False, context=context)
+    mesh.retriangulate(absolute_error=True, parallel=False)
+    return mesh
+
+
+def hot_paths(context, sizes, repeat):
+    """
+    :return: {hot path: {size: timing}} dict
+    """
+    def cold():
+        triangle_cache.configure(triangle_cache.cache.capacity, triangle_cache.QUANTUM)
+
+    results = {}
+    for n in sizes:
+        def shifted():
+            # a mesh and the triangulation of its points after a shift, as in evolve
+            mesh = _mesh(context, n)
+            old = mesh._triangulation
+            mesh.points.shift(3)
+            new = Triangulation(mesh.positions, previous=old)
+            new.colorize_stack(True, False, context=context)
+            return old, new, Triangulation.neighborhood([old, new], len(mesh.points))
+
+        def stacked():
+            mesh = _mesh(context, n)
+            cold()
+            return Triangulation(mesh.positions),
+
+        def evolving():
+            mesh = _mesh(context, n)
+            np.random.seed(SEED)
+            return mesh,
+
+        positions = _mesh(context, n).positions.copy()
+        cases = {
+            'triangulation': (lambda: (cold(),), lambda _: Triangulation(positions)),
+            'colorize_stack': (stacked, lambda tri: tri.colorize_stack(True, False, context=context)),
+            'neighborhood_errors': (shifted, lambda old, new, nb: (old.neighborhood_errors(nb),
+                                                                   new.neighborhood_errors(nb))),
+            'evolve': (evolving, lambda mesh: mesh.evolve(3, absolute_error=True, parallel=False)),
+            'evolve_local': (evolving, lambda mesh: mesh.evolve_local(3, absolute_error=True, parallel=False)),
+            'slow_purge': (evolving, lambda mesh: mesh.slow_purge(n=10)),
+        }
+        for name, (setup, call) in sorted(cases.items()):
+            results.setdefault(name, {})[str(n)] = _timed(setup, call, repeat)
+            print '%20s %6d %10.4f' % (name, n, results[name][str(n)]['median'])
+            sys.stdout.flush()
+    return results
+
+
+def curve(C, img, focus, samples=50):
+    """
+    Anneals the image the way stainedglass.main does, headless and serial.
+    :return: list of [elapsed seconds, error] pairs, about samples of them
+    """
+    np.random.seed(C.SEED)
+    context, pool, mesh, annealer = stainedglass.start_level(C, Pyramid(img, focus), 0)
+    schedule = stainedglass.make_schedule(C)
+    every = max(1, C.MAX_ITERATIONS // samples)
+
+    start = time.time()
+    points = []
+    while not schedule.done:
+        stainedglass.anneal_step(C, mesh, annealer, schedule.temperature)
+        schedule.update(mesh._error, mesh.points.accepted, mesh.points.rejected)
+        if schedule.iteration % every == 0:
+            points.append([time.time() - start, float(mesh._error)])
+    return points
+
+
+def run(args):
+    img, focus = stainedglass.load_images(args.image)
+    context = trimath.RasterContext(img, focus)
+
+    results = {
+        'meta': {'image': args.image, 'seed': SEED, 'sizes': args.sizes, 'repeat': args.repeat,
+                 'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.platform(),
+                 'date': time.strftime('%Y-%m-%d %H:%M:%S')},
+        'hot_paths': hot_paths(context, args.sizes, args.repeat),
+        'curves': {},
+    }
+
+    for mode in args.modes:
+        C = Namespace(**vars(defaults))
+        C.STARTING_POINTS, C.MAX_ITERATIONS, C.TEMPERATURE = args.curve_points, args.iterations, 5
+        C.TEMP_MULTIPLIER = (0.1 / C.TEMPERATURE) ** (1.0 / args.iterations)
+        C.ANNEAL_MODE, C.PARALLEL, C.HEADLESS, C.SEED = mode, False, True, SEED
+        results['curves'][mode] = curve(C, img, focus)
+        print '%20s %6d %10.4f %16.1f' % ('curve ' + mode, C.STARTING_POINTS, results['curves'][mode][-1][0],
+                                          results['curves'][mode][-1][1])
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+
+
+def compare(args):
+    """
+    :return: exit code, 1 if any hot path got slower by more than the threshold
+    """
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    regressions = 0
+    print '%20s %6s %10s %10s %8s' % ('hot path', 'size', 'base', 'new', 'ratio')
+    for name in sorted(base['hot_paths']):
+        for size in sorted(base['hot_paths'][name], key=int):
+            if size not in new['hot_paths'].get(name, {}):
+                continue
+            old_s, new_s = base['hot_paths'][name][size]['median'], new['hot_paths'][name][size]['median']
+            ratio = new_s / old_s if old_s > 0 else 1.0
+            # the fastest paths jitter by more than the threshold, those need to lose some time as well
+            slower = ratio > 1 + args.threshold and new_s - old_s > args.floor
+            regressions += slower
+            print '%20s %6s %10.4f %10.4f %8.2f%s' % (name, size, old_s, new_s, ratio,
+                                                      '  REGRESSION' if slower else '')
+
+    for mode in sorted(base['curves']):
+        if mode in new['curves'] and base['curves'][mode] and new['curves'][mode]:
+            (old_s, old_e), (new_s, new_e) = base['curves'][mode][-1], new['curves'][mode][-1]
+            print '%20s %10.2fs %10.2fs  error %.4g -> %.4g' % ('curve ' + mode, old_s, new_s, old_e, new_e)
+
+    print '%d regressions' % regressions
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the annealing hot paths.')
+    commands = parser.add_subparsers(dest='command')
+
+    runner = commands.add_parser('run', help='run the suite and write the results')
+    runner.add_argument('image')
+    runner.add_argument('-o', '--output', default='benchmark.json')
+    runner.add_argument('-s', '--sizes', type=int, nargs='+', default=list(SIZES))
+    runner.add_argument('-r', '--repeat', type=int, default=5)
+    runner.add_argument('-i', '--iterations', type=int, default=200, help='iterations of the time to error curves')
+    runner.add_argument('-n', '--curve-points', type=int, default=1000)
+    runner.add_argument('--modes', nargs='+', default=['global', 'local'], choices=['global', 'local', 'tiled'])
+
+    comparer = commands.add_parser('compare', help='compare two result files')
+    comparer.add_argument('base')
+    comparer.add_argument('new')
+    comparer.add_argument('-t', '--threshold', type=float, default=0.1, help='allowed relative slowdown')
+    comparer.add_argument('-f', '--floor', type=float, default=0.001, help='seconds of slowdown that are ignored')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+__author__ = 'zieghailo'
+
+"""
+Measures how the tiled annealing scales with the number of worker processes.
+Every worker count starts from the same random mesh, and runs the same number of rounds.
+
+    python -m benchmarks.tiled_speedup images/lion.jpg -n 5000 -w 1 2 4 8
+"""
+
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+import trimath
+import img2heur
+from mesh import Mesh
+from tiling import TiledAnnealer
+from support.workerpool import WorkerPool
+
+
+def run(context, points, workers, rounds, steps, temp):
+    """
+    :return: (seconds per round, final error) tuple
+    """
+    pool = WorkerPool(context, processes=workers)
+    try:
+        np.random.seed(0)
+        mesh = Mesh(context.image, points, pool=pool, context=context)
+        annealer = TiledAnnealer(mesh, pool, steps=steps)
+        mesh.retriangulate(absolute_error=True)
+
+        start = time.time()
+        for _ in range(rounds):
+            annealer.anneal(temp, absolute_error=True)
+        return (time.time() - start) / rounds, mesh._error
+    finally:
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Speedup of the tiled annealing as a function of worker count.')
+    parser.add_argument('image')
+    parser.add_argument('-n', '--points', type=int, default=5000)
+    parser.add_argument('-w', '--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('-r', '--rounds', type=int, default=5)
+    parser.add_argument('-s', '--steps', type=int, default=10)
+    parser.add_argument('-t', '--temperature', type=float, default=3)
+    args = parser.parse_args()
+
+    img = cv2.imread(args.image)
+    cv2.cvtColor(img, cv2.COLOR_BGR2RGB, img)
+    focus = img2heur.default_focus_image(img)
+    context = trimath.RasterContext(img, focus)
+
+    print '%8s %12s %8s %16s' % ('workers', 's/round', 'speedup', 'error')
+    base = None
+    for workers in args.workers:
+        seconds, error = run(context, args.points, workers, args.rounds, args.steps, args.temperature)
+        base = base or seconds
+        print '%8d %12.3f %8.2f %16.1f' % (workers, seconds, base / seconds, error)
+
+
+if __name__ == '__main__':
+    main()
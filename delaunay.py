@@ -0,0 +1,487 @@
+__author__ = 'zieghailo'
+
+import numpy as np
+from bisect import bisect_left
+from itertools import count
+
+
+def orient(a, b, c):
+    """
+    Twice the signed area of the triangle abc.
+    :return: positive if abc is counter clockwise, negative if clockwise, zero if collinear
+    """
+    return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+
+def in_circle(a, b, c, d):
+    """
+    :return: positive if d lies inside the circumcircle of the counter clockwise triangle abc
+    """
+    adx = a[0] - d[0]
+    ady = a[1] - d[1]
+    bdx = b[0] - d[0]
+    bdy = b[1] - d[1]
+    cdx = c[0] - d[0]
+    cdy = c[1] - d[1]
+    return ((adx * adx + ady * ady) * (bdx * cdy - cdx * bdy) +
+            (bdx * bdx + bdy * bdy) * (cdx * ady - adx * cdy) +
+            (cdx * cdx + cdy * cdy) * (adx * bdy - bdx * ady))
+
+
+class DelaunaySnapshot(object):
+    """
+    A frozen copy of the incremental triangulation, with the same
+    simplices and vertex_neighbor_vertices attributes as scipy's Delaunay.
+    ids holds the id of each simplex, ids don't change until the simplex is destroyed.
+    """
+
+    def __init__(self, points, simplices, ids, vertex_neighbor_vertices):
+        self.points = points
+        self.simplices = simplices
+        self.ids = ids
+        self.vertex_neighbor_vertices = vertex_neighbor_vertices
+
+
+class IncrementalDelaunay(object):
+    """
+    Delaunay triangulation that is updated in place as points are inserted,
+    removed and moved, using local edge flips instead of a full Qhull rebuild.
+
+    Vertices are numbered like the list of points the triangulation was created with,
+    removing a vertex shifts the following indices down, like list.remove does.
+    The first four points must span the convex hull of all the points,
+    which holds for the fixed corners of the mesh.
+
+    Every simplex gets a new id when it is created, so the ids of the snapshots tell which simplices
+    two triangulations share. A simplex whose vertex moved is created again, with a new id.
+    """
+
+    def __init__(self, positions):
+        self._pos = []
+        self._vtri = []
+        self._tris = {}
+        self._edges = {}
+        self._hidden = set()
+        self._ids = count()
+        self._last = None
+
+        self._build(np.asarray(positions, dtype=float).tolist())
+
+    # region properties
+    @property
+    def simplices(self):
+        return np.array(list(self._tris.values()), dtype=np.int32).reshape(-1, 3)
+
+    @property
+    def points(self):
+        return np.array(self._pos)
+
+    @property
+    def vertex_neighbor_vertices(self):
+        """
+        Same format as scipy's Delaunay.vertex_neighbor_vertices:
+        the neighbors of vertex k are indices[indptr[k]:indptr[k+1]].
+        """
+        n = len(self._pos)
+        edges = np.array(list(self._edges.keys()), dtype=np.int32).reshape(-1, 2)
+        edges = np.concatenate((edges, edges[:, ::-1]))
+        # unique pairs, sorted by the first vertex
+        edges = np.unique(edges[:, 0].astype(np.int64) * n + edges[:, 1])
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        indptr[1:] = np.cumsum(np.bincount(edges // n, minlength=n))
+        return indptr, (edges % n).astype(np.int32)
+    # endregion
+
+    def snapshot(self):
+        items = list(self._tris.items())
+        ids = np.array([tid for tid, _ in items], dtype=np.int64)
+        simplices = np.array([tr for _, tr in items], dtype=np.int32).reshape(-1, 3)
+        return DelaunaySnapshot(self.points, simplices, ids, self.vertex_neighbor_vertices)
+
+    def insert(self, x, y):
+        """
+        Adds a point at the end of the vertex list.
+        :return: the index of the new vertex
+        """
+        v = len(self._pos)
+        self._pos.append([float(x), float(y)])
+        self._vtri.append(None)
+        self._attach(v)
+        return v
+
+    def remove(self, v):
+        """
+        Removes vertex v and retriangulates the hole it leaves.
+        The vertices after v are renumbered.
+        """
+        self.remove_many([v])
+
+    def remove_many(self, vertices):
+        """
+        Removes the vertices and retriangulates the holes they leave.
+        The remaining vertices are renumbered once, instead of once per removed vertex.
+        """
+        vertices = sorted(set(vertices))
+        for v in vertices:
+            self._detach(v)
+        for v in reversed(vertices):
+            self._hidden.discard(v)
+            self._pos.pop(v)
+            self._vtri.pop(v)
+        self._renumber(vertices)
+
+    def move(self, v, x, y):
+        """
+        Moves vertex v. If none of its triangles fold over, the vertex is moved in place
+        and the surrounding edges are flipped, otherwise it is removed and inserted again.
+        """
+        q = [float(x), float(y)]
+        if q == self._pos[v]:
+            return
+
+        if v in self._hidden:
+            self._pos[v] = q
+            self._attach(v)
+            return
+
+        star = self._star(v)
+        if star is not None and all(orient(q, self._pos[a], self._pos[b]) > 0 for _, a, b in star):
+            self._pos[v] = q
+            tids = []
+            for tid, a, b in star:
+                self._delete(tid)
+            for tid, a, b in star:
+                tids.append(self._add(v, a, b))
+            self._legalize(tids)
+        else:
+            self._detach(v)
+            self._pos[v] = q
+            self._attach(v)
+
+    def move_points(self, positions):
+        """
+        Moves every vertex whose position differs from the given (N,2) array.
+        """
+        for v, (x, y) in enumerate(np.asarray(positions, dtype=float).tolist()):
+            if self._pos[v][0] != x or self._pos[v][1] != y:
+                self.move(v, x, y)
+
+    # region triangle bookkeeping
+    def _add(self, a, b, c):
+        tid = next(self._ids)
+        self._tris[tid] = (a, b, c)
+        self._edges[(a, b)] = tid
+        self._edges[(b, c)] = tid
+        self._edges[(c, a)] = tid
+        self._vtri[a] = tid
+        self._vtri[b] = tid
+        self._vtri[c] = tid
+        self._last = tid
+        return tid
+
+    def _delete(self, tid):
+        a, b, c = self._tris.pop(tid)
+        del self._edges[(a, b)]
+        del self._edges[(b, c)]
+        del self._edges[(c, a)]
+
+    def _third(self, tid, u, w):
+        """
+        :return: the vertex of triangle tid opposite to its directed edge u->w
+        """
+        a, b, c = self._tris[tid]
+        if (a, b) == (u, w):
+            return c
+        if (b, c) == (u, w):
+            return a
+        return b
+
+    def _star(self, v):
+        """
+        The triangles around v in counter clockwise order,
+        as (tid, a, b) tuples where (v, a, b) is the triangle.
+        :return: the star, or None if v lies on the convex hull
+        """
+        start = self._vtri[v]
+        star = []
+        tid = start
+        while True:
+            tr = self._tris[tid]
+            i = tr.index(v)
+            a, b = tr[(i + 1) % 3], tr[(i + 2) % 3]
+            star.append((tid, a, b))
+            tid = self._edges.get((v, b))
+            if tid is None:
+                return None
+            if tid == start:
+                return star
+
+    def _fan(self, v):
+        """
+        The triangles around v in counter clockwise order, also for vertices on the hull.
+        :return: list of (tid, a, b) tuples, and True if the fan is closed
+        """
+        star = self._star(v)
+        if star is not None:
+            return star, True
+
+        # walk clockwise to the first triangle on the hull, then collect counter clockwise
+        tid = self._vtri[v]
+        while True:
+            tr = self._tris[tid]
+            i = tr.index(v)
+            prev = self._edges.get((tr[(i + 1) % 3], v))
+            if prev is None:
+                break
+            tid = prev
+
+        fan = []
+        while tid is not None:
+            tr = self._tris[tid]
+            i = tr.index(v)
+            a, b = tr[(i + 1) % 3], tr[(i + 2) % 3]
+            fan.append((tid, a, b))
+            tid = self._edges.get((v, b))
+        return fan, False
+    # endregion
+
+    # region construction
+    def _build(self, positions, exclude=()):
+        """
+        Triangulates the first four points, and inserts the rest one by one.
+        :param exclude: indices of the points that are kept out of the triangulation
+        """
+        for p in positions:
+            self._pos.append(p)
+            self._vtri.append(None)
+
+        hull = list(range(min(4, len(positions))))
+        cx = sum(positions[i][0] for i in hull) / len(hull)
+        cy = sum(positions[i][1] for i in hull) / len(hull)
+        hull.sort(key=lambda i: np.arctan2(positions[i][1] - cy, positions[i][0] - cx))
+
+        tids = []
+        for i in range(1, len(hull) - 1):
+            if orient(positions[hull[0]], positions[hull[i]], positions[hull[i + 1]]) > 0:
+                tids.append(self._add(hull[0], hull[i], hull[i + 1]))
+        if len(tids) == 0:
+            raise RuntimeError("Triangulation failed.")
+        self._legalize(tids)
+
+        for v in range(len(hull), len(positions)):
+            if v in exclude:
+                self._hidden.add(v)
+            else:
+                self._attach(v)
+
+    def _renumber(self, removed):
+        """
+        Shifts the vertex indices down by the number of removed vertices before them.
+        :param removed: sorted list of the removed vertices
+        """
+        def shift(i):
+            return i - bisect_left(removed, i)
+
+        tris = {}
+        edges = {}
+        for tid, (a, b, c) in self._tris.items():
+            a, b, c = shift(a), shift(b), shift(c)
+            tris[tid] = (a, b, c)
+            edges[(a, b)] = tid
+            edges[(b, c)] = tid
+            edges[(c, a)] = tid
+        self._tris = tris
+        self._edges = edges
+        self._hidden = set(shift(i) for i in self._hidden)
+
+    def rebuild(self, exclude=()):
+        """
+        Throws away the current triangles and triangulates all the points again, all of them get new ids.
+        :param exclude: indices of the points that are kept out of the triangulation
+        """
+        positions = self._pos
+        for tid in list(self._tris.keys()):
+            self._delete(tid)
+
+        hidden = self._hidden
+        self._pos = []
+        self._vtri = []
+        self._hidden = set()
+        self._build(positions, exclude=set(exclude) | hidden)
+    # endregion
+
+    # region local operations
+    def _locate(self, p):
+        """
+        Walks through the triangulation towards the point p.
+        :return: ('triangle', tid), ('edge', tid, u, w) if p lies on the edge u->w of tid,
+        or ('vertex', v) if p coincides with the vertex v
+        """
+        pos = self._pos
+        tid = self._last
+        if tid not in self._tris:
+            tid = next(iter(self._tris))
+
+        turn = 0
+        for _ in range(4 * len(self._tris) + 4):
+            tr = self._tris[tid]
+            turn += 1
+            moved = False
+            on_edge = None
+            for k in range(3):
+                u = tr[(k + turn) % 3]
+                w = tr[(k + turn + 1) % 3]
+                o = orient(pos[u], pos[w], p)
+                if o < 0:
+                    nxt = self._edges.get((w, u))
+                    if nxt is None:
+                        raise ValueError("Point %s lies outside of the triangulation." % p)
+                    tid = nxt
+                    moved = True
+                    break
+                elif o == 0:
+                    on_edge = (u, w)
+            if moved:
+                continue
+
+            for u in tr:
+                if pos[u] == p:
+                    return 'vertex', u
+            if on_edge is not None:
+                return 'edge', tid, on_edge[0], on_edge[1]
+            return 'triangle', tid
+
+        # the walk got stuck, fall back to checking every triangle
+        for tid, (a, b, c) in self._tris.items():
+            if orient(pos[a], pos[b], p) >= 0 and orient(pos[b], pos[c], p) >= 0 and \
+                    orient(pos[c], pos[a], p) >= 0:
+                return 'triangle', tid
+        raise ValueError("Point %s lies outside of the triangulation." % p)
+
+    def _attach(self, v):
+        """
+        Inserts the existing vertex v into the triangulation.
+        """
+        self._hidden.discard(v)
+        where = self._locate(self._pos[v])
+        if where[0] == 'vertex':
+            # duplicate point, like Qhull it doesn't take part in any simplex
+            self._hidden.add(v)
+            self._vtri[v] = None
+            return
+
+        tids = []
+        if where[0] == 'triangle':
+            a, b, c = self._tris[where[1]]
+            self._delete(where[1])
+            tids.append(self._add(a, b, v))
+            tids.append(self._add(b, c, v))
+            tids.append(self._add(c, a, v))
+        else:
+            _, tid, u, w = where
+            x = self._third(tid, u, w)
+            other = self._edges.get((w, u))
+            self._delete(tid)
+            if other is not None:
+                y = self._third(other, w, u)
+                self._delete(other)
+                tids.append(self._add(w, v, y))
+                tids.append(self._add(v, u, y))
+            tids.append(self._add(u, v, x))
+            tids.append(self._add(v, w, x))
+        self._legalize(tids)
+
+    def _detach(self, v):
+        """
+        Takes vertex v out of the triangulation and fills the hole,
+        without changing the vertex numbering.
+        """
+        if v in self._hidden:
+            return
+
+        fan, closed = self._fan(v)
+        polygon = [a for _, a, _ in fan]
+        if not closed:
+            polygon.append(fan[-1][2])
+
+        for tid, _, _ in fan:
+            self._delete(tid)
+        self._vtri[v] = None
+        self._hidden.add(v)
+
+        tids = self._triangulate_polygon(polygon)
+        if tids is None:
+            self.rebuild(exclude=(v,))
+            return
+        self._legalize(tids)
+
+    def _triangulate_polygon(self, polygon):
+        """
+        Ear clipping of the counter clockwise polygon left behind by a removed vertex.
+        :return: ids of the created triangles, or None if no ear could be found
+        """
+        pos = self._pos
+        polygon = list(polygon)
+        tids = []
+        while len(polygon) > 3:
+            n = len(polygon)
+            for i in range(n):
+                a, b, c = polygon[i - 1], polygon[i], polygon[(i + 1) % n]
+                if orient(pos[a], pos[b], pos[c]) <= 0:
+                    continue
+                blocked = False
+                for d in polygon:
+                    if d in (a, b, c):
+                        continue
+                    if orient(pos[a], pos[b], pos[d]) >= 0 and orient(pos[b], pos[c], pos[d]) >= 0 and \
+                            orient(pos[c], pos[a], pos[d]) >= 0:
+                        blocked = True
+                        break
+                if not blocked:
+                    tids.append(self._add(a, b, c))
+                    polygon.pop(i)
+                    break
+            else:
+                for tid in tids:
+                    self._delete(tid)
+                return None
+
+        if len(polygon) == 3:
+            a, b, c = polygon
+            if orient(pos[a], pos[b], pos[c]) <= 0:
+                for tid in tids:
+                    self._delete(tid)
+                return None
+            tids.append(self._add(a, b, c))
+        return tids
+
+    def _legalize(self, tids):
+        """
+        Lawson's flip algorithm, starting from the edges of the given triangles.
+        """
+        pos = self._pos
+        stack = []
+        for tid in tids:
+            if tid in self._tris:
+                a, b, c = self._tris[tid]
+                stack.extend(((a, b), (b, c), (c, a)))
+
+        while stack:
+            u, w = stack.pop()
+            t1 = self._edges.get((u, w))
+            t2 = self._edges.get((w, u))
+            if t1 is None or t2 is None:
+                continue  # the edge is on the hull, or it has already been flipped
+            x = self._third(t1, u, w)
+            y = self._third(t2, w, u)
+            if in_circle(pos[u], pos[w], pos[x], pos[y]) <= 0:
+                continue
+            if orient(pos[x], pos[u], pos[y]) <= 0 or orient(pos[y], pos[w], pos[x]) <= 0:
+                continue
+
+            self._delete(t1)
+            self._delete(t2)
+            self._add(x, u, y)
+            self._add(y, w, x)
+            stack.extend(((u, y), (y, w), (w, x), (x, u)))
+    # endregion
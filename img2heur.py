@@ -1,10 +1,16 @@
 __author__ = 'zieghailo'
 
+import os
+import hashlib
+import tempfile
+
 import numpy as np
 
+CACHE_VERSION = 1  # bump when a generator changes, so that stale maps aren't reused
+
 
 def default_focus_image(img):
-    return np.ones(img.shape[:2]).astype(np.uint16)
+    return np.ones(img.shape[:2], dtype=np.uint16)
 
 
 def linear(img):
@@ -21,3 +27,103 @@ def exponential(img):
 def grayscale(img):
     import cv2
     return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+# region generators
+# Each generator turns an RGB image into a uint8 focus image, bright where the image has detail,
+# the same kind of image a user supplied focus map is. It becomes a heuristic through linear or exponential.
+
+def _gray(img):
+    import cv2
+    return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+
+
+def _normalize(h):
+    """
+    Scales the map to 0-255, the brightest percent of the pixels saturates,
+    so that a few strong edges don't darken the rest of the map.
+    """
+    top = np.percentile(h, 99)
+    if top <= 0:
+        return np.zeros(h.shape, dtype=np.uint8)
+    return np.clip(h * (255.0 / top), 0, 255).astype(np.uint8)
+
+
+def gradient(img, sigma=2.0):
+    """
+    Magnitude of the Sobel gradient, blurred so that the focus spreads around the edges.
+    """
+    import cv2
+    gray = _gray(img).astype(np.float32)
+    magnitude = cv2.magnitude(cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3), cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3))
+    return _normalize(cv2.GaussianBlur(magnitude, (0, 0), sigma))
+
+
+def edge_density(img, scales=(1, 2, 4)):
+    """
+    Share of Canny edge pixels around every pixel, summed over several blur scales,
+    so that both fine texture and large contours count. The window grows with the scale.
+    """
+    import cv2
+    gray = _gray(img)
+    density = np.zeros(gray.shape, dtype=np.float32)
+    for scale in scales:
+        edges = cv2.Canny(cv2.GaussianBlur(gray, (0, 0), scale), 50, 150).astype(np.float32) / 255
+        window = 8 * scale + 1
+        density += cv2.boxFilter(edges, -1, (window, window))
+    return _normalize(density)
+
+
+def local_variance(img, size=7):
+    """
+    Standard deviation of the gray levels in a size x size window, E[x^2] - E[x]^2 from two box filters.
+    """
+    import cv2
+    gray = _gray(img).astype(np.float32)
+    mean = cv2.boxFilter(gray, -1, (size, size))
+    mean_sq = cv2.boxFilter(gray * gray, -1, (size, size))
+    return _normalize(np.sqrt(np.maximum(mean_sq - mean * mean, 0)))
+
+
+GENERATORS = {
+    'gradient': gradient,
+    'edges': edge_density,
+    'variance': local_variance,
+}
+
+
+def generate(img, name, cache_dir=None):
+    """
+    Runs the generator, or reads its result from the cache.
+    :param img: RGB image
+    :param name: key of the generator in GENERATORS
+    :param cache_dir: directory of the cached maps, keyed by the generator and the image content, None doesn't cache
+    :return: uint8 focus image
+    """
+    generator = GENERATORS[name]
+    if cache_dir is None:
+        return generator(img)
+
+    img = np.ascontiguousarray(img)
+    digest = hashlib.sha1('%s %d %s %s' % (name, CACHE_VERSION, img.shape, img.dtype))
+    digest.update(img.data)
+    uri = os.path.join(cache_dir, digest.hexdigest() + '.npy')
+    if os.path.exists(uri):
+        return np.load(uri)
+
+    focus = generator(img)
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            pass  # created by another process in the meantime
+    # written next to its destination and renamed, so that concurrent jobs never read half a map
+    fd, tmp = tempfile.mkstemp(suffix='.npy', dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, focus)
+    try:
+        os.rename(tmp, uri)
+    except OSError:
+        os.remove(tmp)  # windows doesn't replace files, another job saved the same map
+    return focus
+# endregion
@@ -0,0 +1,99 @@
+__author__ = 'zieghailo'
+
+"""
+Initial placement of the points. Uniform random points spend the first thousands of iterations
+wandering towards the detail of the image, these place them there from the start.
+Every initializer takes the image, the heuristic and the number of points, and returns their positions;
+the heuristic is the density the points follow, so with a uniform heuristic they are all uniform.
+    random      uniform, like Mesh._randomize
+    importance  every point lands on a pixel drawn with probability proportional to the heuristic
+    poisson     importance samples thinned out to a Poisson disk set, the disk radius shrinks
+                where the heuristic is high, so the points don't clump together
+    corners     half of the points on the strongest corners of the image, the rest importance sampled
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from pointset import PointSet
+
+
+def random(img, focus, k):
+    h, w = img.shape[:2]
+    return np.random.rand(k, 2) * [w, h]
+
+
+def importance(img, focus, k):
+    h, w = focus.shape
+    weights = focus.ravel().astype(np.float64)
+    pixels = np.random.choice(len(weights), size=k, p=weights / weights.sum())
+    # anywhere inside the drawn pixel, the pixel centers are at whole coordinates
+    positions = np.column_stack((pixels % w, pixels // w)) + np.random.rand(k, 2) - 0.5
+    return np.clip(positions, [0, 0], [w, h])
+
+
+def poisson_disk(img, focus, k, candidates=10, spread=0.6):
+    """
+    :param candidates: importance samples drawn per point
+    :param spread: disk radius relative to the spacing of k points following the heuristic
+    """
+    samples = importance(img, focus, candidates * k)
+    h, w = focus.shape
+    x, y = np.clip(np.round(samples).astype(int), 0, [w - 1, h - 1]).T
+    # the spacing of k points whose density follows the heuristic, at every sample,
+    # in floats since k times the focus overflows the uint16 heuristic
+    radii = spread / np.sqrt(k * focus[y, x].astype(np.float64) / float(focus.sum()))
+
+    # the samples come in random order, each one that isn't covered by a disk yet gets one,
+    # two samples are too close if each of them lies in the disk of the other
+    tree = cKDTree(samples)
+    free = np.ones(len(samples), dtype=bool)
+    chosen = []
+    for i in range(len(samples)):
+        if not free[i]:
+            continue
+        chosen.append(i)
+        if len(chosen) == k:
+            break
+        near = np.array(tree.query_ball_point(samples[i], radii[i]))
+        distances = np.sqrt(np.sum((samples[near] - samples[i]) ** 2, axis=1))
+        free[near[distances < radii[near]]] = False
+
+    # too few disks fit, the rest of the points are plain importance samples
+    if len(chosen) < k:
+        rest = np.flatnonzero(~np.in1d(np.arange(len(samples)), chosen))
+        chosen.extend(rest[:k - len(chosen)])
+    return samples[chosen]
+
+
+def corners(img, focus, k, share=0.5):
+    """
+    :param share: part of the points placed on corners, fewer if the image doesn't have that many
+    """
+    import cv2
+    h, w = focus.shape
+    spacing = np.sqrt(w * h / float(max(k, 1)))
+    found = cv2.goodFeaturesToTrack(cv2.cvtColor(img, cv2.COLOR_RGB2GRAY), int(k * share), 0.01, 0.5 * spacing)
+    found = np.zeros([0, 2]) if found is None else found.reshape(-1, 2).astype(np.float64)
+    return np.vstack((found, importance(img, focus, k - len(found))))
+
+
+INITIALIZERS = {
+    'random': random,
+    'importance': importance,
+    'poisson': poisson_disk,
+    'corners': corners,
+}
+
+
+def initial_points(name, img, focus, n):
+    """
+    :param name: key of the initializer in INITIALIZERS
+    :param n: number of points, including the four fixed corners of the image
+    :return: PointSet for Mesh
+    """
+    h, w = img.shape[:2]
+    points = PointSet(w, h, capacity=n)
+    points.add([[0, 0], [w, 0], [0, h], [w, h]], fixed=True)
+    points.add(INITIALIZERS[name](img, focus, n - 4))
+    return points
@@ -1,12 +1,12 @@
 __author__ = 'zieghailo'
 
 import numpy as np
-from heapq import nsmallest, nlargest
 
 from triangulation import *
-from point import Point as BasePoint
-from SApoint import SApoint as Point
+from delaunay import IncrementalDelaunay
+from pointset import PointSet
 from trimath import rand_point_in_triangle
+from support import metrics
 
 
 
@@ -24,107 +24,103 @@ except AttributeError:
 
 class Mesh(object):
 
-    def __init__(self, img, n, parallel=True):
+    def __init__(self, img, n, parallel=True, pool=None, incremental=False, points=None, context=None,
+                 random_state=None):
+        """
+        :param points: PointSet the mesh is built on, if None n random points are created
+        :param context: trimath.RasterContext of the image, the triangles are evaluated against it
+        when they're not colorized in the pool
+        :param random_state: np.random.RandomState the moves are drawn from, if None the global numpy one
+        """
         self.N = n
         self._img = img
-        BasePoint.set_borders(img.shape[1], img.shape[0]) # for some reason shape gives us y, then x
+        self._context = context
+        self._random = random_state if random_state is not None else np.random
 
-        self._points = []
+        self._points = points
 
         self._triangulation = None
-        self._randomize()
+        self._proposal = None
+        self._pool = pool
+        if points is None:
+            self._randomize()
 
-    def _randomize(self):
-        self._points = []
-        h, w = self.image.shape[:2]
+        # updated in place as the points move, instead of triangulating from scratch
+        self._delaunay = IncrementalDelaunay(self.positions) if incremental else None
 
-        self.points.append(Point(0, 0, is_fixed=True))
-        self.points.append(Point(w, 0, is_fixed=True))
-        self.points.append(Point(0, h, is_fixed=True))
-        self.points.append(Point(w, h, is_fixed=True))
+    def _randomize(self):
+        h, w = self.image.shape[:2]  # for some reason shape gives us y, then x
+        self._points = PointSet(w, h, capacity=self.N)
 
-        for i in range(self.N - 4):
-            self.points.append(Point())
+        self.points.add([[0, 0], [w, 0], [0, h], [w, h]], fixed=True)
+        self.points.add_random(self.N - 4)
 
     # region properties
     @property
     def image(self):
         return self._img
 
+    @property
+    def context(self):
+        return self._context
+
     @property
     def points(self):
         return self._points
 
+    @property
+    def positions(self):
+        return self.points.positions
+
     #endregion
 
-    def remove_point(self, point):
-        if not point._fixed:
-            self.points.remove(point)
+    def remove_points(self, indices):
+        """
+        Removes the points at the given indices, fixed points are skipped.
+        """
+        removed = self.points.remove(indices)
+        if self._delaunay is not None:
+            self._delaunay.remove_many(removed)
 
     def split_triangle(self, triangle):
         """
         Creates a point inside the triangle, thereby splitting it.
-        :param triangle: 3x2 numpy array, each collumn is a
-        :return: the created point
-        """
-        [x, y] = rand_point_in_triangle(triangle)
-
-        point = Point(x, y)
-        self.points.append(point)
-        return point
-
-    def assign_neighbors(self):
-
-        for verts in self._triangulation.simplices:
-            points = [self.points[x] for x in verts]
-            for p in points:
-                p.neighbors.update(set(points))
-
-    def calc_triangulation_errors(self, triangulation):
-        for point in self.points:
-            error = 0
-
-            for tri_ind, simplices in enumerate(triangulation.simplices):
-                included = True
-                for vert in simplices:
-                    if vert not in point.neighbors:
-                        included = False
-                        break
-                if included:
-                    error += self.nptriangle2result(self.points2nptriangle(simplices))[1]
-
-    @staticmethod
-    def sort_by_neighbors(points):
-        """
-        In order to assign the triangles to the right neighborhoods in linear time,
-        we need to follow through each points neighbors, and create a list of lists
-        pointing back.
-        :param points: list of points from the mesh
-        :return: list of points pointing to this point
-        """
-        # nb_list = [set()] * len(points)  # the neighbor list to be returned
-        nb_list = [set() for _ in enumerate(points)]
-        for i, p in enumerate(points):
-            for n in p.neighbors:
-                nb_list[n].add(i)
-        return nb_list
+        :param triangle: 2x3 numpy array, each column is a vertex
+        :return: the index of the created point
+        """
+        return self.split_triangles(np.asarray(triangle)[np.newaxis])[0]
+
+    def split_triangles(self, triangles, positions=None):
+        """
+        Creates a point inside each triangle, all of them added at once.
+        :param triangles: Nx2x3 numpy array of triangle coordinates
+        :param positions: Nx2 positions of the new points, random points of the triangles if None
+        :return: indices of the created points
+        """
+        if positions is None:
+            positions = [rand_point_in_triangle(tr) for tr in triangles]
+
+        indices = self.points.add(np.reshape(positions, [-1, 2]))
+        if self._delaunay is not None:
+            for x, y in self.positions[indices]:
+                self._delaunay.insert(x, y)
+        return indices
 
     @profile
-    def evolve(self, temp, absolute_error=False, parallel=True):
+    def evolve(self, temp, absolute_error=False, parallel=True, engine='exact'):
         """
         Moves the points around randomly, keeping the changes that reduce errors,
         and reverting those that don't. Each evolve cycle the whole image is retruangulated
         and repainted twice.
         :param temp: The temperature of the simulated annealing, representing max pixel jump.
         :param parallel: Bool specifying if the colorization should be parallel.
+        The colorization uses the pool the mesh was created with, if any.
+        :param engine: name of the error engine used for colorization, see triangulation.ENGINES.
         """
         # create a control triangulation, calculate the colors and the errors
-        old_triangulation = Triangulation(self.points)
+        old_triangulation = Triangulation(self.positions, self._delaunay, self._proposal)
         self._triangulation = old_triangulation
-        old_triangulation.colorize_stack(absolute_error, parallel)
-
-        # assign neighbors to each point
-        old_triangulation.assign_neighbors(self.points)
+        old_triangulation.colorize_stack(absolute_error, parallel, self._pool, engine, self._context)
 
         # calculate the error of the triangulation, used for plotting purposes only
         self._error = old_triangulation.calculate_global_error()
@@ -132,64 +128,196 @@ class Mesh(object):
         # self._color_triangles_with_verts(self.points[100].neighbors)
 
         # move the points around, distance depending on the annealing temperature
-        for point in self.points:
-            point.shift(temp)
+        self.points.shift(temp)
 
         # calculate the new triangulation, colors and errors
-        new_triangulation = Triangulation(self.points)
-        new_triangulation.colorize_stack(absolute_error, parallel)
+        if self._delaunay is not None:
+            self._delaunay.move_points(self.positions)
+        new_triangulation = Triangulation(self.positions, self._delaunay, old_triangulation)
+        self._proposal = new_triangulation
+        new_triangulation.colorize_stack(absolute_error, parallel, self._pool, engine, self._context)
+
+        with metrics.timer('neighbors'):
+            # the neighbors of each point, before and after the shift
+            neighborhood = Triangulation.neighborhood([old_triangulation, new_triangulation], len(self.points))
 
-        # add the new neighbors to the old ones
-        new_triangulation.assign_neighbors(self.points)
+            old_errors = old_triangulation.neighborhood_errors(neighborhood)
+            new_errors = new_triangulation.neighborhood_errors(neighborhood)
 
-        # list of lists, each element i consists of points who have the neighbor point[i]
-        nb_list = self.sort_by_neighbors(self.points)
+        with metrics.timer('accept'):
+            self.points.accept(old_errors >= new_errors)
 
-        old_errors = old_triangulation.neighborhood_errors(self.points, nb_list)
-        new_errors = new_triangulation.neighborhood_errors(self.points, nb_list)
+            # move the rejected points back
+            if self._delaunay is not None:
+                self._delaunay.move_points(self.positions)
 
-        for i, p in enumerate(self.points):
-            p.neighbors = set()
-            if old_errors[i] >= new_errors[i]:
-                p.accept()
-            else:
-                p.reset()
+    def retriangulate(self, absolute_error=False, parallel=True, engine='exact'):
+        """
+        Triangulates and colorizes the current positions of the points,
+        needed when the points were moved without going through evolve.
+        :return: the new triangulation
+        """
+        if self._delaunay is not None:
+            self._delaunay.move_points(self.positions)
+        triangulation = Triangulation(self.positions, self._delaunay, self._triangulation)
+        self._triangulation = triangulation
+        triangulation.colorize_stack(absolute_error, parallel, self._pool, engine, self._context)
+        self._error = triangulation.calculate_global_error()
+        return triangulation
 
     @profile
-    def slow_purge(self, n=10):
+    def evolve_local(self, temp, metropolis=0.0, absolute_error=False, parallel=True, engine='exact', bounds=None):
         """
-        Purges the n worst points and triangles in the triangulation.
-        :param n: Number of points/triangles to be purged
+        Moves an independent set of points, no two of which share a triangle, so that every move
+        only changes the star of its own point. Only the triangles of the moved stars are repainted,
+        and each move is kept or reverted on its own, using the Metropolis criterion.
+        Moves that would fold a triangle of the star over are rejected without being painted.
+        :param temp: The temperature of the simulated annealing, representing max pixel jump.
+        :param metropolis: The energy temperature, relative to the mean star error of the moved points.
+        A move that increases the error by d is kept with probability exp(-d / energy temperature),
+        so with 0 only the moves that don't increase the error are kept.
+        :param parallel: Bool specifying if the colorization should be parallel.
+        :param engine: name of the error engine used for colorization, see triangulation.ENGINES.
+        :param bounds: (x0, y0, x1, y1) rectangle the moved points are kept inside, None for the whole image.
         """
-        point_errors = self._triangulation.calculate_point_errors(self.points)
-        npoint_indices = nsmallest(n, enumerate(point_errors[4:]), lambda x: x[1])
-        npoint_indices = [x[0] for x in npoint_indices]
-        # we cannot just go through the list and delete points, as it will mess with the remaining points
-        for pi in sorted(npoint_indices, reverse=True):
-            self.remove_point(self.points[pi + 4])  # 4 is used to jump over the first fixed points
+        triangulation = self.retriangulate(absolute_error, parallel, engine)
+
+        with metrics.timer('neighbors'):
+            n = len(self.points)
+            chosen = self._independent_points(triangulation.adjacency(n))
+            k = len(chosen)
+            self.points.shift(temp, chosen, self._random)
+            self._keep_on_border(chosen)
+            if bounds is not None:
+                x0, y0, x1, y1 = bounds
+                self.positions[chosen] = np.clip(self.positions[chosen], [x0, y0], [x1, y1])
+
+            # the triangles in the star of each chosen point, and which corner the point is
+            stars = triangulation.incidence(n).T.tocsr()[chosen]
+            owner = np.repeat(np.arange(k), np.diff(stars.indptr))
+            tris = stars.indices
+            corner = np.argmax(triangulation.delaunay.simplices[tris] == chosen[owner][:, np.newaxis], axis=1)
+
+            old_triangles = triangulation.triangles[tris]
+            new_triangles = old_triangles.copy()
+            new_triangles[np.arange(len(tris)), :, corner] = self.positions[chosen[owner]]
+
+            # a triangle that changes its orientation has folded over its neighbors
+            old_area, new_area = _signed_areas(old_triangles), _signed_areas(new_triangles)
+            folded = (np.sign(old_area) != np.sign(new_area)) | (new_area == 0)
+            folded = np.bincount(owner[folded], minlength=k) > 0
+
+        proper = ~folded[owner]
+        colors, errors = triangles2results(new_triangles[proper], absolute_error, parallel, self._pool, engine,
+                                           self._context)
+
+        with metrics.timer('accept'):
+            old_errors = np.bincount(owner, weights=triangulation.calculate_triangle_errors()[tris], minlength=k)
+            new_errors = np.bincount(owner[proper], weights=errors, minlength=k)
+            delta = new_errors - old_errors
+
+            accept = delta <= 0
+            if metropolis > 0 and k > 0:
+                energy = metropolis * max(np.mean(old_errors), np.finfo(float).tiny)
+                accept |= self._random.rand(k) < np.exp(-np.maximum(delta, 0) / energy)
+            accept &= ~folded
+
+            self.points.accept(accept, chosen)
+            if self._delaunay is not None:
+                self._delaunay.move_points(self.positions)
+
+    def _independent_points(self, adjacency):
+        """
+        Picks movable points, no two of which are connected by an edge, so that their stars don't share triangles.
+        Every point gets a random priority, and is picked if it beats all of its neighbors.
+        :param adjacency: sparse matrix of the edges, see Triangulation.adjacency
+        :return: indices of the picked points
+        """
+        n = adjacency.shape[0]
+        priority = self._random.rand(n)
+        priority[self.points.fixed] = np.inf
 
-        triangle_errors = self._triangulation.calculate_triangle_errors()
-        ntriangle_indices = nlargest(n, enumerate(triangle_errors), lambda x: x[1])
-        for ti in ntriangle_indices:
-            self.split_triangle(self._triangulation._triangles[ti[0]])
+        indptr, indices = adjacency.indptr, adjacency.indices
+        nonempty = np.diff(indptr) > 0
+        neighbor_priority = np.full(n, np.inf)
+        neighbor_priority[nonempty] = np.minimum.reduceat(priority[indices], indptr[:-1][nonempty])
+        return np.flatnonzero(priority < neighbor_priority)
+
+    def _keep_on_border(self, indices):
+        """
+        Points that lie on the border may only slide along it, so that the mesh keeps covering the image.
+        """
+        old = self.points.old_positions[indices]
+        new = self.positions[indices]
+        maxes = [self.points.maxx, self.points.maxy]
+        for axis in range(2):
+            border = (old[:, axis] == 0) | (old[:, axis] == maxes[axis])
+            new[border, axis] = old[border, axis]
+        self.positions[indices] = new
+
+    @profile
+    def slow_purge(self, n=10, worst_pixel=True):
+        """
+        Purges the n points with the smallest errors, and splits the n triangles with the largest errors
+        of the last triangulation. Both are picked by a partial sort of the error arrays,
+        and removed or inserted in one batch.
+        :param n: Number of points/triangles to be purged
+        :param worst_pixel: the new points go to the pixel their triangle's color fits worst,
+        instead of a random point of the triangle
+        """
+        triangulation = self._triangulation
+        triangle_errors = triangulation.calculate_triangle_errors()
+        # the points may have been purged since the triangulation was made
+        point_errors = triangulation.calculate_point_errors(self.points)[:len(self.points)]
+
+        movable = np.flatnonzero(self.points.movable[:len(point_errors)])
+        if len(movable) > n:
+            movable = movable[np.argpartition(point_errors[movable], n)[:n]]
+        worst = np.argpartition(-triangle_errors, n)[:n] if len(triangle_errors) > n \
+            else np.arange(len(triangle_errors))
+
+        triangles = triangulation.triangles[worst]
+        positions = None
+        if worst_pixel and self._context is not None:
+            positions = self._context.worst_pixels(triangles, triangulation.colors[worst])
+            # a point on top of a vertex, or of another new point, doesn't split anything
+            misplaced = np.any(np.all(np.round(triangles) == positions[:, :, np.newaxis], axis=1), axis=1)
+            duplicate = np.ones(len(positions), dtype=bool)
+            duplicate[np.unique(positions, axis=0, return_index=True)[1]] = False
+            misplaced |= duplicate
+            for i in np.flatnonzero(misplaced):
+                positions[i] = rand_point_in_triangle(triangles[i])
+
+        self.remove_points(movable)
+        self.split_triangles(triangles, positions)
 
     def _color_triangles_with_verts(self, verts):
-        from support import lru_cache as cache
-        for tr in self._triangulation.delaunay.simplices:
+        for i, tr in enumerate(self._triangulation.delaunay.simplices):
             allin = True
             for v in tr:
                 if v not in verts:
                     allin = False
             if allin:
-                nptr = self._triangulation.points2nptriangle(tr)
-                res = cache.get(nptr)
-                cache.set(nptr, ((0, 0, 1), res[1]))
+                self._paint_triangle(i, (0, 0, 1))
 
     def _color_neighbors(self, pindex):
-        from support import lru_cache as cache
-        for tr in self._triangulation.delaunay.simplices:
+        for i, tr in enumerate(self._triangulation.delaunay.simplices):
             if pindex in tr:
-                nptr = self._triangulation.points2nptriangle(tr)
-                res = cache.get(nptr)
-                cache.set(nptr, ((1, 0, 0), res[1]))
+                self._paint_triangle(i, (1, 0, 0))
 
+    def _paint_triangle(self, index, color):
+        """
+        Colors a triangle flat, with zero slopes for the planes of the gradient engine.
+        """
+        colors = self._triangulation._colors
+        colors[index] = 0
+        colors[index, :3] = color
+
+
+def _signed_areas(triangles):
+    """
+    :param triangles: Nx2x3 numpy array of triangle coordinates
+    :return: twice the signed area of each triangle, positive for counterclockwise triangles
+    """
+    x, y = triangles[:, 0, :], triangles[:, 1, :]
+    return (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
@@ -0,0 +1,156 @@
+__author__ = 'zieghailo'
+
+import numpy as np
+
+
+class PointSet(object):
+    """
+    The points of the mesh, stored as contiguous arrays instead of one object per point.
+    Each point has a current and an old position, the old position is where the point
+    returns to if its last shift gets rejected. Fixed points never move.
+    """
+
+    def __init__(self, maxx, maxy, capacity=64):
+        self.maxx = maxx
+        self.maxy = maxy
+
+        self._n = 0
+        self._positions = np.zeros([capacity, 2])
+        self._old_positions = np.zeros([capacity, 2])
+        self._fixed = np.zeros(capacity, dtype=bool)
+        self._errors = np.zeros(capacity)
+
+        self.accepted = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return self._n
+
+    # region properties
+    @property
+    def positions(self):
+        return self._positions[:self._n]
+
+    @property
+    def old_positions(self):
+        return self._old_positions[:self._n]
+
+    @property
+    def fixed(self):
+        return self._fixed[:self._n]
+
+    @property
+    def movable(self):
+        return ~self.fixed
+
+    @property
+    def errors(self):
+        return self._errors[:self._n]
+
+    @property
+    def x(self):
+        return self.positions[:, 0]
+
+    @property
+    def y(self):
+        return self.positions[:, 1]
+    # endregion
+
+    def add(self, positions, fixed=False):
+        """
+        Appends points to the end of the set.
+        :param positions: kx2 numpy array of the new positions, clipped to the borders
+        :return: indices of the new points
+        """
+        positions = np.clip(np.reshape(positions, [-1, 2]), [0, 0], [self.maxx, self.maxy])
+        k = len(positions)
+        self._reserve(self._n + k)
+
+        new = slice(self._n, self._n + k)
+        self._positions[new] = positions
+        self._old_positions[new] = positions
+        self._fixed[new] = fixed
+        self._errors[new] = 0
+        self._n += k
+        return np.arange(new.start, new.stop)
+
+    def add_random(self, k):
+        return self.add(np.random.rand(k, 2) * [self.maxx, self.maxy])
+
+    def remove(self, indices):
+        """
+        Removes the points, and moves the remaining ones together, keeping their order.
+        Fixed points are never removed.
+        :return: indices of the removed points, in increasing order
+        """
+        mask = np.zeros(self._n, dtype=bool)
+        mask[indices] = True
+        mask &= self.movable
+        keep = ~mask
+        k = np.count_nonzero(keep)
+
+        for arr in (self._positions, self._old_positions, self._fixed, self._errors):
+            arr[:k] = arr[:self._n][keep]
+        self._n = k
+        return np.flatnonzero(mask)
+
+    def shift(self, pixtemp, indices=None, random_state=np.random):
+        """
+        Moves every movable point to a random position within pixtemp pixels around its old position.
+        :param indices: if given, only these points are moved
+        :param random_state: np.random.RandomState the moves are drawn from
+        """
+        if indices is None:
+            indices = np.flatnonzero(self.movable)
+        else:
+            indices = np.asarray(indices)[self.movable[indices]]
+        k = len(indices)
+        # uniform distribution inside the circle
+        radius = pixtemp * np.sqrt(random_state.rand(k))
+        angle = random_state.rand(k) * 2 * np.pi
+        moves = np.column_stack((radius * np.cos(angle), radius * np.sin(angle)))
+
+        self.positions[indices] = np.clip(self.old_positions[indices] + moves, [0, 0], [self.maxx, self.maxy])
+
+    def accept(self, mask=None, indices=None):
+        """
+        Keeps the new positions of the points in mask, and moves the rest back.
+        :param mask: boolean array, if None all the points are accepted
+        :param indices: if given, mask only covers these points, and the other points are left alone
+        """
+        if indices is None:
+            indices = np.arange(self._n)
+        indices = np.asarray(indices, dtype=np.intp)
+        if mask is None:
+            mask = np.ones(len(indices), dtype=bool)
+        mask = np.asarray(mask, dtype=bool)
+
+        kept, reverted = indices[mask], indices[~mask]
+        self.old_positions[kept] = self.positions[kept]
+        self.positions[reverted] = self.old_positions[reverted]
+
+        movable = self.movable[indices]
+        self.accepted += np.count_nonzero(mask & movable)
+        self.rejected += np.count_nonzero(~mask & movable)
+
+    def place(self, indices, positions):
+        """
+        Puts the points at the given positions, as if they were shifted there and accepted.
+        Used when the points were moved outside of the set, e.g. by a worker process.
+        """
+        positions = np.clip(np.reshape(positions, [-1, 2]), [0, 0], [self.maxx, self.maxy])
+        self.positions[indices] = positions
+        self.old_positions[indices] = positions
+
+    def reset(self):
+        self.accept(np.zeros(self._n, dtype=bool))
+
+    def _reserve(self, n):
+        if n <= len(self._positions):
+            return
+        capacity = max(n, 2 * len(self._positions))
+        for name in ('_positions', '_old_positions', '_fixed', '_errors'):
+            arr = getattr(self, name)
+            grown = np.zeros((capacity,) + arr.shape[1:], dtype=arr.dtype)
+            grown[:self._n] = arr[:self._n]
+            setattr(self, name, grown)
@@ -0,0 +1,87 @@
+__author__ = 'zieghailo'
+
+"""
+Coarse to fine annealing. While the temperature is high, the points jump many pixels at a time,
+and evaluating the triangles on the full image is wasted work. The anneal starts on a downsampled
+copy of the image and the heuristic, and moves to a finer level whenever the jumps, measured in the
+pixels of the current level, get shorter than the switch distance. The points are rescaled on every
+switch, and the finest level is the original image.
+"""
+
+import cv2
+import numpy as np
+
+from pointset import PointSet
+
+
+class Pyramid(object):
+
+    def __init__(self, img, focus, levels=1, switch=2.0):
+        """
+        :param img: the original image, level 0
+        :param focus: the heuristic of the original image
+        :param levels: number of levels, every level is half the size of the one before
+        :param switch: the anneal moves to a finer level when the temperature of the current level
+        falls below this many of its pixels
+        """
+        self.switch = switch
+        self._levels = [(img, focus)]
+        h, w = img.shape[:2]
+        for k in range(1, levels):
+            size = (max(1, int(round(w / 2.0 ** k))), max(1, int(round(h / 2.0 ** k))))
+            if size[0] < 8 or size[1] < 8:
+                break
+            # area interpolation averages the pixels, so the coarse errors follow the fine ones
+            self._levels.append((cv2.resize(img, size, interpolation=cv2.INTER_AREA),
+                                 cv2.resize(focus, size, interpolation=cv2.INTER_AREA)))
+
+    def __len__(self):
+        return len(self._levels)
+
+    def level(self, k):
+        """
+        :return: (image, heuristic) tuple of level k
+        """
+        return self._levels[k]
+
+    def scale(self, k):
+        """
+        :return: how many original pixels one pixel of level k covers
+        """
+        w, w_k = self._levels[0][0].shape[1], self._levels[k][0].shape[1]
+        h, h_k = self._levels[0][0].shape[0], self._levels[k][0].shape[0]
+        return 0.5 * (w / float(w_k) + h / float(h_k))
+
+    def level_for(self, pixtemp):
+        """
+        :param pixtemp: temperature in the pixels of the original image
+        :return: the coarsest level on which the temperature is still at least switch pixels
+        """
+        for k in reversed(range(1, len(self))):
+            if pixtemp / self.scale(k) >= self.switch:
+                return k
+        return 0
+
+    def level_of(self, maxx, maxy):
+        """
+        :return: the level of the given size
+        """
+        for k, (img, _) in enumerate(self._levels):
+            if img.shape[:2] == (maxy, maxx):
+                return k
+        raise ValueError("No level of the pyramid is %dx%d." % (maxx, maxy))
+
+    def rescale(self, points, k):
+        """
+        :param points: PointSet on some level of the pyramid
+        :return: new PointSet with the same points, on level k
+        """
+        h, w = self._levels[k][0].shape[:2]
+        # multiplied first, so that the corners land exactly on the corners of the level
+        size, old_size = np.array([w, h], dtype=float), np.array([points.maxx, points.maxy], dtype=float)
+
+        rescaled = PointSet(w, h, capacity=len(points))
+        rescaled.add(points.positions * size / old_size, fixed=points.fixed)
+        rescaled.old_positions[:] = np.clip(points.old_positions * size / old_size, [0, 0], [w, h])
+        rescaled.accepted, rescaled.rejected = points.accepted, points.rejected
+        return rescaled
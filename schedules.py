@@ -0,0 +1,195 @@
+__author__ = 'zieghailo'
+
+"""
+Annealing schedules. A schedule owns the pixel temperature, and decides when the anneal is over.
+After every iteration it gets the global error and the accepted and rejected move counters of the
+PointSet, cools down, and checks the stopping criteria:
+    temperature     the temperature fell below the minimum
+    iterations      the iteration budget is spent
+    time            the wall clock budget is spent
+    plateau         the error didn't improve for patience iterations, and there are no reheats left
+A plateau with reheats left heats the temperature back up instead of stopping.
+A plateau on a coarse level of the image pyramid ends the level instead, see enter_level.
+"""
+
+import time
+
+import numpy as np
+
+
+class Schedule(object):
+    """
+    Geometric cooling, the temperature is multiplied by the same factor every iteration.
+    """
+
+    def __init__(self, temperature, multiplier=0.9997, minimum=0.1, max_iterations=None, time_budget=None,
+                 patience=None, tolerance=1e-3, reheats=0, reheat_temperature=None, iteration=0):
+        """
+        :param temperature: starting temperature, in pixels
+        :param multiplier: cooling factor per iteration
+        :param minimum: the anneal stops below this temperature
+        :param max_iterations: iteration budget, None is unlimited
+        :param time_budget: wall clock budget in seconds, counted from the creation of the schedule
+        :param patience: iterations without an improvement that make a plateau, None never stops on a plateau
+        :param tolerance: relative decrease of the error that counts as an improvement
+        :param reheats: plateaus that heat the temperature up instead of stopping
+        :param reheat_temperature: temperature of a reheat, half the starting temperature if None
+        :param iteration: the iteration to start counting from, when resuming
+        """
+        self.temperature = temperature
+        self.multiplier = multiplier
+        self.minimum = minimum
+        self.max_iterations = max_iterations
+        self.time_budget = time_budget
+        self.patience = patience
+        self.tolerance = tolerance
+        self.reheats = reheats
+        self.reheat_temperature = reheat_temperature if reheat_temperature is not None else 0.5 * temperature
+
+        self.iteration = iteration
+        self.stop_reason = None
+        self._start = time.time()
+        self._counters = None
+        self.coarse = False
+        self.level_done = False
+        self.reset_best()
+
+    @property
+    def done(self):
+        """
+        Checked before every iteration, sets stop_reason.
+        """
+        if self.stop_reason is None:
+            if self.temperature < self.minimum:
+                self.stop_reason = 'temperature'
+            elif self.max_iterations is not None and self.iteration >= self.max_iterations:
+                self.stop_reason = 'iterations'
+            elif self.time_budget is not None and time.time() - self._start >= self.time_budget:
+                self.stop_reason = 'time'
+        return self.stop_reason is not None
+
+    def reset_best(self):
+        """
+        Forgets the best error, needed when the errors stop being comparable, e.g. on a new pyramid level.
+        """
+        self.best_error = np.inf
+        self._improved = self.iteration
+
+    def enter_level(self, coarse):
+        """
+        Called when the anneal starts on a level of the image pyramid.
+        :param coarse: if it isn't the finest level, a plateau then sets level_done instead of
+                       reheating or stopping, and the anneal moves on to the next level
+        """
+        self.coarse = coarse
+        self.level_done = False
+        self.reset_best()
+
+    def update(self, error, accepted=0, rejected=0):
+        """
+        Called after every iteration.
+        :param error: global error of the mesh
+        :param accepted: accepted moves so far, PointSet.accepted
+        :param rejected: rejected moves so far, PointSet.rejected
+        :return: the temperature of the next iteration
+        """
+        self.iteration += 1
+
+        # the counters only ever grow, the ratio is taken over the moves of the last iteration
+        previous = self._counters if self._counters is not None else (accepted, rejected)
+        self._counters = (accepted, rejected)
+        moves = (accepted - previous[0]) + (rejected - previous[1])
+        ratio = (accepted - previous[0]) / float(moves) if moves > 0 else None
+
+        self.temperature = self._cool(ratio)
+
+        if error < self.best_error * (1 - self.tolerance):
+            self.best_error = error
+            self._improved = self.iteration
+        elif self.patience is not None and self.iteration - self._improved >= self.patience:
+            if self.coarse:
+                self.level_done = True
+            elif self.reheats > 0:
+                self.reheats -= 1
+                self.temperature = max(self.temperature, self.reheat_temperature)
+                self.reset_best()
+            else:
+                self.stop_reason = 'plateau'
+        return self.temperature
+
+    def _cool(self, ratio):
+        """
+        :param ratio: share of the moves of the last iteration that were accepted, None if nothing moved
+        :return: the next temperature
+        """
+        return self.temperature * self.multiplier
+
+    def state(self):
+        """
+        :return: dict of everything that changes during the anneal, for the checkpoints
+        """
+        return {
+            'temperature': float(self.temperature),
+            'iteration': int(self.iteration),
+            'reheats': int(self.reheats),
+            'best_error': float(self.best_error) if np.isfinite(self.best_error) else None,
+            'improved': int(self._improved),
+            'elapsed': time.time() - self._start,
+            'counters': [int(c) for c in self._counters] if self._counters is not None else None,
+            'coarse': bool(self.coarse),
+            'level_done': bool(self.level_done),
+        }
+
+    def load_state(self, state):
+        """
+        Continues from a state returned by state, the time budget counts the time spent before it as well.
+        """
+        self.temperature = state['temperature']
+        self.iteration = state['iteration']
+        self.reheats = state['reheats']
+        self.best_error = state['best_error'] if state['best_error'] is not None else np.inf
+        self._improved = state['improved']
+        self._start = time.time() - state['elapsed']
+        self._counters = tuple(state['counters']) if state['counters'] is not None else None
+        self.coarse = state['coarse']
+        self.level_done = state['level_done']
+
+
+class AdaptiveSchedule(Schedule):
+    """
+    Cools faster while most moves get accepted, and slower when few of them do.
+    The temperature is the length of the moves, so lots of accepted moves mean it can shrink,
+    and few accepted moves mean the points are still looking for better positions.
+    """
+
+    def __init__(self, temperature, multiplier=0.9997, target=0.3, smoothing=0.9, **kwargs):
+        """
+        :param target: acceptance ratio at which it cools like the geometric schedule
+        :param smoothing: weight of the history in the running acceptance ratio
+        Takes the rest of the parameters of Schedule.
+        """
+        super(AdaptiveSchedule, self).__init__(temperature, multiplier, **kwargs)
+        self.target = target
+        self.smoothing = smoothing
+        self.acceptance = target
+
+    def _cool(self, ratio):
+        if ratio is not None:
+            self.acceptance = self.smoothing * self.acceptance + (1 - self.smoothing) * ratio
+        # between half and twice the cooling of the geometric schedule
+        return self.temperature * self.multiplier ** np.clip(self.acceptance / self.target, 0.5, 2.0)
+
+    def state(self):
+        state = super(AdaptiveSchedule, self).state()
+        state['acceptance'] = float(self.acceptance)
+        return state
+
+    def load_state(self, state):
+        super(AdaptiveSchedule, self).load_state(state)
+        self.acceptance = state['acceptance']
+
+
+SCHEDULES = {
+    'geometric': Schedule,
+    'adaptive': AdaptiveSchedule,
+}
@@ -5,15 +5,55 @@ from argparse import Namespace
 C = Namespace()
 # C.IMAGE_URI              = 'images/sonja.jpg'
 # C.FOCUS_MAP              = 'images/sonja.jpg'
+C.FOCUS_GENERATOR        = None  # 'gradient', 'edges' or 'variance' focus map, made when there is no FOCUS_MAP
+C.FOCUS_CACHE            = None  # directory the generated focus maps are cached in
+C.MMAP_CACHE             = None  # directory the decoded images are cached in and memory mapped from, see support.rawcache
 C.STARTING_POINTS        = 500
+C.INITIALIZER            = 'random'  # 'random', 'importance', 'poisson' or 'corners', see initializers
 C.TEMPERATURE            = 5
 C.TEMP_MULTIPLIER        = 0.9997
+C.MIN_TEMPERATURE        = 0.1  # the anneal stops below this temperature
+C.MAX_ITERATIONS         = 10 ** 6
+C.TIME_BUDGET            = None  # seconds, the anneal stops when they run out
+C.SCHEDULE               = 'geometric'  # 'geometric' cools by TEMP_MULTIPLIER, 'adaptive' by the acceptance ratio
+C.TARGET_ACCEPTANCE      = 0.3  # adaptive schedule, cools faster above this ratio of accepted moves
+C.PLATEAU_PATIENCE       = None  # iterations without an improvement of the error before the anneal stops
+C.PLATEAU_TOLERANCE      = 1e-3  # relative decrease of the error that counts as an improvement
+C.REHEATS                = 0  # plateaus that reheat to REHEAT_FRACTION of TEMPERATURE instead of stopping
+C.REHEAT_FRACTION        = 0.5
+C.SEED                   = None  # seed of the random generator, None seeds it from the OS
 C.PURGE_MULTIPLIER       = 0.9  # 1 = 100%
+C.PURGE_POINTS           = 10  # points removed, and triangles split, by a purge
+C.PURGE_WORST_PIXEL      = True  # split at the pixel the triangle color fits worst, instead of a random point
 C.PARALLEL               = True
+C.BACKEND                = 'process'  # 'process' workers get the image in shared memory, 'thread' workers share it
+C.INCREMENTAL_DELAUNAY   = False
 C.PRINT                  = True
 C.PRINT_COUNTER          = 10
 C.PRINT_CONSOLE          = True
 C.PRINT_ERROR_COUNTER    = 1
 C.TRIANGLE_ALPHA         = 0.6
 C.ABSOLUTE_ERROR         = True
+C.CACHE_CAPACITY         = 65536
+C.CACHE_QUANTUM          = 1.0  # pixels, the error engines round the vertices to whole pixels
+C.ERROR_ENGINE           = 'exact'  # 'exact', 'squared', 'prefix', or 'gradient' shading, see triangulation.ENGINES
+C.ANNEAL_MODE            = 'global'  # 'global' moves every point, 'local' moves independent points one star at a time,
+                                     # 'tiled' runs the local moves on tiles of the image in the worker processes
+C.METROPOLIS_TEMPERATURE = 0.05  # local mode, relative to the mean star error, cools down with TEMPERATURE
+C.TILES                  = None  # (columns, rows) of the tiled mode, None picks about two tiles per worker
+C.TILE_STEPS             = 10  # local moves per tile, before the tiles are merged back into the mesh
+C.PYRAMID_LEVELS         = 1  # anneal on images downsampled by 2, 4, ... while the temperature is high, 1 is off
+C.PYRAMID_SWITCH         = 2.0  # move to a finer level when the temperature falls below this many coarse pixels
 C.PLOT_ARROWS            = False
+C.HEADLESS               = False  # no plotting, only the results are written to OUTPUT
+C.OUTPUT                 = 'out.svg'  # .svg, .json, .bin buffers, or any image format cv2 can write
+C.OUTPUT_SCALE           = 1.0  # size of the rasterized output, relative to the original image
+C.SAVE_BEST              = True  # also save the best mesh so far every PRINT_COUNTER iterations
+C.ASYNC_SAVE             = True  # save in a background thread, the anneal doesn't wait for the disk
+C.CHECKPOINT             = None  # path of the checkpoint file, None disables checkpoints
+C.CHECKPOINT_INTERVAL    = 300  # seconds between checkpoints
+C.CHECKPOINT_CACHE       = False  # also dump the whole triangle cache, for warmer resumes
+C.RESUME                 = None  # checkpoint to resume the anneal from
+C.METRICS                = None  # .jsonl or .csv file the per phase metrics are streamed to, None disables it
+C.METRICS_INTERVAL       = 10  # iterations between two metrics samples
+C.METRICS_PORT           = None  # port of a Prometheus endpoint serving the metrics, None disables it
@@ -1,10 +1,14 @@
 __author__ = 'zieghailo'
 
+import numpy
 from distutils.core import setup
+from distutils.extension import Extension
 from Cython.Build import cythonize
 
+# trimath.c is generated by cython, build the extension with
+#   python setup.py build_ext --inplace
 setup(
     name = "Stained Glass",
-    ext_modules = cythonize('trimath.pyx'),
-    requires=['numpy', 'xxhash']  # accepts a glob pattern
-)
\ No newline at end of file
+    ext_modules = cythonize([Extension('trimath', ['trimath.pyx'], include_dirs=[numpy.get_include()])]),
+    requires=['numpy']  # accepts a glob pattern
+)
@@ -3,9 +3,14 @@
 __author__ = 'zieghailo'
 
 from mesh import Mesh
+from initializers import initial_points
+from pyramid import Pyramid
+from schedules import SCHEDULES
+from tiling import TiledAnnealer
+from triangulation import CHANNELS
 import trimath
-from support import plotter
-from support.meshcollection import FlatMeshCollection, FlatMeshErrorCollection
+from support import checkpoint, exporter, metrics, rawcache, triangle_cache
+from support.workerpool import BACKENDS
 from support.profiler_fix import *
 import img2heur
 
@@ -14,56 +19,233 @@ import numpy as np
 import time
 
 
-@profile
-def main(C):
-    global mesh
+def load_images(image_uri, focus_uri=None, generator=None, cache_dir=None, mapped_dir=None):
+    """
+    :param generator: name of the img2heur generator the focus image is made with when there is no focus map
+    :param cache_dir: where the generated focus images are cached, see img2heur.generate
+    :param mapped_dir: where the decoded image and heuristic are cached, see support.rawcache,
+                       if given they are decoded once and memory mapped from then on
+    :return: (RGB image, heuristic) tuple, the heuristic is uniform if there is no focus map nor generator
+    """
+    if mapped_dir is not None:
+        img = rawcache.cached(rawcache.image_path(image_uri, mapped_dir), lambda: read_image(image_uri))
+        focus = rawcache.cached(rawcache.heuristic_path(img, focus_uri, generator),
+                                lambda: load_focus(img, focus_uri, generator, cache_dir))
+        return img, focus
+
+    img = read_image(image_uri)
+    return img, load_focus(img, focus_uri, generator, cache_dir)
+
 
-    img = cv2.imread(C.IMAGE_URI)
+def read_image(image_uri):
+    """
+    :return: the image as an RGB numpy array
+    """
+    img = cv2.imread(image_uri)
+    if img is None:
+        raise IOError("Could not read the image %s." % image_uri)
     cv2.cvtColor(img, cv2.COLOR_BGR2RGB, img)
     # img = np.flipud(img)
+    return img
 
-    if C.FOCUS_MAP is not None:
-        focus = cv2.imread(C.FOCUS_MAP)
+
+def load_focus(img, focus_uri=None, generator=None, cache_dir=None):
+    """
+    :return: the heuristic of the image, see load_images
+    """
+    if focus_uri is not None:
+        focus = cv2.imread(focus_uri)
         focus = img2heur.grayscale(focus)
         # focus = img2heur.linear(focus)
-        focus = img2heur.exponential(focus)
+        return img2heur.exponential(focus)
+    elif generator is not None:
+        return img2heur.exponential(img2heur.generate(img, generator, cache_dir))
+    return img2heur.default_focus_image(img)
+
+
+def prepare(C, img, focus):
+    """
+    Creates the context the triangles of the image are evaluated against,
+    and empties the triangle cache, needed before annealing a new image.
+    :return: trimath.RasterContext, with the prefix tables if the prefix engine is used
+    """
+    triangle_cache.configure(C.CACHE_CAPACITY, C.CACHE_QUANTUM, CHANNELS.get(C.ERROR_ENGINE, 3))
+
+    context = trimath.RasterContext(img, focus)
+    if C.ERROR_ENGINE == 'prefix':
+        # the tables of a mapped image are cached next to it, built a band of rows at a time
+        tables = rawcache.tables(img, focus) if rawcache.mapped_path(img) is not None else None
+        if tables is not None:
+            context.set_tables(tables)
+        context.build_tables()
+    return context
+
+
+def start_level(C, pyramid, level, points=None):
+    """
+    Sets up the anneal of one level of the image pyramid, with a fresh context, pool and triangle cache.
+    :param points: PointSet of the level, if None the points are placed by C.INITIALIZER
+    :return: (context, pool, mesh, annealer) tuple, annealer is None unless the anneal is tiled
+    """
+    img, focus = pyramid.level(level)
+    context = prepare(C, img, focus)
+
+    # the workers get the image and heuristic once, and live until the next level
+    pool = BACKENDS[C.BACKEND](context) if C.PARALLEL else None
+
+    if points is None:
+        points = initial_points(C.INITIALIZER, img, focus, C.STARTING_POINTS)
+    mesh = Mesh(img, len(points), parallel=C.PARALLEL, pool=pool, incremental=C.INCREMENTAL_DELAUNAY, points=points,
+                context=context)
+    annealer = TiledAnnealer(mesh, pool, tiles=C.TILES, steps=C.TILE_STEPS) if C.ANNEAL_MODE == 'tiled' else None
+    return context, pool, mesh, annealer
+
+
+def next_level(C, pyramid, level, schedule, mesh, pool):
+    """
+    Moves the anneal down the pyramid, once the temperature fits a finer level,
+    or the schedule reached a plateau on the current one.
+    :param pool: pool of the current level, closed when the level changes
+    :return: (level, context, pool, mesh, annealer) tuple of the new level, None if the anneal stays on the level
+    """
+    finer = min(pyramid.level_for(schedule.temperature), level - 1 if schedule.level_done else level)
+    if finer >= level:
+        return None
+    points = pyramid.rescale(mesh.points, finer)
+    if pool is not None:
+        pool.close()
+    context, pool, mesh, annealer = start_level(C, pyramid, finer, points)
+    schedule.enter_level(finer > 0)
+    return (finer, context, pool, mesh, annealer)
+
+
+def make_schedule(C, temperature=None, iteration=0):
+    """
+    :param temperature: starting temperature, C.TEMPERATURE if None
+    :param iteration: the iteration a resumed run starts at
+    :return: the schedule named by C.SCHEDULE
+    """
+    kwargs = dict(multiplier=C.TEMP_MULTIPLIER, minimum=C.MIN_TEMPERATURE, max_iterations=C.MAX_ITERATIONS,
+                  time_budget=C.TIME_BUDGET, patience=C.PLATEAU_PATIENCE, tolerance=C.PLATEAU_TOLERANCE,
+                  reheats=C.REHEATS, reheat_temperature=C.REHEAT_FRACTION * C.TEMPERATURE, iteration=iteration)
+    if C.SCHEDULE == 'adaptive':
+        kwargs['target'] = C.TARGET_ACCEPTANCE
+    return SCHEDULES[C.SCHEDULE](C.TEMPERATURE if temperature is None else temperature, **kwargs)
+
+
+@profile
+def anneal_step(C, mesh, annealer, pixtemp, scale=1.0):
+    """
+    Runs one iteration of the anneal, in the mode given by the settings.
+    :param annealer: TiledAnnealer of the mesh, only used in the tiled mode
+    :param pixtemp: temperature in the pixels of the original image
+    :param scale: original pixels per pixel of the mesh image, when annealing a level of a pyramid
+    """
+    # the energy temperature cools down together with the pixel temperature
+    metropolis = C.METROPOLIS_TEMPERATURE * pixtemp / C.TEMPERATURE
+    temp = pixtemp / scale
+    if C.ANNEAL_MODE == 'local':
+        mesh.evolve_local(temp, metropolis, absolute_error=C.ABSOLUTE_ERROR, parallel=C.PARALLEL,
+                          engine=C.ERROR_ENGINE)
+    elif C.ANNEAL_MODE == 'tiled':
+        annealer.anneal(temp, metropolis, absolute_error=C.ABSOLUTE_ERROR, engine=C.ERROR_ENGINE)
     else:
-        focus = img2heur.default_focus_image(img)
+        mesh.evolve(temp, absolute_error=C.ABSOLUTE_ERROR, parallel=C.PARALLEL, engine=C.ERROR_ENGINE)
+
+    # region purging points
+    # The chance to purge points.
+    # In the beginning when pixtemp is almost TEMPERATURE,
+    # the chance to purge is high. As the temperature gets lower,
+    # the chance to purge approaches zero.
+    # assert 0 <= C.PURGE_MULTIPLIER < 1
+    if np.random.rand() < pixtemp / C.TEMPERATURE * C.PURGE_MULTIPLIER:
+        with metrics.timer('purge'):
+            mesh.slow_purge(n=C.PURGE_POINTS, worst_pixel=C.PURGE_WORST_PIXEL)
+    # endregion
+
+
+def sample_metrics(sinks, cnt, elapsed, pixtemp, mesh):
+    """
+    Writes the state of the anneal and the metrics collected so far to every sink.
+    """
+    metrics.set('iteration', cnt)
+    metrics.set('elapsed', elapsed)
+    metrics.set('temperature', pixtemp)
+    metrics.set('error', float(mesh._error))
+    metrics.set('points', len(mesh.points))
+    metrics.total('accepted', mesh.points.accepted)
+    metrics.total('rejected', mesh.points.rejected)
+    snapshot = metrics.registry.snapshot()
+    for sink in sinks:
+        sink.write(snapshot)
+
 
-    trimath.set_image(img)
-    trimath.set_heuristic(focus)
+@profile
+def main(C):
+    global mesh
 
-    mesh = Mesh(img, C.STARTING_POINTS, parallel=C.PARALLEL)
+    np.random.seed(C.SEED)
+    img, focus = load_images(C.IMAGE_URI, C.FOCUS_MAP, C.FOCUS_GENERATOR, C.FOCUS_CACHE, C.MMAP_CACHE)
+    pyramid = Pyramid(img, focus, C.PYRAMID_LEVELS, C.PYRAMID_SWITCH)
 
-    plotter.start(plotErrors=C.PRINT_ERROR_COUNTER > 0)
-    plotter.plot_original(img, 1 - C.TRIANGLE_ALPHA)
+    # the cached errors can only be reused by a run that calculates them the same way
+    tag = '%s %s' % (C.ERROR_ENGINE, 'absolute' if C.ABSOLUTE_ERROR else 'relative')
+
+    if C.RESUME is not None:
+        points, pixtemp, min_error, first, entries, state = checkpoint.restore(C.RESUME, tag)
+        level = pyramid.level_of(points.maxx, points.maxy)
+    else:
+        points, entries, state = None, None, None
+        pixtemp = C.TEMPERATURE  # pixels radius of the original image
+        min_error = 10**16
+        first = 0
+        level = pyramid.level_for(pixtemp)
 
-    past = time.time()
+    context, pool, mesh, annealer = start_level(C, pyramid, level, points)
+    if entries is not None:
+        triangle_cache.cache.load(*entries)
 
-    pixtemp = C.TEMPERATURE  # pixels radius
-    min_error = 10**16
+    if not C.HEADLESS:
+        # imported here, so that the headless mode never loads matplotlib and Tk
+        from support import plotter
+        from support.meshcollection import FlatMeshCollection, FlatMeshErrorCollection
 
-    for cnt in range(10 ** 6):
-        if pixtemp < 0.1:  
-            break
+        plotter.start(plotErrors=C.PRINT_ERROR_COUNTER > 0)
+        plotter.plot_original(mesh.image, 1 - C.TRIANGLE_ALPHA)
 
-        mesh.evolve(pixtemp, absolute_error=C.ABSOLUTE_ERROR, parallel=C.PARALLEL)
+    saver = exporter.AsyncSaver() if C.ASYNC_SAVE else None
+    sinks = metrics.open_sinks(C.METRICS, C.METRICS_PORT)
+    start = past = time.time()
+    plot_time = 0  # seconds spent plotting and saving through matplotlib
 
-        # region purging points
-        # The chance to purge points.
-        # In the beginning when pixtemp is almost TEMPERATURE,
-        # the chance to purge is high. As the temperature gets lower,
-        # the chance to purge approaches zero.
-        # assert 0 <= C.PURGE_MULTIPLIER < 1
-        if np.random.rand() < pixtemp / C.TEMPERATURE * C.PURGE_MULTIPLIER:
-            mesh.slow_purge(n=10)
-        # endregion
+    last_checkpoint = time.time()
+    err_col = None
 
-        pixtemp *= C.TEMP_MULTIPLIER
-        # endregion
+    schedule = make_schedule(C, pixtemp, first)
+    schedule.enter_level(level > 0)
+    if state is not None:
+        schedule.load_state(state)
+    while not schedule.done:
+        cnt, pixtemp = schedule.iteration, schedule.temperature
+
+        switched = next_level(C, pyramid, level, schedule, mesh, pool)
+        if switched is not None:
+            level, context, pool, mesh, annealer = switched
+            # the errors of different levels aren't comparable
+            min_error = 10**16
+
+        anneal_step(C, mesh, annealer, pixtemp, pyramid.scale(level))
+        pixtemp = schedule.update(mesh._error, mesh.points.accepted, mesh.points.rejected)
+
+        if C.CHECKPOINT is not None and time.time() - last_checkpoint >= C.CHECKPOINT_INTERVAL:
+            checkpoint.save(C.CHECKPOINT, mesh, pixtemp, min_error, cnt + 1, tag, C.CHECKPOINT_CACHE, schedule)
+            last_checkpoint = time.time()
+
+        if sinks and cnt % C.METRICS_INTERVAL == 0:
+            sample_metrics(sinks, cnt, time.time() - start, pixtemp, mesh)
 
         # region print time
-        if C.PRINT_CONSOLE:
+        if C.PRINT_CONSOLE and not C.HEADLESS:
             # clear the screen
             import os
             os.system('cls' if os.name == 'nt' else 'clear')
@@ -71,29 +253,62 @@ def main(C):
             print("Temperature: "+str(pixtemp))
             now = time.time()
             print("Time elapsed: ", now - past)
+            print("Time plotting: ", plot_time)
             past = now
+        elif C.PRINT_CONSOLE and cnt % C.PRINT_COUNTER == 0:
+            # a single line, clearing the screen every iteration costs more than a whole evolve
+            print("%d temperature: %.4f level: %d error: %.1f points: %d elapsed: %.2f"
+                  % (cnt, pixtemp, level, mesh._error, len(mesh.points), time.time() - start))
         #endregion
 
-        if (C.PRINT_ERROR_COUNTER > 0 and cnt % C.PRINT_ERROR_COUNTER == 0): 
-            plotter.plot_global_errors(mesh._error)
-            plotter.plot_mesh_error_collection(err_col)
-            
-        if (cnt % C.PRINT_COUNTER == 0):
+        if C.SAVE_BEST and cnt % C.PRINT_COUNTER == 0 and mesh._error <= min_error:
+            min_error = mesh._error
+            # raster outputs of the coarse levels are scaled up to the size of the original image
+            size = (mesh.image.shape[1], mesh.image.shape[0])
+            scale = C.OUTPUT_SCALE * pyramid.scale(level)
+            if saver is not None:
+                saver.save(mesh._triangulation, C.OUTPUT, size, scale)
+            else:
+                exporter.save(mesh._triangulation, C.OUTPUT, size, scale)
+
+        if C.HEADLESS:
+            continue
+
+        with metrics.timer('plot'):
+            plot_start = time.time()
+            if (cnt % C.PRINT_COUNTER == 0):
+
+                plotter.plot_original(mesh.image, 1 - C.TRIANGLE_ALPHA)
+                col = FlatMeshCollection(mesh._triangulation, alpha=C.TRIANGLE_ALPHA)
+                err_col = FlatMeshErrorCollection(mesh._triangulation)
+                plotter.plot_mesh_collection(col)
+                # plotter.plot_error_hist(mesh.point_errors, mesh.triangle_errors)
+                if C.PLOT_ARROWS:
+                    plotter.plot_points(mesh)
+                    plotter.plot_arrow(mesh)
+
+            if (C.PRINT_ERROR_COUNTER > 0 and cnt % C.PRINT_ERROR_COUNTER == 0 and err_col is not None):
+                plotter.plot_global_errors(mesh._error)
+                plotter.plot_mesh_error_collection(err_col)
+            plot_time += time.time() - plot_start
+
+    if saver is not None:
+        saver.close()
+    for sink in sinks:
+        sink.close()
+    # the last evolve left the points where its triangulation doesn't cover them
+    mesh.retriangulate(absolute_error=C.ABSOLUTE_ERROR, parallel=C.PARALLEL, engine=C.ERROR_ENGINE)
+    size = (mesh.image.shape[1], mesh.image.shape[0])
+    exporter.save(mesh._triangulation, C.OUTPUT, size, C.OUTPUT_SCALE * pyramid.scale(level))
+    print("Finished in %.2fs after %d iterations (%s), error: %.1f, saved to %s"
+          % (time.time() - start, schedule.iteration, schedule.stop_reason, mesh._error, C.OUTPUT))
 
-            plotter.plot_original(img, 1 - C.TRIANGLE_ALPHA)
-            col = FlatMeshCollection(mesh._triangulation, alpha=C.TRIANGLE_ALPHA)
-            err_col = FlatMeshErrorCollection(mesh._triangulation)
-            plotter.plot_mesh_collection(col)
-            # plotter.plot_error_hist(mesh.point_errors, mesh.triangle_errors)
-            if C.PLOT_ARROWS:
-                plotter.plot_points(mesh)
-                plotter.plot_arrow(mesh)
-		
-	    if mesh._error <= min_error:
-		min_error = mesh._error
-       	        plotter.save_mesh("out.svg")
+    if pool is not None:
+        pool.close()
 
-    plotter.keep_plot_open()
+    if not C.HEADLESS:
+        print("Plotting took %.2fs of %.2fs" % (plot_time, time.time() - start))
+        plotter.keep_plot_open()
 
 
 def parse_arguments(default_settings):
@@ -103,16 +318,50 @@ def parse_arguments(default_settings):
                                                  'of a given image.')
     parser.add_argument('IMAGE_URI')
     parser.add_argument('FOCUS_MAP', nargs='?')
+    parser.add_argument('--focus',             choices=['gradient', 'edges', 'variance'], dest='FOCUS_GENERATOR')
+    parser.add_argument('--focus-cache',       type=str,   dest='FOCUS_CACHE')
+    parser.add_argument('--mmap-cache',        type=str,   dest='MMAP_CACHE')
     parser.add_argument('-t', '--temperature', type=float, dest='TEMPERATURE')
+    parser.add_argument('-i', '--iterations',  type=int,   dest='MAX_ITERATIONS')
+    parser.add_argument('--time-budget',       type=float, dest='TIME_BUDGET')
+    parser.add_argument('--schedule',          choices=['geometric', 'adaptive'], dest='SCHEDULE')
+    parser.add_argument('--target-acceptance', type=float, dest='TARGET_ACCEPTANCE')
+    parser.add_argument('--patience',          type=int,   dest='PLATEAU_PATIENCE')
+    parser.add_argument('--reheats',           type=int,   dest='REHEATS')
+    parser.add_argument('--seed',              type=int,   dest='SEED')
     parser.add_argument('-n', '--points',      type=int,   dest='STARTING_POINTS')
+    parser.add_argument('--init',              choices=['random', 'importance', 'poisson', 'corners'], dest='INITIALIZER')
     parser.add_argument('-m', '--multiplier',  type=float, dest='TEMP_MULTIPLIER')
     parser.add_argument('-c', '--console',     type=bool,  dest='PRINT_CONSOLE')
     parser.add_argument('-d', '--draw',        type=int,   dest='PRINT_COUNTER')
     parser.add_argument('-a', '--alpha',       type=float, dest='TRIANGLE_ALPHA')
     parser.add_argument('-p', '--purge',       type=float, dest='PURGE_MULTIPLIER')
+    parser.add_argument('--purge-points',      type=int,   dest='PURGE_POINTS')
+    parser.add_argument('--random-split',      action='store_false', dest='PURGE_WORST_PIXEL')
     parser.add_argument('-e', '--error-plot',  type=int,   dest='PRINT_ERROR_COUNTER')
     parser.add_argument('--relative-error',    action='store_false', dest='ABSOLUTE_ERROR')
     parser.add_argument('--plot-arrows',       action='store_true', dest='PLOT_ARROWS')
+    parser.add_argument('--incremental',       action='store_true', dest='INCREMENTAL_DELAUNAY')
+    parser.add_argument('--engine',            choices=['exact', 'squared', 'prefix', 'gradient'], dest='ERROR_ENGINE')
+    parser.add_argument('--backend',           choices=['process', 'thread'], dest='BACKEND')
+    parser.add_argument('--anneal',            choices=['global', 'local', 'tiled'], dest='ANNEAL_MODE')
+    parser.add_argument('--tiles',             type=int, nargs=2, dest='TILES')
+    parser.add_argument('--tile-steps',        type=int, dest='TILE_STEPS')
+    parser.add_argument('--metropolis',        type=float, dest='METROPOLIS_TEMPERATURE')
+    parser.add_argument('--pyramid',           type=int, dest='PYRAMID_LEVELS')
+    parser.add_argument('--pyramid-switch',    type=float, dest='PYRAMID_SWITCH')
+    parser.add_argument('--headless',          action='store_true', dest='HEADLESS')
+    parser.add_argument('-o', '--output',      type=str,   dest='OUTPUT')
+    parser.add_argument('--output-scale',      type=float, dest='OUTPUT_SCALE')
+    parser.add_argument('--final-only',        action='store_false', dest='SAVE_BEST')
+    parser.add_argument('--sync-save',         action='store_false', dest='ASYNC_SAVE')
+    parser.add_argument('--checkpoint',        type=str,   dest='CHECKPOINT')
+    parser.add_argument('--checkpoint-interval', type=float, dest='CHECKPOINT_INTERVAL')
+    parser.add_argument('--checkpoint-cache',  action='store_true', dest='CHECKPOINT_CACHE')
+    parser.add_argument('--resume',            type=str,   dest='RESUME')
+    parser.add_argument('--metrics',           type=str,   dest='METRICS')
+    parser.add_argument('--metrics-interval',  type=int,   dest='METRICS_INTERVAL')
+    parser.add_argument('--metrics-port',      type=int,   dest='METRICS_PORT')
 
     return parser.parse_args(namespace=default_settings)
 
@@ -0,0 +1,124 @@
+__author__ = 'zieghailo'
+
+"""
+Checkpoints of a running anneal, so that it can be resumed after the process dies.
+A checkpoint is a single npz file with the points, the state of the annealing schedule, the state of the
+random generator, and the cached results of the triangles in the current mesh, so that a resumed
+run doesn't colorize the whole mesh again. Optionally the whole triangle cache is dumped as well.
+The file is written next to its destination and renamed over it, so a crash while saving
+leaves the previous checkpoint intact.
+"""
+
+import os
+import json
+import tempfile
+
+import numpy as np
+
+from pointset import PointSet
+from support import triangle_cache
+
+VERSION = 2  # version 1 checkpoints don't have the state of the schedule
+
+
+def save(uri, mesh, pixtemp, min_error, cnt, tag='', dump_cache=False, schedule=None):
+    """
+    :param uri: path of the checkpoint, it is replaced atomically
+    :param mesh: the mesh being annealed
+    :param pixtemp: current temperature
+    :param min_error: the lowest error so far
+    :param cnt: the iteration the run should resume at
+    :param tag: describes how the cached errors were calculated, e.g. the error engine.
+    The cache is only restored by a run with the same tag.
+    :param dump_cache: store every cached triangle, instead of only the ones in the mesh
+    :param schedule: the Schedule of the run, so that reheats, plateaus and the time budget carry on where they were
+    """
+    points = mesh.points
+    rng_name, rng_keys, rng_pos, rng_has_gauss, rng_gauss = np.random.get_state()
+    keys, colors, errors = _cache_entries(mesh, dump_cache)
+
+    arrays = dict(
+        version=VERSION,
+        shape=np.array(mesh.image.shape[:2]),
+        positions=points.positions,
+        old_positions=points.old_positions,
+        fixed=points.fixed,
+        errors=points.errors,
+        counters=np.array([points.accepted, points.rejected]),
+        schedule=np.array([pixtemp, min_error]),
+        schedule_state=json.dumps(schedule.state() if schedule is not None else None),
+        cnt=cnt,
+        rng_keys=rng_keys,
+        rng_state=np.array([rng_pos, rng_has_gauss, rng_gauss]),
+        tag=tag,
+        quantum=triangle_cache.cache.quantum,
+        cache_keys=keys,
+        cache_colors=colors,
+        cache_errors=errors,
+    )
+
+    directory = os.path.dirname(os.path.abspath(uri))
+    fd, tmp = tempfile.mkstemp(prefix='.checkpoint', suffix='.npz', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.name == 'nt' and os.path.exists(uri):
+            os.remove(uri)  # rename doesn't replace files on windows
+        os.rename(tmp, uri)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def restore(uri, tag=''):
+    """
+    Reads a checkpoint written by save, and restores the state of the random generator.
+    The caller builds the mesh, the checkpoint may be of any level of an image pyramid.
+    :return: (points, pixtemp, min_error, cnt, entries, state) tuple, entries are the (keys, colors, errors)
+    of the cached triangles, or None if they were calculated in another way than the tag says,
+    state is the one of Schedule.state, None if the checkpoint doesn't have it
+    """
+    data = np.load(uri)
+    if int(data['version']) not in (1, VERSION):
+        raise ValueError("Unsupported checkpoint version %d." % int(data['version']))
+
+    h, w = data['shape'].tolist()
+    positions = data['positions']
+    points = PointSet(w, h, capacity=len(positions))
+    points.add(positions, fixed=data['fixed'])
+    points.old_positions[:] = data['old_positions']
+    points.errors[:] = data['errors']
+    points.accepted, points.rejected = data['counters'].tolist()
+
+    rng_pos, rng_has_gauss, rng_gauss = data['rng_state'].tolist()
+    np.random.set_state(('MT19937', data['rng_keys'], int(rng_pos), int(rng_has_gauss), rng_gauss))
+
+    entries = None
+    if str(data['tag']) == tag and float(data['quantum']) == triangle_cache.cache.quantum:
+        entries = (data['cache_keys'], data['cache_colors'], data['cache_errors'])
+
+    state = json.loads(str(data['schedule_state'])) if 'schedule_state' in data.files else None
+
+    pixtemp, min_error = data['schedule'].tolist()
+    return points, pixtemp, min_error, int(data['cnt']), entries, state
+
+
+def _cache_entries(mesh, dump_cache):
+    """
+    :return: (keys, colors, errors) of the colorized triangles in the mesh,
+    followed by the rest of the cache if dump_cache is set
+    """
+    cache = triangle_cache.cache
+    keys, colors, errors = [np.zeros([0, 3], dtype=np.int64)], [np.zeros([0, cache.channels])], [np.zeros(0)]
+    for triangulation in (mesh._triangulation, mesh._proposal):
+        if triangulation is not None and len(triangulation._triangle_stack) == 0:
+            keys.append(np.array(cache.keys(triangulation.triangles), dtype=np.int64).reshape(-1, 3))
+            colors.append(triangulation.colors)
+            errors.append(triangulation.calculate_triangle_errors())
+    if dump_cache:
+        for arr, dumped in zip((keys, colors, errors), cache.dump()):
+            arr.append(dumped)
+    return np.concatenate(keys), np.concatenate(colors), np.concatenate(errors)
@@ -0,0 +1,340 @@
+__author__ = 'zieghailo'
+
+"""
+Writes the colored triangulation to disk without going through matplotlib.
+Supported formats, picked by the extension of the uri:
+    .svg    one polygon per triangle, written in chunks
+    .json   vertex, index and color arrays
+    .bin    the same buffers packed in binary, see save_binary
+    other   rasterized by cv2 into any image format it can write
+The planes of the gradient engine are evaluated at every pixel in the raster formats,
+drawn as linear gradients in svg, and exported as the colors of the vertices of every triangle otherwise.
+"""
+
+import os
+import json
+import struct
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+
+# the arrays the exporters need, copied out of a triangulation
+Frame = namedtuple('Frame', ['triangles', 'colors', 'positions', 'simplices'])
+
+BINARY_MAGIC = 'SGMESH'
+BINARY_VERSION = 1
+BINARY_GRADIENT_VERSION = 2  # the same layout, with the colors of the three vertices of every triangle
+SVG_CHUNK = 4096  # polygons formatted and written at once
+RENDER_ROWS = 256  # rows of a gradient shaded image interpolated at once
+
+
+def frame(triangulation, copy=True):
+    """
+    :param triangulation: colorized Triangulation, or a Frame
+    :param copy: copy the arrays, so that the frame can be saved while the mesh keeps changing
+    :return: Frame
+    """
+    if isinstance(triangulation, Frame):
+        return triangulation
+    arrays = (triangulation.triangles, triangulation.colors,
+              triangulation.positions, triangulation.delaunay.simplices)
+    if copy:
+        arrays = [np.array(arr) for arr in arrays]
+    return Frame(*arrays)
+
+
+def save(triangulation, uri, size, scale=1.0):
+    """
+    Saves the triangulation, the format is picked by the extension of the uri.
+    :param triangulation: colorized Triangulation or Frame
+    :param size: (width, height) of the original image
+    :param scale: raster formats only, the rendered image is scale times larger than the original
+    """
+    extension = os.path.splitext(uri)[1].lower()
+    if extension == '.svg':
+        save_svg(triangulation, uri, size)
+    elif extension == '.json':
+        save_json(triangulation, uri, size)
+    elif extension == '.bin':
+        save_binary(triangulation, uri, size)
+    else:
+        save_image(triangulation, uri, size, scale)
+
+
+def _colors8(colors):
+    return np.clip(np.round(np.asarray(colors) * 255), 0, 255).astype(np.uint8)
+
+
+def _planes(colors):
+    """
+    :param colors: Tx9 planes of the gradient engine
+    :return: (Tx3 colors at the origin, Tx3 x slopes, Tx3 y slopes) tuple
+    """
+    colors = np.asarray(colors)
+    return colors[:, :3], colors[:, 3:6], colors[:, 6:]
+
+
+def vertex_colors(triangles, colors):
+    """
+    :param triangles: Tx2x3 triangle coordinates
+    :param colors: Tx9 planes of the gradient engine
+    :return: Tx9 red, green and blue of the planes at each of the three vertices
+    """
+    base, gx, gy = _planes(colors)
+    corners = (base[:, np.newaxis] + triangles[:, 0, :, np.newaxis] * gx[:, np.newaxis] +
+               triangles[:, 1, :, np.newaxis] * gy[:, np.newaxis])
+    return corners.reshape(-1, 9)
+
+
+# region svg
+def save_svg(triangulation, uri, size):
+    """
+    :param uri: path, or a file object the svg is streamed into
+    """
+    f = open(uri, 'w') if isinstance(uri, basestring) else uri
+    try:
+        _write_svg(frame(triangulation, copy=False), f, size)
+    finally:
+        if f is not uri:
+            f.close()
+
+
+def _write_svg(fr, f, size):
+    w, h = size
+    f.write('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">\n'
+            % (w, h, w, h))
+    if fr.colors.shape[1] == 9:
+        _write_svg_gradients(fr, f)
+        f.write('</svg>\n')
+        return
+
+    coords = fr.triangles.transpose(0, 2, 1).reshape(-1, 6)
+    colors = _colors8(fr.colors).astype(int)
+    # the stroke hides the hairline gaps antialiasing leaves between neighboring triangles
+    polygon = '<polygon points="%.1f,%.1f %.1f,%.1f %.1f,%.1f" fill="#%02x%02x%02x" stroke="#%02x%02x%02x"/>\n'
+    for start in range(0, len(coords), SVG_CHUNK):
+        chunk = zip(coords[start:start + SVG_CHUNK].tolist(), colors[start:start + SVG_CHUNK].tolist())
+        f.write(''.join(polygon % tuple(tr + color + color) for tr, color in chunk))
+    f.write('</svg>\n')
+
+
+def _write_svg_gradients(fr, f):
+    """
+    A linear gradient only changes the color in one direction, while the slopes of the three channels can point
+    in different directions. Each triangle gets the rank one approximation of its planes, the gradient runs
+    along the direction the colors change the most, between the extreme projections of the vertices.
+    """
+    base, gx, gy = _planes(fr.colors)
+    u, s, vh = np.linalg.svd(np.stack((gx, gy), axis=1))
+    direction = u[:, :, 0]
+    change = s[:, :1] * vh[:, 0]
+
+    centroids = fr.triangles.mean(axis=2)
+    mean = base + centroids[:, :1] * gx + centroids[:, 1:] * gy
+    along = np.einsum('tij,ti->tj', fr.triangles - centroids[:, :, np.newaxis], direction)
+    low, high = along.min(axis=1)[:, np.newaxis], along.max(axis=1)[:, np.newaxis]
+
+    ends = np.hstack((centroids + low * direction, centroids + high * direction))
+    stops = _colors8(np.hstack((mean + low * change, mean + high * change))).astype(int)
+    coords = fr.triangles.transpose(0, 2, 1).reshape(-1, 6)
+
+    gradient = ('<linearGradient id="g%d" gradientUnits="userSpaceOnUse" x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f">'
+                '<stop offset="0" stop-color="#%02x%02x%02x"/><stop offset="1" stop-color="#%02x%02x%02x"/>'
+                '</linearGradient>\n')
+    polygon = '<polygon points="%.1f,%.1f %.1f,%.1f %.1f,%.1f" fill="url(#g%d)" stroke="url(#g%d)"/>\n'
+    for start in range(0, len(coords), SVG_CHUNK):
+        chunk = zip(range(start, start + SVG_CHUNK), coords[start:start + SVG_CHUNK].tolist(),
+                    ends[start:start + SVG_CHUNK].tolist(), stops[start:start + SVG_CHUNK].tolist())
+        f.write(''.join(gradient % tuple([i] + end + stop) + polygon % tuple(tr + [i, i])
+                        for i, tr, end, stop in chunk))
+# endregion
+
+
+# region buffers
+def buffers(triangulation):
+    """
+    The mesh as flat buffers, ready to be uploaded to a renderer.
+    Points that aren't a vertex of any triangle are dropped.
+    :return: (Nx2 float32 vertices, Tx3 uint32 indices into the vertices, Tx3 uint8 colors) tuple,
+    for the gradient engine the colors are Tx9, the colors of the vertices in the order of the indices
+    """
+    fr = frame(triangulation, copy=False)
+    used, indices = np.unique(fr.simplices, return_inverse=True)
+    vertices = fr.positions[used].astype(np.float32)
+    colors = vertex_colors(fr.triangles, fr.colors) if fr.colors.shape[1] == 9 else fr.colors
+    return vertices, indices.reshape(-1, 3).astype(np.uint32), _colors8(colors)
+
+
+def save_json(triangulation, uri, size):
+    vertices, indices, colors = buffers(triangulation)
+    with open(uri, 'w') as f:
+        json.dump({'width': size[0], 'height': size[1],
+                   'shading': 'gradient' if colors.shape[1] == 9 else 'flat',
+                   'vertices': vertices.ravel().tolist(),
+                   'indices': indices.ravel().tolist(),
+                   'colors': colors.ravel().tolist()}, f, separators=(',', ':'))
+
+
+def save_binary(triangulation, uri, size):
+    """
+    Little endian layout:
+        6 bytes     magic 'SGMESH'
+        uint16      version
+        uint32 x 4  width, height, vertex count, triangle count
+        float32     x, y of every vertex
+        uint32      three vertex indices of every triangle
+        uint8       r, g, b of every triangle
+    Gradient shaded meshes are written as BINARY_GRADIENT_VERSION, with the r, g, b of each of the
+    three vertices of every triangle instead.
+    """
+    vertices, indices, colors = buffers(triangulation)
+    version = BINARY_GRADIENT_VERSION if colors.shape[1] == 9 else BINARY_VERSION
+    with open(uri, 'wb') as f:
+        f.write(BINARY_MAGIC)
+        f.write(struct.pack('<HIIII', version, size[0], size[1], len(vertices), len(indices)))
+        f.write(vertices.astype('<f4').tobytes())
+        f.write(indices.astype('<u4').tobytes())
+        f.write(colors.tobytes())
+
+
+def load_binary(uri):
+    """
+    Reads a file written by save_binary.
+    :return: ((width, height), vertices, indices, colors) tuple
+    """
+    with open(uri, 'rb') as f:
+        data = f.read()
+    if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise ValueError("Not a stained glass mesh file.")
+
+    offset = len(BINARY_MAGIC)
+    version, w, h, nv, nt = struct.unpack_from('<HIIII', data, offset)
+    if version not in (BINARY_VERSION, BINARY_GRADIENT_VERSION):
+        raise ValueError("Unsupported mesh file version %d." % version)
+    channels = 9 if version == BINARY_GRADIENT_VERSION else 3
+    offset += struct.calcsize('<HIIII')
+
+    vertices = np.frombuffer(data, '<f4', 2 * nv, offset).reshape(nv, 2)
+    offset += vertices.nbytes
+    indices = np.frombuffer(data, '<u4', 3 * nt, offset).reshape(nt, 3)
+    offset += indices.nbytes
+    colors = np.frombuffer(data, np.uint8, channels * nt, offset).reshape(nt, channels)
+    return (w, h), vertices, indices, colors
+# endregion
+
+
+# region raster
+def render(triangulation, size, scale=1.0):
+    """
+    Rasterizes the triangulation.
+    :return: RGB uint8 image, scale times the size of the original
+    """
+    fr = frame(triangulation, copy=False)
+    w, h = size
+    canvas = np.zeros([int(round(h * scale)), int(round(w * scale)), 3], dtype=np.uint8)
+
+    # cv2 works on fixed point coordinates, 4 fractional bits keep the vertices subpixel precise
+    vertices = np.round(fr.triangles.transpose(0, 2, 1) * scale * 16).astype(np.int32)
+    if fr.colors.shape[1] == 9:
+        return _render_gradients(fr, vertices, canvas, scale)
+
+    for tr, color in zip(vertices, _colors8(fr.colors).tolist()):
+        cv2.fillConvexPoly(canvas, tr, color, cv2.LINE_8, 4)
+    return canvas
+
+
+def _render_gradients(fr, vertices, canvas, scale):
+    """
+    Fills the pixels with the same triangles as the flat triangles, and evaluates the plane
+    of the triangle at the center of every pixel.
+    """
+    owner = np.full(canvas.shape[:2], -1, dtype=np.int32)
+    for i, tr in enumerate(vertices):
+        cv2.fillConvexPoly(owner, tr, i, cv2.LINE_8, 4)
+
+    base, gx, gy = _planes(fr.colors)
+    for start in range(0, len(owner), RENDER_ROWS):
+        ys, xs = np.nonzero(owner[start:start + RENDER_ROWS] >= 0)
+        ys += start
+        tri = owner[ys, xs]
+        x, y = xs[:, np.newaxis] / float(scale), ys[:, np.newaxis] / float(scale)
+        canvas[ys, xs] = _colors8(base[tri] + x * gx[tri] + y * gy[tri])
+    return canvas
+
+
+def save_image(triangulation, uri, size, scale=1.0):
+    canvas = render(triangulation, size, scale)
+    cv2.imwrite(uri, cv2.cvtColor(canvas, cv2.COLOR_RGB2BGR))
+# endregion
+
+
+class AsyncSaver(object):
+    """
+    Saves meshes in a background thread, so that the anneal doesn't wait for the disk.
+    Only the latest request is kept, a mesh that is still waiting gets replaced by a newer one.
+    """
+
+    def __init__(self):
+        self._pending = None
+        self._closed = False
+        self._busy = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='AsyncSaver')
+        self._thread.daemon = True
+        self._thread.start()
+
+        self.saved = 0
+        self.dropped = 0
+        self.error = None
+
+    def save(self, triangulation, uri, size, scale=1.0):
+        """
+        Takes a copy of the triangulation arrays and returns right away.
+        Takes the same parameters as save.
+        """
+        request = (frame(triangulation), uri, size, scale)
+        with self._condition:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = request
+            self._condition.notify_all()
+
+    def wait(self):
+        """
+        Blocks until every request so far is on the disk.
+        """
+        with self._condition:
+            while self._pending is not None or self._busy:
+                self._condition.wait()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.wait()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                request, self._pending = self._pending, None
+                self._busy = True
+
+            try:
+                save(*request)
+                self.saved += 1
+            except Exception as e:
+                self.error = e
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
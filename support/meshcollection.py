@@ -3,8 +3,6 @@ from matplotlib.collections import PatchCollection
 from matplotlib.patches import Polygon
 from collections import deque
 
-from triangulation import nptriangle2result
-
 
 class FlatMeshCollection(PatchCollection):
     """
@@ -13,12 +11,10 @@ class FlatMeshCollection(PatchCollection):
     def __init__(self, mesh, alpha=1):
         patches = deque()
         colors = deque()
-        for tr in mesh.triangles:
+        flat_colors = mesh.flat_colors
+        for i, tr in enumerate(mesh.triangles):
             patches.append(Polygon(tr.transpose()))
-            try:
-                colors.append(nptriangle2result(tr)[0] + (alpha,))
-            except KeyError:
-                colors.append((0,1,0))
+            colors.append(tuple(flat_colors[i]) + (alpha,))
 
         PatchCollection.__init__(self, list(patches))
         self.set_color(list(colors))
@@ -35,14 +31,11 @@ class FlatMeshErrorCollection(PatchCollection):
         colors = deque()
 
         max_err = 0
-        for tr in mesh.triangles:
+        for i, tr in enumerate(mesh.triangles):
             patches.append(Polygon(tr.transpose()))
-            try:
-                err = nptriangle2result(tr)[1]
-                max_err = max(err, max_err)
-                colors.append(err)
-            except KeyError:
-                colors.append((0, 1, 0))
+            err = mesh.trindex2result(i)[1]
+            max_err = max(err, max_err)
+            colors.append(err)
 
         colors = [(c/max_err, c/max_err, c/max_err) for c in colors]
 
@@ -0,0 +1,243 @@
+__author__ = 'zieghailo'
+
+"""
+Timers and counters of the anneal, cheap enough to stay on all the time.
+The phases of an iteration are timed with
+    with metrics.timer('colorize'):
+        ...
+and events are counted with metrics.count('triangles_colorized', n). Both go to the shared registry.
+The anneal loop samples the registry every few iterations, and streams the difference since
+the last sample to a JSON lines or csv file, or serves the totals as Prometheus text over HTTP.
+The registry is locked, so the threads of the thread backend can share it. The worker processes
+of the tiled anneal count into their own registry, and return it with every tile to be merged
+into the registry of the main process, so the seconds of the tiles add up over the workers.
+"""
+
+import json
+import time
+import threading
+from collections import defaultdict
+
+PHASES = ('triangulate', 'cache', 'colorize', 'neighbors', 'accept', 'purge', 'plot')
+
+
+class _Timer(object):
+    __slots__ = ('_metrics', '_phase', '_start')
+
+    def __init__(self, metrics, phase):
+        self._metrics = metrics
+        self._phase = phase
+
+    def __enter__(self):
+        self._start = time.time()
+
+    def __exit__(self, *exc_info):
+        self._metrics.time(self._phase, time.time() - self._start)
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def timer(self, phase):
+        return _Timer(self, phase)
+
+    def time(self, phase, seconds):
+        with self._lock:
+            self.seconds[phase] += seconds
+
+    def count(self, name, k=1):
+        with self._lock:
+            self.counters[name] += k
+
+    def total(self, name, value):
+        """
+        Sets a counter that is kept somewhere else, e.g. the accepted moves of the PointSet.
+        """
+        with self._lock:
+            self.counters[name] = value
+
+    def set(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """
+        :return: dict of the phase seconds, counters and gauges, the names of the seconds end with _seconds
+        """
+        with self._lock:
+            record = dict(self.gauges)
+            record.update(self.counters)
+            record.update(('%s_seconds' % phase, seconds) for phase, seconds in self.seconds.items())
+        return record
+
+    def drain(self):
+        """
+        Empties the seconds and counters, called in the worker processes.
+        :return: (seconds, counters) tuple of dicts, to be merged into the registry of the main process
+        """
+        with self._lock:
+            drained = dict(self.seconds), dict(self.counters)
+            self.seconds.clear()
+            self.counters.clear()
+        return drained
+
+    def merge(self, drained):
+        """
+        Adds the seconds and counters returned by drain.
+        """
+        seconds, counters = drained
+        with self._lock:
+            for phase, value in seconds.items():
+                self.seconds[phase] += value
+            for name, value in counters.items():
+                self.counters[name] += value
+
+
+registry = Metrics()
+
+
+def timer(phase):
+    return registry.timer(phase)
+
+
+def count(name, k=1):
+    registry.count(name, k)
+
+
+def total(name, value):
+    registry.total(name, value)
+
+
+def set(name, value):
+    registry.set(name, value)
+
+
+def reset():
+    """
+    Replaces the shared registry with an empty one.
+    """
+    global registry
+    registry = Metrics()
+
+
+def _rates(record):
+    """
+    Adds the ratios that are meaningful over an interval.
+    """
+    lookups = record.get('cache_hits', 0) + record.get('cache_misses', 0)
+    record['cache_hit_rate'] = record.get('cache_hits', 0) / float(lookups) if lookups else None
+    moves = record.get('accepted', 0) + record.get('rejected', 0)
+    record['acceptance'] = record.get('accepted', 0) / float(moves) if moves else None
+    return record
+
+
+class MetricsWriter(object):
+    """
+    Writes one record per sample, with the counters and seconds accumulated since the previous sample,
+    and the gauges as they are. JSON lines, or csv if the uri ends with .csv.
+    """
+
+    COLUMNS = ['iteration', 'elapsed', 'temperature', 'error', 'points', 'acceptance', 'cache_hit_rate',
+               'triangles_colorized'] + ['%s_seconds' % phase for phase in PHASES]
+
+    def __init__(self, uri):
+        self._csv = uri.lower().endswith('.csv')
+        self._file = open(uri, 'w')
+        self._last = {}
+        if self._csv:
+            self._file.write(','.join(self.COLUMNS) + '\n')
+
+    def write(self, snapshot):
+        record = dict(snapshot)
+        for name, value in snapshot.items():
+            if name in registry.counters or name.endswith('_seconds'):
+                record[name] = value - self._last.get(name, 0)
+        self._last = snapshot
+        _rates(record)
+
+        if self._csv:
+            self._file.write(','.join('' if record.get(c) is None else str(record.get(c, '')) for c in self.COLUMNS)
+                             + '\n')
+        else:
+            self._file.write(json.dumps(record, sort_keys=True) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class PrometheusServer(object):
+    """
+    Serves the latest sample in the Prometheus text format on http://host:port/metrics, from a daemon thread.
+    Counters and seconds are totals since the start, the gauges are the values of the sample.
+    """
+
+    def __init__(self, port, host='127.0.0.1', prefix='stainedglass'):
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = server.render()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # one line per scrape would flood the console
+
+        self._prefix = prefix
+        self._snapshot = {}
+        self._lock = threading.Lock()
+        self._http = HTTPServer((host, port), Handler)
+        self.port = self._http.server_address[1]
+        self._thread = threading.Thread(target=self._http.serve_forever, name='PrometheusServer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, snapshot):
+        with self._lock:
+            self._snapshot = _rates(dict(snapshot))
+
+    def render(self):
+        with self._lock:
+            snapshot = dict(self._snapshot)
+
+        lines = []
+        for name, value in sorted(snapshot.items()):
+            if value is None or isinstance(value, basestring):
+                continue
+            if name.endswith('_seconds'):
+                lines.append('%s_phase_seconds_total{phase="%s"} %r' % (self._prefix, name[:-len('_seconds')],
+                                                                         float(value)))
+            elif name in registry.counters:
+                lines.append('%s_%s_total %r' % (self._prefix, name, float(value)))
+            else:
+                lines.append('%s_%s %r' % (self._prefix, name, float(value)))
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+
+def open_sinks(uri=None, port=None):
+    """
+    :param uri: metrics file, .jsonl or .csv
+    :param port: port of the Prometheus endpoint
+    :return: list of the sinks the samples are written to
+    """
+    sinks = []
+    if uri is not None:
+        sinks.append(MetricsWriter(uri))
+    if port is not None:
+        sinks.append(PrometheusServer(port))
+    return sinks
@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 import matplotlib.pylab as pyl
 import numpy as np
 import matplotlib
+from collections import deque
 
 matplotlib.use('TkAgg')
 
@@ -61,8 +62,8 @@ oldx = None
 oldy = None
 def plot_points(mesh, plot_old=False):
     global oldx, oldy, imagePlot
-    x = [p.x for p in mesh.points]
-    y = [p.y for p in mesh.points]
+    x = mesh.points.x.copy()
+    y = mesh.points.y.copy()
     imagePlot.clear()
     imagePlot.plot(x, y, 'ro')
     if plot_old and oldx is not None:
@@ -71,22 +72,22 @@ def plot_points(mesh, plot_old=False):
     oldy = y
 
 
+past_positions = deque()
 def plot_arrow(mesh):
     global imagePlot
     # imagePlot.clear()
     STACK_SIZE = 10
-    for p in mesh.points:
-        p.past_positions.append([p.x, p.y])
-        if len(p.past_positions) > STACK_SIZE:
-            p.past_positions.popleft()
-
-        if len(p.past_positions) > 2:
-            pos = p.past_positions
-            for i in range(min(STACK_SIZE - 1, len(p.past_positions) -1)):
-                c = i * 1.0 / STACK_SIZE
-            imagePlot.arrow(pos[i][0], pos[i][1],
-                            pos[i+1][0] - pos[i][0], pos[i+1][1] - pos[i][1],
-                            head_width=0.5, head_length=0.5, fc=(c,c,c), ec=(c,c,c))
+    past_positions.append(mesh.points.positions.copy())
+    if len(past_positions) > STACK_SIZE:
+        past_positions.popleft()
+
+    for i in range(len(past_positions) - 1):
+        pos, nextpos = past_positions[i], past_positions[i + 1]
+        if len(pos) != len(nextpos):
+            continue  # points were purged in between
+        c = i * 1.0 / STACK_SIZE
+        for (x, y), (dx, dy) in zip(pos, nextpos - pos):
+            imagePlot.arrow(x, y, dx, dy, head_width=0.5, head_length=0.5, fc=(c,c,c), ec=(c,c,c))
 
 
 errors = []
@@ -0,0 +1,149 @@
+__author__ = 'zieghailo'
+
+"""
+Raw caches of the decoded inputs, for images too large to hold a few copies of in memory.
+The image is decoded once into an uncompressed .npy file, keyed by the content of the image file,
+and memory mapped read only from then on, the same for the heuristic and the prefix tables.
+The pages of a mapped array are only read when the kernels touch the triangles on them,
+and they can be dropped again, so the resident memory doesn't grow with the size of the image.
+Mapped arrays are pickled as the path of their file, so the worker processes map the same
+file instead of receiving a copy of it.
+    <sha1 of the image file and CACHE_VERSION>.image.npy
+    <sha1 of the image file and CACHE_VERSION>.<sha1 of the focus>.heuristic.npy
+    <sha1 of the image file and CACHE_VERSION>.<sha1 of the focus>.tables.npy
+"""
+
+import os
+import hashlib
+import tempfile
+
+import numpy as np
+
+CACHE_VERSION = 1  # bump when the decoding or the heuristic changes, so that stale caches aren't reused
+BAND_BYTES = 64 * 2 ** 20  # size of the bands of rows the prefix tables are built in
+
+
+class MappedArray(np.memmap):
+    """
+    Read only memory mapped .npy file. Views and results of operations on it don't have a path,
+    those are pickled as copies like any other array.
+    """
+    path = None
+
+    def __reduce__(self):
+        if self.path is None:
+            return np.asarray(self).__reduce__()
+        return load, (self.path,)
+
+
+def load(path):
+    """
+    :return: MappedArray of the .npy file
+    """
+    arr = np.load(path, mmap_mode='r').view(MappedArray)
+    arr.path = path
+    return arr
+
+
+def mapped_path(arr):
+    """
+    :return: path of the file the array maps as a whole, None if it isn't a mapped array
+    """
+    return arr.path if isinstance(arr, MappedArray) else None
+
+
+def _digest(uri, chunk=2 ** 20):
+    digest = hashlib.sha1()
+    with open(uri, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), ''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write(path, shape, dtype, fill):
+    """
+    Writes the .npy file next to its destination and renames it, so that concurrent runs never map half a file.
+    :param fill: called with the writable memory map of the new file
+    :return: MappedArray of the file
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass  # created by another process in the meantime
+    fd, tmp = tempfile.mkstemp(suffix='.npy', dir=directory)
+    os.close(fd)
+    arr = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+    fill(arr)
+    arr.flush()
+    del arr
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        os.remove(tmp)  # windows doesn't replace files, another run cached the same array
+    return load(path)
+
+
+def cached(path, make):
+    """
+    :param make: returns the array, called only if the cache doesn't have it yet
+    :return: MappedArray of the cached array
+    """
+    if os.path.exists(path):
+        return load(path)
+    arr = make()
+
+    def fill(target):
+        target[...] = arr
+    return _write(path, arr.shape, arr.dtype, fill)
+
+
+def image_path(image_uri, cache_dir):
+    """
+    :return: path of the decoded image, keyed by the content of the file and the version of the decoding
+    """
+    key = hashlib.sha1('%d %s' % (CACHE_VERSION, _digest(image_uri))).hexdigest()
+    return os.path.join(cache_dir, '%s.image.npy' % key)
+
+
+def heuristic_path(image, focus_uri=None, generator=None):
+    """
+    :param image: mapped image, the heuristic is cached next to it
+    :param focus_uri: focus map the heuristic is made from
+    :param generator: name of the img2heur generator it is made with, if there is no focus map
+    :return: path of the cached heuristic
+    """
+    import img2heur
+    if focus_uri is not None:
+        focus = 'map %s' % _digest(focus_uri)
+    elif generator is not None:
+        focus = 'generator %s %d' % (generator, img2heur.CACHE_VERSION)
+    else:
+        focus = 'uniform'
+    focus = hashlib.sha1('%d %s' % (CACHE_VERSION, focus)).hexdigest()
+    return mapped_path(image)[:-len('.image.npy')] + '.%s.heuristic.npy' % focus
+
+
+def tables(image, heuristic):
+    """
+    The prefix tables of a mapped image and heuristic, built in bands of rows, so that only one band
+    is in memory at a time.
+    :return: MappedArray of the tables, None if the heuristic isn't mapped
+    """
+    import trimath
+    path = mapped_path(heuristic)
+    if path is None:
+        return None
+    path = path[:-len('.heuristic.npy')] + '.tables.npy'
+    if os.path.exists(path):
+        return load(path)
+
+    h, w = heuristic.shape
+    rows = max(1, BAND_BYTES // ((w + 1) * 10 * 8))
+
+    def fill(target):
+        for start in range(0, h, rows):
+            target[start:start + rows] = trimath.build_prefix_tables(image[start:start + rows],
+                                                                     heuristic[start:start + rows])
+    return _write(path, (h, w + 1, 10), np.float64, fill)
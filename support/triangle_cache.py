@@ -0,0 +1,198 @@
+__author__ = 'zieghailo'
+
+"""
+Cache of triangle colors and errors.
+Triangles are keyed by their vertices rounded to multiples of QUANTUM,
+sorted so that the same triangle hits regardless of the vertex order.
+The error engines only look at the rounded vertices, so with a quantum of one pixel
+the cached results are exactly the ones the engines would return.
+Results are stored in preallocated arrays, full slots are reused in CLOCK order.
+A color is 3 channels wide, or 9 for the planes fitted by the gradient engine,
+the color at the origin, the x slope and the y slope of every channel.
+The tiles of the tiled anneal share the cache between threads, so it is locked.
+"""
+
+import threading
+
+import numpy as np
+
+CAPACITY = 65536
+QUANTUM = 1.0
+CHANNELS = 3
+
+
+class TriangleCache(object):
+
+    def __init__(self, capacity=CAPACITY, quantum=QUANTUM, channels=CHANNELS):
+        self.capacity = capacity
+        self.quantum = quantum
+        self.channels = channels
+
+        self._lock = threading.RLock()
+        self._slots = {}
+        self._keys = [None] * capacity
+        self._colors = np.zeros([capacity, channels])
+        self._errors = np.zeros(capacity)
+        self._referenced = bytearray(capacity)
+        self._size = 0
+        self._hand = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def keys(self, triangles):
+        """
+        :param triangles: Nx2x3 numpy array of triangle coordinates
+        :return: list of N hashable keys
+        """
+        q = np.floor(np.asarray(triangles) / self.quantum + 0.5).astype(np.int64)
+        # pack each vertex into one integer, x in the high bits, and sort the vertices
+        vertices = np.sort((q[:, 0, :] << 32) + q[:, 1, :], axis=1)
+        return list(map(tuple, vertices.tolist()))
+
+    def key(self, triangle):
+        return self.keys(np.asarray(triangle)[np.newaxis])[0]
+
+    def lookup(self, keys):
+        """
+        :return: numpy array with the slot of each key, -1 for keys that are not cached
+        """
+        slots = np.empty(len(keys), dtype=np.int64)
+        with self._lock:
+            get = self._slots.get
+            referenced = self._referenced
+            for i, key in enumerate(keys):
+                slot = get(key)
+                if slot is None:
+                    slots[i] = -1
+                    self.misses += 1
+                else:
+                    slots[i] = slot
+                    referenced[slot] = 1
+                    self.hits += 1
+        return slots
+
+    def results(self, slots):
+        """
+        :return: the colors and errors stored in the slots returned by lookup
+        """
+        with self._lock:
+            return self._colors[slots], self._errors[slots]
+
+    def fetch(self, keys):
+        """
+        Looks the keys up and copies their results at once, so that another thread can't reuse the slots in between.
+        :return: (N bool array of the keys that are cached, their colors, their errors) tuple
+        """
+        with self._lock:
+            slots = self.lookup(keys)
+            found = slots >= 0
+            colors, errors = self.results(slots[found])
+        return found, colors, errors
+
+    def store(self, keys, colors, errors):
+        """
+        Stores the NxC colors and N errors under the keys, evicting old results if the cache is full.
+        """
+        slots = np.empty(len(keys), dtype=np.int64)
+        with self._lock:
+            for i, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._free_slot()
+                    self._slots[key] = slot
+                    self._keys[slot] = key
+                self._referenced[slot] = 1
+                slots[i] = slot
+            self._colors[slots] = colors
+            self._errors[slots] = errors
+
+    def get(self, triangle):
+        """
+        Finds the result for the 2x3 numpy array triangle.
+        Throws KeyError when encountering an unknown triangle.
+        :return: (color, error) tuple
+        """
+        found, colors, errors = self.fetch([self.key(triangle)])
+        if not found[0]:
+            raise KeyError("The triangle is not in the cache.")
+        return tuple(colors[0]), errors[0]
+
+    def set(self, triangle, value):
+        color, error = value
+        self.store([self.key(triangle)], [color], [error])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / float(lookups) if lookups else 0.0,
+        }
+
+    def dump(self):
+        """
+        :return: (Kx3 int64 keys, KxC colors, K errors) tuple of every cached result
+        """
+        with self._lock:
+            if len(self) == 0:
+                return np.zeros([0, 3], dtype=np.int64), np.zeros([0, self.channels]), np.zeros(0)
+            keys, slots = zip(*self._slots.items())
+            slots = np.array(slots)
+            return np.array(keys, dtype=np.int64), self._colors[slots], self._errors[slots]
+
+    def load(self, keys, colors, errors):
+        """
+        Stores the results returned by dump.
+        """
+        self.store(list(map(tuple, np.asarray(keys).tolist())), colors, errors)
+
+    def clear(self):
+        self.__init__(self.capacity, self.quantum, self.channels)
+
+    def _free_slot(self):
+        """
+        Called by store, with the lock held.
+        """
+        if self._size < self.capacity:
+            self._size += 1
+            return self._size - 1
+
+        # CLOCK: skip over recently referenced slots, clearing their bit
+        while True:
+            slot = self._hand
+            self._hand = (self._hand + 1) % self.capacity
+            if self._referenced[slot]:
+                self._referenced[slot] = 0
+            else:
+                del self._slots[self._keys[slot]]
+                self.evictions += 1
+                return slot
+
+
+# region module level cache, shared by all triangulations
+cache = TriangleCache()
+
+
+def configure(capacity=CAPACITY, quantum=QUANTUM, channels=CHANNELS):
+    """
+    Replaces the shared cache with an empty one.
+    """
+    global cache
+    cache = TriangleCache(capacity, quantum, channels)
+
+
+def get(triangle):
+    return cache.get(triangle)
+
+
+def set(triangle, value):
+    cache.set(triangle, value)
+# endregion
@@ -0,0 +1,147 @@
+__author__ = 'zieghailo'
+
+import ctypes
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+from multiprocessing.sharedctypes import RawArray
+
+import trimath
+from support import metrics, rawcache
+
+
+def _share(arr):
+    """
+    Copies the array into a block of shared memory, memory mapped arrays are shared by the path of their file.
+    :param arr: numpy array to be shared with the workers
+    :return: (raw shared buffer, shape, dtype string) tuple or path that can be passed to the workers
+    """
+    path = rawcache.mapped_path(arr)
+    if path is not None:
+        return path
+    arr = np.ascontiguousarray(arr)
+    raw = RawArray(ctypes.c_byte, arr.nbytes)
+    np.frombuffer(raw, dtype=arr.dtype).reshape(arr.shape)[...] = arr
+    return raw, arr.shape, arr.dtype.str
+
+
+def _unshare(shared):
+    if isinstance(shared, basestring):
+        return rawcache.load(shared)
+    raw, shape, dtype = shared
+    return np.frombuffer(raw, dtype=np.dtype(dtype)).reshape(shape)
+
+
+# the context of the image, in every worker process
+_context = None
+
+
+def _init_worker(image, heuristic, tables):
+    """
+    Runs once in every worker process. Wraps the shared memory blocks in numpy arrays,
+    or maps the cached files, without copying them, and creates the context of the worker from them.
+    """
+    global _context
+    # the forked worker starts with a copy of the counts of the main process
+    metrics.reset()
+    _context = trimath.RasterContext(_unshare(image), _unshare(heuristic),
+                                     _unshare(tables) if tables is not None else None)
+
+
+def worker_context():
+    """
+    :return: the RasterContext of the worker process calling it
+    """
+    return _context
+
+
+def evaluate(args):
+    """
+    Runs in the workers.
+    :param args: (name of the RasterContext method, Nx2x3 triangles) tuple
+    :return: whatever the method returns
+    """
+    method, triangles = args
+    return getattr(_context, method)(triangles)
+
+
+class WorkerPool(object):
+    """
+    A long lived pool of colorization workers, created once per run.
+    The image, the heuristic and the tables of the context are copied into shared memory once,
+    and every worker creates its own context from them.
+    """
+
+    def __init__(self, context, processes=None):
+        """
+        :param context: trimath.RasterContext the workers evaluate the triangles against
+        """
+        self._image = _share(context.image)
+        self._heuristic = _share(context.heuristic)
+        self._tables = _share(context.tables) if context.tables is not None else None
+        self.processes = processes or cpu_count()
+        self._pool = Pool(processes, initializer=_init_worker,
+                          initargs=(self._image, self._heuristic, self._tables))
+
+    @property
+    def context(self):
+        """
+        None, every worker has its own context, see worker_context.
+        """
+        return None
+
+    def map(self, func, iterable, chunksize=None):
+        return self._pool.map(func, iterable, chunksize)
+
+    def evaluate(self, method, chunks):
+        """
+        Calls the RasterContext method on every chunk of triangles, in the workers.
+        :return: list of the results, in the order of the chunks
+        """
+        return self._pool.map(evaluate, [(method, chunk) for chunk in chunks])
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+class ThreadWorkerPool(object):
+    """
+    Same interface as WorkerPool, but the workers are threads of this process.
+    The threads share the context, so neither the image nor the triangles and results are copied,
+    and the kernels release the GIL, so the threads run them in parallel.
+    Anything that is mostly python, like annealing tiles, doesn't speed up in threads.
+    """
+
+    def __init__(self, context, processes=None):
+        """
+        :param context: trimath.RasterContext the workers evaluate the triangles against
+        :param processes: number of threads
+        """
+        self.context = context
+        self.processes = processes or cpu_count()
+        self._pool = ThreadPool(self.processes)
+
+    def map(self, func, iterable, chunksize=None):
+        return self._pool.map(func, iterable, chunksize)
+
+    def evaluate(self, method, chunks):
+        return self._pool.map(getattr(self.context, method), chunks)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+BACKENDS = {
+    'process': WorkerPool,
+    'thread': ThreadWorkerPool,
+}
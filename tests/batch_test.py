@@ -0,0 +1,80 @@
+__author__ = 'zieghailo'
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from settings.default_settings import C
+import batch
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        np.random.seed(0)
+        for name in ('a.png', 'b.png'):
+            cv2.imwrite(os.path.join(self.dir, name), (np.random.rand(40, 60, 3) * 255).astype(np.uint8))
+        self.out = os.path.join(self.dir, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_read_directory(self):
+        jobs = batch.read_jobs(self.dir, self.out, 'svg')
+        self.assertEqual([os.path.basename(job['output']) for job in jobs], ['a.svg', 'b.svg'])
+
+    def test_read_manifest(self):
+        manifest = os.path.join(self.dir, 'jobs.jsonl')
+        with open(manifest, 'w') as f:
+            f.write(json.dumps({'image': 'a.png', 'settings': {'starting_points': 10}}) + '\n\n')
+        jobs = batch.read_jobs(manifest, self.out, 'png')
+
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0]['output'], os.path.join(self.out, 'a.png'))
+        settings = batch.job_settings(C, jobs[0])
+        self.assertEqual(settings.STARTING_POINTS, 10)
+        self.assertNotEqual(C.STARTING_POINTS, 10)
+
+    def test_run(self):
+        jobs = batch.read_jobs(self.dir, self.out, 'png')
+        jobs[1]['settings'] = {'STARTING_POINTS': 12}
+        jobs.append({'image': os.path.join(self.dir, 'missing.png'), 'focus': None, 'settings': {},
+                     'output': os.path.join(self.out, 'missing.png')})
+
+        defaults = batch.job_settings(C, {'image': None, 'focus': None, 'output': None,
+                                          'settings': {'starting_points': 20, 'max_iterations': 5,
+                                                       'purge_multiplier': 0}})
+        reports = batch.run(jobs, defaults, processes=1)
+
+        self.assertEqual([report['status'] for report in reports], ['done', 'done', 'failed'])
+        self.assertEqual([report['points'] for report in reports[:2]], [20, 12])
+        self.assertTrue(os.path.exists(os.path.join(self.out, 'b.png')))
+
+    def test_pyramid(self):
+        job = {'image': None, 'focus': None, 'output': os.path.join(self.out, 'a.png'),
+               'settings': {'STARTING_POINTS': 20, 'PYRAMID_LEVELS': 3, 'TEMPERATURE': 20, 'PLATEAU_PATIENCE': 3}}
+        img = (np.random.rand(80, 120, 3) * 255).astype(np.uint8)
+        report = batch.render(batch.job_settings(C, job), img, np.ones([80, 120], dtype=np.uint16))
+
+        self.assertEqual(report['status'], 'done', report.get('traceback'))
+        self.assertEqual(report['levels'], [2, 1, 0])
+        self.assertEqual(cv2.imread(job['output']).shape, img.shape)
+
+    def test_unsupported_settings_fail(self):
+        jobs = batch.read_jobs(self.dir, self.out, 'png')
+        jobs[0]['settings'] = {'checkpoint': 'run.npz'}
+        jobs[1]['settings'] = {'STARTING_PIONTS': 12}
+        reports = batch.run(jobs, C, processes=1)
+
+        self.assertEqual([report['status'] for report in reports], ['failed', 'failed'])
+        self.assertIn('CHECKPOINT', reports[0]['traceback'])
+        self.assertIn('STARTING_PIONTS', reports[1]['traceback'])
+
+
+if __name__ == '__main__':
+    unittest.main()
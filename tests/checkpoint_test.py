@@ -0,0 +1,103 @@
+__author__ = 'zieghailo'
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from trimath import RasterContext
+from mesh import Mesh
+from schedules import AdaptiveSchedule
+from support import checkpoint, triangle_cache
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.img = (np.random.rand(60, 80, 3) * 255).astype(np.uint8)
+        self.context = RasterContext(self.img, np.ones([60, 80], dtype=np.uint16))
+        triangle_cache.configure()
+
+        self.mesh = Mesh(self.img, 30, parallel=False, context=self.context)
+        for _ in range(3):
+            self.mesh.evolve(3, parallel=False)
+        self.dir = tempfile.mkdtemp()
+        self.uri = os.path.join(self.dir, 'run.npz')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def resume(self, tag=''):
+        """
+        Resumes the checkpoint the way stainedglass.main does.
+        :return: (mesh, pixtemp, min_error, cnt, state) tuple
+        """
+        points, pixtemp, min_error, cnt, entries, state = checkpoint.restore(self.uri, tag)
+        mesh = Mesh(self.img, len(points), parallel=False, points=points, context=self.context)
+        if entries is not None:
+            triangle_cache.cache.load(*entries)
+        return mesh, pixtemp, min_error, cnt, state
+
+    def test_round_trip(self):
+        checkpoint.save(self.uri, self.mesh, 2.5, 1234.0, 7, tag='exact')
+        state = np.random.get_state()
+        np.random.rand(10)
+        triangle_cache.configure()
+
+        mesh, pixtemp, min_error, cnt = self.resume(tag='exact')[:4]
+        self.assertEqual((pixtemp, min_error, cnt), (2.5, 1234.0, 7))
+        np.testing.assert_array_equal(mesh.positions, self.mesh.positions)
+        np.testing.assert_array_equal(mesh.points.fixed, self.mesh.points.fixed)
+        self.assertEqual(mesh.points.accepted, self.mesh.points.accepted)
+        np.testing.assert_array_equal(np.random.get_state()[1], state[1])
+
+    def test_resume_uses_cache(self):
+        self.mesh.retriangulate(parallel=False)
+        checkpoint.save(self.uri, self.mesh, 2.5, 1234.0, 7, tag='exact')
+        triangle_cache.configure()
+        mesh = self.resume(tag='exact')[0]
+
+        triangulation = mesh.retriangulate(parallel=False)
+        self.assertEqual(triangle_cache.cache.misses, 0)
+        np.testing.assert_allclose(triangulation.calculate_global_error(),
+                                   self.mesh._triangulation.calculate_global_error())
+
+    def test_tag_mismatch_skips_cache(self):
+        checkpoint.save(self.uri, self.mesh, 2.5, 1234.0, 7, tag='exact')
+        triangle_cache.configure()
+        self.resume(tag='prefix')
+        self.assertEqual(len(triangle_cache.cache), 0)
+
+    def test_resume_schedule(self):
+        def schedule():
+            return AdaptiveSchedule(8, multiplier=0.9, minimum=0.01, patience=3, reheats=2, time_budget=3600)
+        errors = [100, 90, 90, 90, 90, 85, 85, 85, 85, 85, 85, 85, 85, 85, 85]
+
+        uninterrupted = schedule()
+        for i, error in enumerate(errors[:6]):
+            uninterrupted.update(error, accepted=3 * i, rejected=i)
+        checkpoint.save(self.uri, self.mesh, uninterrupted.temperature, 85, uninterrupted.iteration,
+                        schedule=uninterrupted)
+
+        resumed = schedule()
+        resumed.load_state(self.resume()[4])
+        self.assertEqual(resumed.reheats, 1)
+        self.assertAlmostEqual(resumed._start, uninterrupted._start, places=0)
+        for i, error in enumerate(errors[6:], 6):
+            for run in (uninterrupted, resumed):
+                run.update(error, accepted=3 * i, rejected=2 * i)
+            self.assertEqual(resumed.temperature, uninterrupted.temperature)
+            self.assertEqual((resumed.reheats, resumed.done), (uninterrupted.reheats, uninterrupted.done))
+        self.assertEqual(resumed.stop_reason, 'plateau')
+        self.assertEqual(resumed.acceptance, uninterrupted.acceptance)
+
+    def test_atomic_replace(self):
+        checkpoint.save(self.uri, self.mesh, 2.5, 1234.0, 7)
+        checkpoint.save(self.uri, self.mesh, 1.5, 1000.0, 8)
+        self.assertEqual(self.resume()[3], 8)
+        self.assertEqual(os.listdir(self.dir), ['run.npz'])
+
+
+if __name__ == '__main__':
+    unittest.main()
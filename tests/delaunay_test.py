@@ -0,0 +1,85 @@
+__author__ = 'zieghailo'
+
+import unittest
+import numpy as np
+from numpy import testing
+from scipy.spatial import Delaunay
+
+from delaunay import IncrementalDelaunay
+
+
+def random_points(n, w=200, h=100):
+    corners = [[0, 0], [w, 0], [0, h], [w, h]]
+    return np.concatenate((corners, np.random.rand(n - 4, 2) * [w, h]))
+
+
+def canonical(simplices):
+    return sorted(tuple(sorted(s)) for s in np.asarray(simplices).tolist())
+
+
+class IncrementalDelaunayTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.points = random_points(100)
+        self.delaunay = IncrementalDelaunay(self.points)
+
+    def assertMatchesQhull(self, points):
+        testing.assert_array_equal(self.delaunay.points, points)
+        self.assertEqual(canonical(self.delaunay.simplices), canonical(Delaunay(points).simplices))
+
+    def test_build(self):
+        self.assertMatchesQhull(self.points)
+
+    def test_insert(self):
+        points = self.points
+        for p in np.random.rand(20, 2) * [200, 100]:
+            self.delaunay.insert(*p)
+            points = np.concatenate((points, [p]))
+        self.assertMatchesQhull(points)
+
+    def test_remove(self):
+        points = self.points
+        for _ in range(20):
+            k = np.random.randint(4, len(points))
+            self.delaunay.remove(k)
+            points = np.delete(points, k, axis=0)
+        self.assertMatchesQhull(points)
+
+    def test_remove_many(self):
+        removed = np.random.choice(np.arange(4, len(self.points)), 30, replace=False)
+        self.delaunay.remove_many(removed)
+        self.assertMatchesQhull(np.delete(self.points, removed, axis=0))
+
+    def test_move(self):
+        points = self.points.copy()
+        for _ in range(5):
+            points[4:] += np.random.rand(len(points) - 4, 2) * 10 - 5
+            points = np.clip(points, [0, 0], [200, 100])
+            self.delaunay.move_points(points)
+            self.assertMatchesQhull(points)
+
+    def test_snapshot_ids(self):
+        before = self.delaunay.snapshot()
+        self.delaunay.move(50, *(self.points[50] + 0.5))
+        after = self.delaunay.snapshot()
+
+        # the simplices away from the moved point keep their ids, the ones around it are created again
+        old = dict(zip(before.ids.tolist(), map(tuple, before.simplices.tolist())))
+        new = dict(zip(after.ids.tolist(), map(tuple, after.simplices.tolist())))
+        kept = set(old) & set(new)
+        self.assertTrue(len(kept) > 0)
+        self.assertTrue(len(set(new) - kept) > 0)
+        for tid in kept:
+            self.assertEqual(old[tid], new[tid])
+        self.assertTrue(all(50 not in old[tid] for tid in kept))
+
+    def test_vertex_neighbor_vertices(self):
+        indptr, indices = self.delaunay.vertex_neighbor_vertices
+        expected_indptr, expected_indices = Delaunay(self.points).vertex_neighbor_vertices
+        for k in range(len(self.points)):
+            self.assertEqual(sorted(indices[indptr[k]:indptr[k + 1]]),
+                             sorted(expected_indices[expected_indptr[k]:expected_indptr[k + 1]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+__author__ = 'zieghailo'
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from StringIO import StringIO
+
+from trimath import RasterContext
+from triangulation import Triangulation
+from support import exporter, triangle_cache
+
+
+class ExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.img = np.zeros([60, 80, 3], dtype=np.uint8)
+        self.img[:] = [200, 100, 50]
+        context = RasterContext(self.img, np.ones([60, 80], dtype=np.uint16))
+
+        np.random.seed(0)
+        positions = np.vstack(([[0, 0], [80, 0], [0, 60], [80, 60]], np.random.rand(20, 2) * [80, 60]))
+        self.triangulation = Triangulation(positions)
+        self.triangulation.colorize_stack(parallel=False, context=context)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_render_covers_image(self):
+        canvas = exporter.render(self.triangulation, (80, 60))
+        self.assertEqual(canvas.shape, (60, 80, 3))
+        # the last row and column lie on the border of the triangles
+        np.testing.assert_array_equal(canvas[:-1, :-1], self.img[:-1, :-1])
+
+    def test_render_scaled(self):
+        canvas = exporter.render(self.triangulation, (80, 60), scale=2.5)
+        self.assertEqual(canvas.shape, (150, 200, 3))
+
+    def test_save_svg(self):
+        uri = os.path.join(self.dir, 'out.svg')
+        exporter.save(self.triangulation, uri, (80, 60))
+        with open(uri) as f:
+            svg = f.read()
+        self.assertEqual(svg.count('<polygon'), len(self.triangulation.triangles))
+        self.assertIn('fill="#c86432"', svg)
+
+    def test_save_png(self):
+        uri = os.path.join(self.dir, 'out.png')
+        exporter.save(self.triangulation, uri, (80, 60))
+        self.assertTrue(os.path.getsize(uri) > 0)
+
+    def test_stream_svg(self):
+        f = StringIO()
+        exporter.save_svg(self.triangulation, f, (80, 60))
+        self.assertTrue(f.getvalue().endswith('</svg>\n'))
+
+    def test_binary_round_trip(self):
+        uri = os.path.join(self.dir, 'out.bin')
+        exporter.save(self.triangulation, uri, (80, 60))
+        size, vertices, indices, colors = exporter.load_binary(uri)
+
+        self.assertEqual(size, (80, 60))
+        np.testing.assert_allclose(vertices[indices].transpose(0, 2, 1), self.triangulation.triangles, atol=1e-4)
+        np.testing.assert_array_equal(colors, np.tile([200, 100, 50], (len(indices), 1)))
+
+    def test_json(self):
+        uri = os.path.join(self.dir, 'out.json')
+        exporter.save(self.triangulation, uri, (80, 60))
+        with open(uri) as f:
+            data = json.load(f)
+        self.assertEqual(len(data['indices']), 3 * len(self.triangulation.triangles))
+        self.assertEqual(len(data['colors']), len(data['indices']))
+
+    def gradient_triangulation(self):
+        y, x = np.mgrid[:60, :80]
+        img = np.dstack((3 * x, 4 * y, 200 - x - y)).astype(np.uint8)
+        context = RasterContext(img, np.ones([60, 80], dtype=np.uint16))
+        triangle_cache.configure(channels=9)
+        triangulation = Triangulation(self.triangulation.positions)
+        triangulation.colorize_stack(parallel=False, engine='gradient', context=context)
+        triangle_cache.configure()
+        return img, triangulation
+
+    def test_render_gradients(self):
+        img, triangulation = self.gradient_triangulation()
+        canvas = exporter.render(triangulation, (80, 60))
+        np.testing.assert_allclose(canvas[:-1, :-1], img[:-1, :-1], atol=1)
+        canvas = exporter.render(triangulation, (80, 60), scale=2)
+        np.testing.assert_allclose(canvas[::2, ::2][:-1, :-1], img[:-1, :-1], atol=1)
+
+    def test_svg_gradients(self):
+        img, triangulation = self.gradient_triangulation()
+        f = StringIO()
+        exporter.save_svg(triangulation, f, (80, 60))
+        svg = f.getvalue()
+        self.assertEqual(svg.count('<linearGradient'), len(triangulation.triangles))
+        self.assertEqual(svg.count('fill="url(#g'), len(triangulation.triangles))
+
+    def test_vertex_colors(self):
+        img, triangulation = self.gradient_triangulation()
+        uri = os.path.join(self.dir, 'out.bin')
+        exporter.save(triangulation, uri, (80, 60))
+        size, vertices, indices, colors = exporter.load_binary(uri)
+
+        self.assertEqual(colors.shape, (len(indices), 9))
+        corners = vertices[indices].reshape(-1, 2)
+        expected = np.column_stack((3 * corners[:, 0], 4 * corners[:, 1], 200 - corners.sum(axis=1)))
+        np.testing.assert_allclose(colors.reshape(-1, 3), np.clip(expected, 0, 255), atol=1.5)
+
+        uri = os.path.join(self.dir, 'out.json')
+        exporter.save(triangulation, uri, (80, 60))
+        with open(uri) as f:
+            data = json.load(f)
+        self.assertEqual(data['shading'], 'gradient')
+        self.assertEqual(len(data['colors']), 3 * len(data['indices']))
+
+    def test_async_saver(self):
+        saver = exporter.AsyncSaver()
+        for i in range(5):
+            saver.save(self.triangulation, os.path.join(self.dir, 'out.png'), (80, 60))
+        saver.close()
+        self.assertEqual(saver.saved + saver.dropped, 5)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'out.png')))
+
+
+if __name__ == '__main__':
+    unittest.main()
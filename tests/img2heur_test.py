@@ -0,0 +1,53 @@
+__author__ = 'zieghailo'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import img2heur
+
+
+class GeneratorTest(unittest.TestCase):
+    def setUp(self):
+        # flat on the left, noisy on the right
+        np.random.seed(0)
+        self.img = np.full([80, 120, 3], 128, dtype=np.uint8)
+        self.img[:, 60:] = (np.random.rand(80, 60, 3) * 255).astype(np.uint8)
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_generators_find_detail(self):
+        for name in img2heur.GENERATORS:
+            focus = img2heur.generate(self.img, name)
+            self.assertEqual(focus.shape, (80, 120))
+            self.assertEqual(focus.dtype, np.uint8)
+            self.assertLess(focus[:, :40].mean() * 4, focus[:, 80:].mean(), name)
+
+    def test_flat_image(self):
+        focus = img2heur.local_variance(np.zeros([20, 20, 3], dtype=np.uint8))
+        self.assertFalse(focus.any())
+        self.assertEqual(img2heur.exponential(focus).min(), 1)
+
+    def test_cache(self):
+        cache = os.path.join(self.dir, 'focus')
+        focus = img2heur.generate(self.img, 'gradient', cache)
+        files = os.listdir(cache)
+        self.assertEqual(len(files), 1)
+
+        # the cached map is read back, whatever is in it
+        np.save(os.path.join(cache, files[0]), np.zeros_like(focus))
+        self.assertFalse(img2heur.generate(self.img, 'gradient', cache).any())
+
+        # other generators and other images get their own entries
+        img2heur.generate(self.img, 'variance', cache)
+        img2heur.generate(255 - self.img, 'gradient', cache)
+        self.assertEqual(len(os.listdir(cache)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+__author__ = 'zieghailo'
+
+import unittest
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import initializers
+from initializers import INITIALIZERS, initial_points
+
+
+class InitializerTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.img = np.zeros([100, 200, 3], dtype=np.uint8)
+        self.img[30:70, 120:160] = 255
+        # the right half is ten times as important as the left one
+        self.focus = np.ones([100, 200], dtype=np.uint16)
+        self.focus[:, 100:] = 10
+
+    def test_shapes_and_bounds(self):
+        for name, initializer in INITIALIZERS.items():
+            positions = initializer(self.img, self.focus, 300)
+            self.assertEqual(positions.shape, (300, 2), name)
+            self.assertTrue(np.all(positions >= 0) and np.all(positions <= [200, 100]), name)
+
+    def test_follow_the_heuristic(self):
+        for name in ('importance', 'poisson'):
+            positions = INITIALIZERS[name](self.img, self.focus, 500)
+            right = np.count_nonzero(positions[:, 0] >= 100)
+            self.assertGreater(right, 4 * (500 - right), name)
+
+    def test_poisson_spacing(self):
+        uniform = np.ones_like(self.focus)
+        positions = initializers.poisson_disk(self.img, uniform, 200)
+        spacing = np.sqrt(200 * 100 / 200.0)
+        nearest = cKDTree(positions).query(positions, 2)[0][:, 1]
+        self.assertGreater(nearest.min(), 0.5 * spacing)
+
+    def test_poisson_many_points(self):
+        # k times the focus doesn't fit the uint16 heuristic
+        focus = np.ones_like(self.focus)
+        focus[:, 100:] = 54
+        np.random.seed(1)
+        positions = initializers.poisson_disk(self.img, focus, 3000)
+        np.random.seed(1)
+        expected = initializers.poisson_disk(self.img, focus.astype(np.float64), 3000)
+        np.testing.assert_array_equal(positions, expected)
+
+    def test_corners(self):
+        positions = initializers.corners(self.img, self.focus, 40)
+        # the four corners of the white square are among the points
+        for corner in ([120, 30], [159, 30], [120, 69], [159, 69]):
+            self.assertLess(np.min(np.linalg.norm(positions - corner, axis=1)), 2)
+
+    def test_initial_points(self):
+        points = initial_points('poisson', self.img, self.focus, 50)
+        self.assertEqual(len(points), 50)
+        self.assertEqual(np.count_nonzero(points.fixed), 4)
+        self.assertEqual((points.maxx, points.maxy), (200, 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,11 @@ __author__ = 'zieghailo'
 
 import unittest
 import trimath
+import numpy as np
 from numpy import testing
 from mesh import Mesh
-from point import Point
+from triangulation import Triangulation, nptriangle2result
+from support import triangle_cache
 
 
 class MeshTest(unittest.TestCase):
@@ -12,90 +14,126 @@ class MeshTest(unittest.TestCase):
         import cv2
         img = cv2.imread('../images/lion.jpg')
         self.N = 60
-        self.mesh = Mesh(img, self.N)
-        self.mesh.delaunay()
+        context = trimath.RasterContext(img, np.ones(img.shape[:2], dtype=np.uint16))
+        triangle_cache.configure()
+        self.mesh = Mesh(img, self.N, parallel=False, context=context)
+        self.mesh.retriangulate(parallel=False)
 
     def test_remove_point(self):
         mesh = self.mesh
-        p = mesh.points[50]
+        p = mesh.positions[50].copy()
 
-        self.assertTrue(p in mesh.points)
-        mesh.remove_point(p)
-        self.assertTrue(p not in mesh.points)
+        self.assertIn(p.tolist(), mesh.positions.tolist())
+        mesh.remove_points([50])
+        self.assertNotIn(p.tolist(), mesh.positions.tolist())
         self.assertEquals(len(mesh.points), self.N - 1)
 
     def test_remove_point_at(self):
         mesh = self.mesh
         k = 50
-        p = mesh.points[k]
+        positions = mesh.positions.copy()
 
         point_num = len(mesh.points)
-        self.assertIn(p, mesh.points)
-        mesh.remove_point_at(k)
-        self.assertNotIn(p, mesh.points)
+        mesh.remove_points([0, k])  # the fixed corner stays
+        testing.assert_array_equal(mesh.positions, positions[range(k) + range(k + 1, point_num)])
 
         self.assertEquals(len(mesh.points), point_num - 1)
 
     def test_add_point(self):
-        new_p = Point(100, 100)
         point_num = len(self.mesh.points)
 
-        self.mesh.add_point(new_p)
-        self.assertIn(new_p, self.mesh.points)
+        index = self.mesh.points.add([100, 100])[0]
+        testing.assert_array_equal(self.mesh.positions[index], [100, 100])
         self.assertEquals(len(self.mesh.points), point_num + 1)
 
     def test_split_triangle(self):
         mesh = self.mesh
 
         # TODO parametrize test case
-        triangle = mesh.triangles[-1]
+        triangle = mesh._triangulation.triangles[-1]
 
         mesh.split_triangle(triangle)
-        self.assertTrue(trimath.in_triangle(mesh.points[-1]._position, triangle))
+        self.assertTrue(trimath.in_triangle(mesh.positions[-1], triangle))
+
+    def test_color_neighbors_of_planes(self):
+        triangle_cache.configure(channels=9)
+        self.mesh.retriangulate(parallel=False, engine='gradient')
+        self.mesh._color_neighbors(50)
+        colors = self.mesh._triangulation.flat_colors
+        for i, tr in enumerate(self.mesh._triangulation.delaunay.simplices):
+            if 50 in tr:
+                testing.assert_array_equal(colors[i], (1, 0, 0))
 
     def test_get_existing_result(self):
-        mesh = self.mesh
-        self.fake_colorize()
-        c = mesh.nptriangle2result(mesh.triangles[-1])
-        testing.assert_array_equal(c, mesh.triangles[-1])
+        triangulation = self.mesh._triangulation
+        color, error = nptriangle2result(triangulation.triangles[-1])
+        testing.assert_array_equal(color, triangulation.colors[-1])
+        self.assertEqual(error, triangulation.calculate_triangle_errors()[-1])
 
     def test_get_nonexistent_result(self):
-        mesh = self.mesh
-        self.assertRaises(KeyError, mesh.nptriangle2result, mesh.triangles[-1])
-
-    def fake_colorize(self):
-        for tr in self.mesh.triangles:
-            self.mesh._triangle_cache.set(tr, tr)  # this way all have custom values
-        self.mesh._triangle_stack.clear()
+        triangle_cache.configure()
+        self.assertRaises(KeyError, nptriangle2result, self.mesh._triangulation.triangles[-1])
 
     def test_process_existing_triangle(self):
-        mesh = self.mesh
-        self.fake_colorize()
-        c = mesh.process_triangle(mesh.triangles[-1])
-        testing.assert_array_equal(c, mesh.triangles[-1])
+        # the results of the triangulated positions are all cached
+        triangulation = Triangulation(self.mesh.positions)
+        self.assertEquals(len(triangulation._triangle_stack), 0)
+        testing.assert_array_equal(triangulation.colors, self.mesh._triangulation.colors)
 
     def test_proces_new_triangle(self):
-        mesh = self.mesh
-        mesh._triangle_stack.clear()
-        mesh.process_triangle(mesh.triangles[-1])
-        self.assertEquals(1, len(mesh._triangle_stack))
-        testing.assert_array_equal(mesh.triangles[-1], mesh._triangle_stack[0])
+        triangle_cache.configure()
+        triangulation = Triangulation(self.mesh.positions)
+        testing.assert_array_equal(triangulation.triangles, np.array(triangulation._triangle_stack))
 
     def test_delaunay(self):
-        mesh = self.mesh
-        testing.assert_array_equal(mesh.triangles, mesh._triangle_stack)
+        triangulation = self.mesh._triangulation
+        self.assertEquals(len(triangulation.triangles), len(triangulation.delaunay.simplices))
+        self.assertTrue(np.all(triangulation.calculate_triangle_errors() >= 0))
 
     def test_delaunay_cache(self):
-        mesh = self.mesh
-        self.assertEquals(len(mesh._triangle_cache.cache), 0)
+        self.assertEquals(len(triangle_cache.cache), len(self.mesh._triangulation.triangles))
 
     def test_colorize(self):
+        triangle_cache.configure()
+        triangulation = Triangulation(self.mesh.positions)
+        triangulation.colorize_stack(parallel=False, context=self.mesh.context)
+
+        self.assertEquals(len(triangulation._triangle_stack), 0)
+        self.assertEquals(len(triangle_cache.cache), len(triangulation.triangles))
+        testing.assert_array_equal(triangulation.colors, self.mesh._triangulation.colors)
+
+
+class PurgeTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.img = (np.random.rand(100, 150, 3) * 255).astype(np.uint8)
+        context = trimath.RasterContext(self.img, np.ones([100, 150], dtype=np.uint16))
+        self.mesh = Mesh(self.img, 80, parallel=False, context=context)
+        self.mesh.retriangulate(absolute_error=True, parallel=False)
+
+    def test_purge_keeps_point_count(self):
         mesh = self.mesh
-        mesh.colorize_stack()
+        fixed = mesh.positions[mesh.points.fixed].copy()
+        mesh.slow_purge(n=10)
 
-        self.assertEquals(len(mesh._triangle_stack), 0)
-        self.assertEquals(len(mesh._triangle_cache.cache), len(mesh.triangles))
+        self.assertEqual(len(mesh.points), 80)
+        testing.assert_array_equal(mesh.positions[mesh.points.fixed], fixed)
 
+    def test_purge_splits_worst_triangles(self):
+        mesh = self.mesh
+        errors = mesh._triangulation.calculate_triangle_errors()
+        worst = mesh._triangulation.triangles[np.argsort(errors)[-5:]]
+        mesh.slow_purge(n=5)
+
+        for tr in worst:
+            self.assertTrue(any(trimath.in_triangle(p, tr) for p in mesh.positions[-5:]))
+
+    def test_purge_incremental(self):
+        mesh = Mesh(self.img, 80, parallel=False, incremental=True, context=self.mesh.context)
+        mesh.retriangulate(absolute_error=True, parallel=False)
+        mesh.slow_purge(n=10)
+        triangulation = mesh.retriangulate(absolute_error=True, parallel=False)
+        self.assertEqual(triangulation.delaunay.points.shape[0], 80)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,141 @@
+__author__ = 'zieghailo'
+
+import os
+import json
+import shutil
+import urllib2
+import tempfile
+import threading
+import unittest
+import numpy as np
+
+from trimath import RasterContext
+from mesh import Mesh
+from tiling import TiledAnnealer
+from support import metrics, triangle_cache
+from support.workerpool import WorkerPool
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_timer_and_counters(self):
+        with metrics.timer('colorize'):
+            pass
+        metrics.count('cache_hits', 3)
+        metrics.count('cache_hits')
+        metrics.total('accepted', 10)
+        metrics.total('accepted', 12)
+        metrics.set('error', 5.0)
+
+        snapshot = metrics.registry.snapshot()
+        self.assertGreaterEqual(snapshot['colorize_seconds'], 0)
+        self.assertEqual((snapshot['cache_hits'], snapshot['accepted'], snapshot['error']), (4, 12, 5.0))
+
+    def test_anneal_is_instrumented(self):
+        np.random.seed(0)
+        img = (np.random.rand(60, 80, 3) * 255).astype(np.uint8)
+        context = RasterContext(img, np.ones([60, 80], dtype=np.uint16))
+        triangle_cache.configure()
+        mesh = Mesh(img, 30, parallel=False, context=context)
+        mesh.evolve(3, parallel=False)
+        mesh.evolve_local(3, parallel=False)
+
+        snapshot = metrics.registry.snapshot()
+        for phase in ('triangulate', 'cache', 'colorize', 'neighbors', 'accept'):
+            self.assertIn('%s_seconds' % phase, snapshot)
+        self.assertGreater(snapshot['triangles_colorized'], 0)
+        self.assertGreater(snapshot['cache_hits'] + snapshot['cache_misses'], 0)
+
+    def test_threads(self):
+        def hammer():
+            for _ in range(5000):
+                metrics.count('cache_hits')
+                with metrics.timer('cache'):
+                    pass
+        threads = [threading.Thread(target=hammer) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metrics.registry.snapshot()['cache_hits'], 20000)
+
+    def test_tiles_in_processes(self):
+        np.random.seed(0)
+        img = (np.random.rand(100, 150, 3) * 255).astype(np.uint8)
+        context = RasterContext(img, np.ones([100, 150], dtype=np.uint16))
+        triangle_cache.configure()
+        mesh = Mesh(img, 60, parallel=False, context=context)
+        pool = WorkerPool(context, 2)
+        try:
+            metrics.reset()
+            TiledAnnealer(mesh, pool, tiles=(2, 1), steps=2).anneal(3, 0.0, absolute_error=True)
+        finally:
+            pool.close()
+
+        # the local moves are only made in the workers
+        snapshot = metrics.registry.snapshot()
+        self.assertGreater(snapshot['neighbors_seconds'], 0)
+        self.assertGreater(snapshot['accept_seconds'], 0)
+
+    def test_writer_deltas(self):
+        uri = os.path.join(self.dir, 'run.jsonl')
+        writer = metrics.MetricsWriter(uri)
+        metrics.count('triangles_colorized', 5)
+        metrics.total('accepted', 3)
+        metrics.total('rejected', 1)
+        metrics.set('iteration', 0)
+        writer.write(metrics.registry.snapshot())
+        metrics.count('triangles_colorized', 2)
+        metrics.total('accepted', 4)
+        metrics.total('rejected', 4)
+        metrics.set('iteration', 10)
+        writer.write(metrics.registry.snapshot())
+        writer.close()
+
+        with open(uri) as f:
+            first, second = [json.loads(line) for line in f]
+        self.assertEqual((first['triangles_colorized'], first['acceptance']), (5, 0.75))
+        self.assertEqual((second['triangles_colorized'], second['acceptance']), (2, 0.25))
+        self.assertEqual(second['iteration'], 10)
+        self.assertIsNone(second['cache_hit_rate'])
+
+    def test_csv(self):
+        uri = os.path.join(self.dir, 'run.csv')
+        writer = metrics.MetricsWriter(uri)
+        metrics.set('iteration', 0)
+        metrics.count('cache_hits', 1)
+        metrics.count('cache_misses', 3)
+        writer.write(metrics.registry.snapshot())
+        writer.close()
+
+        with open(uri) as f:
+            header, row = [line.rstrip('\n').split(',') for line in f]
+        self.assertEqual(header, metrics.MetricsWriter.COLUMNS)
+        record = dict(zip(header, row))
+        self.assertEqual((record['iteration'], record['cache_hit_rate'], record['error']), ('0', '0.25', ''))
+
+    def test_prometheus(self):
+        server = metrics.PrometheusServer(0)
+        try:
+            with metrics.timer('purge'):
+                pass
+            metrics.count('triangles_colorized', 7)
+            metrics.set('temperature', 2.5)
+            server.write(metrics.registry.snapshot())
+
+            body = urllib2.urlopen('http://127.0.0.1:%d/metrics' % server.port, timeout=5).read()
+        finally:
+            server.close()
+        self.assertIn('stainedglass_triangles_colorized_total 7.0', body)
+        self.assertIn('stainedglass_temperature 2.5', body)
+        self.assertIn('stainedglass_phase_seconds_total{phase="purge"}', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
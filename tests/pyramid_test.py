@@ -0,0 +1,80 @@
+__author__ = 'zieghailo'
+
+import unittest
+from argparse import Namespace
+import numpy as np
+
+from trimath import RasterContext
+from mesh import Mesh
+from pyramid import Pyramid
+from settings.default_settings import C as defaults
+import stainedglass
+
+
+class PyramidTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.img = (np.random.rand(201, 300, 3) * 255).astype(np.uint8)
+        self.focus = np.ones([201, 300], dtype=np.uint16)
+        self.pyramid = Pyramid(self.img, self.focus, levels=3, switch=2.0)
+
+    def test_levels(self):
+        self.assertEqual(len(self.pyramid), 3)
+        self.assertIs(self.pyramid.level(0)[0], self.img)
+        img, focus = self.pyramid.level(2)
+        self.assertEqual(img.shape, (50, 75, 3))
+        self.assertEqual(focus.shape, (50, 75))
+        self.assertEqual(focus.dtype, np.uint16)
+        self.assertAlmostEqual(self.pyramid.scale(1), 2.0, places=1)
+
+    def test_small_images_stop_early(self):
+        self.assertEqual(len(Pyramid(self.img[:20, :20], self.focus[:20, :20], levels=5)), 2)
+
+    def test_level_for(self):
+        self.assertEqual(self.pyramid.level_for(20), 2)
+        self.assertEqual(self.pyramid.level_for(5), 1)
+        self.assertEqual(self.pyramid.level_for(1), 0)
+        self.assertEqual(Pyramid(self.img, self.focus).level_for(100), 0)
+
+    def test_level_of(self):
+        self.assertEqual(self.pyramid.level_of(75, 50), 2)
+        self.assertRaises(ValueError, self.pyramid.level_of, 10, 10)
+
+    def test_rescale(self):
+        img, focus = self.pyramid.level(2)
+        mesh = Mesh(img, 50, parallel=False, context=RasterContext(img, focus))
+        points = self.pyramid.rescale(mesh.points, 0)
+
+        self.assertEqual((points.maxx, points.maxy), (300, 201))
+        np.testing.assert_array_equal(points.fixed, mesh.points.fixed)
+        np.testing.assert_allclose(points.positions, mesh.positions * [300 / 75.0, 201 / 50.0])
+        # the corners stay on the corners
+        corners = points.positions[points.fixed]
+        self.assertEqual(corners[:, 0].max(), 300)
+        self.assertEqual(corners[:, 1].max(), 201)
+
+    def test_plateau_moves_to_finer_level(self):
+        C = Namespace(**vars(defaults))
+        C.PARALLEL, C.STARTING_POINTS, C.TEMPERATURE, C.PLATEAU_PATIENCE = False, 40, 20, 5
+        level = self.pyramid.level_for(C.TEMPERATURE)
+        context, pool, mesh, annealer = stainedglass.start_level(C, self.pyramid, level)
+        schedule = stainedglass.make_schedule(C)
+        schedule.enter_level(level > 0)
+
+        levels = []
+        while not schedule.done:
+            switched = stainedglass.next_level(C, self.pyramid, level, schedule, mesh, pool)
+            if switched is not None:
+                level, context, pool, mesh, annealer = switched
+            levels.append(level)
+            # no move improves the error, every level plateaus
+            schedule.update(100.0)
+
+        self.assertEqual(levels[0], 2)
+        self.assertEqual(sorted(set(levels)), [0, 1, 2])
+        self.assertEqual(schedule.stop_reason, 'plateau')
+        self.assertEqual(mesh.image.shape, self.img.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+__author__ = 'zieghailo'
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import cv2
+
+import trimath
+from trimath import RasterContext
+from triangulation import colorize
+from support import rawcache
+from support.workerpool import WorkerPool, _share
+import stainedglass
+
+
+class RawCacheTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.dir = tempfile.mkdtemp()
+        self.img = (np.random.rand(50, 70, 3) * 255).astype(np.uint8)
+        self.uri = os.path.join(self.dir, 'image.png')
+        cv2.imwrite(self.uri, self.img[:, :, ::-1])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_decoded_once(self):
+        img, focus = stainedglass.load_images(self.uri, mapped_dir=self.dir)
+        self.assertIsNotNone(rawcache.mapped_path(img))
+        self.assertFalse(img.flags.writeable)
+        np.testing.assert_array_equal(img, self.img)
+        np.testing.assert_array_equal(focus, np.ones([50, 70], dtype=np.uint16))
+
+        calls = []
+        path = rawcache.mapped_path(img)
+        again = rawcache.cached(path, lambda: calls.append(1))
+        self.assertEqual(calls, [])
+        np.testing.assert_array_equal(again, img)
+
+    def test_version_in_image_key(self):
+        img, focus = stainedglass.load_images(self.uri, mapped_dir=self.dir)
+        version = rawcache.CACHE_VERSION
+        rawcache.CACHE_VERSION = version + 1
+        try:
+            path = rawcache.image_path(self.uri, self.dir)
+            self.assertNotEqual(path, rawcache.mapped_path(img))
+            self.assertFalse(os.path.exists(path))
+        finally:
+            rawcache.CACHE_VERSION = version
+        self.assertEqual(rawcache.image_path(self.uri, self.dir), rawcache.mapped_path(img))
+
+    def test_heuristic_keyed_by_focus(self):
+        img = rawcache.cached(rawcache.image_path(self.uri, self.dir), lambda: self.img)
+        uniform = rawcache.heuristic_path(img)
+        self.assertNotEqual(uniform, rawcache.heuristic_path(img, generator='edges'))
+        self.assertNotEqual(uniform, rawcache.heuristic_path(img, focus_uri=self.uri))
+        self.assertEqual(uniform, rawcache.heuristic_path(img))
+
+    def test_pickled_by_path(self):
+        img, focus = stainedglass.load_images(self.uri, mapped_dir=self.dir)
+        data = pickle.dumps(img, 2)
+        self.assertLess(len(data), 1000)
+        np.testing.assert_array_equal(pickle.loads(data), self.img)
+
+        # a view is not the whole file, it is copied
+        view = pickle.loads(pickle.dumps(img[10:20], 2))
+        self.assertIsNone(rawcache.mapped_path(view))
+        np.testing.assert_array_equal(view, self.img[10:20])
+
+    def test_tables_in_bands(self):
+        focus = (np.random.rand(50, 70) * 5 + 1).astype(np.uint16)
+        img = rawcache.cached(rawcache.image_path(self.uri, self.dir), lambda: self.img)
+        heuristic = rawcache.cached(rawcache.heuristic_path(img, generator='test'), lambda: focus)
+
+        band_bytes = rawcache.BAND_BYTES
+        rawcache.BAND_BYTES = 71 * 10 * 8 * 7  # 7 rows per band
+        try:
+            tables = rawcache.tables(img, heuristic)
+        finally:
+            rawcache.BAND_BYTES = band_bytes
+        np.testing.assert_array_equal(tables, trimath.build_prefix_tables(self.img, focus))
+        self.assertIsNone(rawcache.tables(self.img, focus))
+
+    def test_workers_map_the_files(self):
+        focus = (np.random.rand(50, 70) * 5 + 1).astype(np.uint16)
+        img = rawcache.cached(rawcache.image_path(self.uri, self.dir), lambda: self.img)
+        heuristic = rawcache.cached(rawcache.heuristic_path(img, generator='test'), lambda: focus)
+        context = RasterContext(img, heuristic, rawcache.tables(img, heuristic))
+        self.assertEqual(_share(context.image), rawcache.mapped_path(img))
+
+        expected = RasterContext(self.img, focus)
+        expected.build_tables()
+        triangles = np.random.rand(100, 2, 3) * [[70], [50]]
+        pool = WorkerPool(context, 2)
+        try:
+            for engine in ('exact', 'prefix'):
+                colors, errors = colorize(triangles, parallel=True, pool=pool, engine=engine)
+                expected_colors, expected_errors = colorize(triangles, parallel=False, engine=engine,
+                                                            context=expected)
+                np.testing.assert_array_equal(colors, expected_colors)
+                np.testing.assert_array_equal(errors, expected_errors)
+        finally:
+            pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+__author__ = 'zieghailo'
+
+import unittest
+
+from schedules import Schedule, AdaptiveSchedule
+
+
+class ScheduleTest(unittest.TestCase):
+    def test_geometric_cooling(self):
+        schedule = Schedule(8, multiplier=0.5, minimum=1)
+        temperatures = []
+        while not schedule.done:
+            temperatures.append(schedule.temperature)
+            schedule.update(100)
+        self.assertEqual(temperatures, [8, 4, 2, 1])
+        self.assertEqual(schedule.stop_reason, 'temperature')
+
+    def test_iteration_budget(self):
+        schedule = Schedule(5, max_iterations=10, iteration=7)
+        while not schedule.done:
+            schedule.update(100)
+        self.assertEqual(schedule.iteration, 10)
+        self.assertEqual(schedule.stop_reason, 'iterations')
+
+    def test_time_budget(self):
+        self.assertTrue(Schedule(5, time_budget=0).done)
+        self.assertEqual(Schedule(5, time_budget=0).stop_reason, None)
+
+    def test_plateau(self):
+        schedule = Schedule(5, multiplier=1.0, patience=3, tolerance=0.01)
+        for error in [100, 90, 89.5, 89.4]:
+            schedule.update(error)
+            self.assertFalse(schedule.done)
+        schedule.update(89.3)
+        self.assertEqual(schedule.stop_reason, 'plateau')
+
+    def test_reheat(self):
+        schedule = Schedule(8, multiplier=0.5, minimum=0.01, patience=2, reheats=1)
+        for _ in range(3):
+            schedule.update(100)
+        self.assertEqual(schedule.temperature, 4)
+        self.assertEqual(schedule.reheats, 0)
+        self.assertFalse(schedule.done)
+
+        for _ in range(3):
+            schedule.update(100)
+        self.assertEqual(schedule.stop_reason, 'plateau')
+
+    def test_coarse_plateau_ends_the_level(self):
+        schedule = Schedule(8, multiplier=1.0, patience=2, reheats=1)
+        schedule.enter_level(True)
+        for _ in range(3):
+            schedule.update(100)
+        self.assertTrue(schedule.level_done)
+        self.assertFalse(schedule.done)
+        self.assertEqual(schedule.reheats, 1)
+
+        schedule.enter_level(False)
+        self.assertFalse(schedule.level_done)
+        for _ in range(3):
+            schedule.update(100)
+        self.assertEqual(schedule.reheats, 0)
+        self.assertFalse(schedule.done)
+
+    def test_adaptive_follows_acceptance(self):
+        easy = AdaptiveSchedule(5, multiplier=0.9, target=0.3, smoothing=0.0)
+        hard = AdaptiveSchedule(5, multiplier=0.9, target=0.3, smoothing=0.0)
+        geometric = Schedule(5, multiplier=0.9)
+        for i in range(1, 11):
+            easy.update(100, accepted=9 * i, rejected=i)
+            hard.update(100, accepted=i, rejected=9 * i)
+            geometric.update(100)
+        self.assertLess(easy.temperature, geometric.temperature)
+        self.assertGreater(hard.temperature, geometric.temperature)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+__author__ = 'zieghailo'
+
+import sys
+import unittest
+import numpy as np
+
+from trimath import RasterContext
+from mesh import Mesh
+from tiling import TiledAnnealer
+from support.workerpool import ThreadWorkerPool
+
+
+class TiledAnnealerTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.img = (np.random.rand(200, 300, 3) * 255).astype(np.uint8)
+        self.img[:, 150:] = [10, 200, 90]
+        context = RasterContext(self.img, np.ones([200, 300], dtype=np.uint16))
+        self.mesh = Mesh(self.img, 200, parallel=False, context=context)
+        self.annealer = TiledAnnealer(self.mesh, tiles=(3, 2), steps=3)
+
+    def test_grid_covers_image(self):
+        for shifted in range(2):
+            grid = self.annealer._grid(300, 200)
+            area = sum((min(x1, 300) - x0) * (min(y1, 200) - y0) for x0, y0, x1, y1 in grid)
+            self.assertAlmostEqual(area, 300 * 200)
+            self.annealer._round += 1
+
+    def test_owners_are_disjoint(self):
+        jobs, owners = self.annealer._jobs(3, 0.0, True, 'exact')
+        owned = np.concatenate(owners)
+        self.assertEqual(len(owned), len(np.unique(owned)))
+        self.assertFalse(self.mesh.points.fixed[owned].any())
+
+    def test_anneal_moves_owned_points(self):
+        before = self.mesh.positions.copy()
+        self.annealer.anneal(3, 0.0, absolute_error=True)
+
+        moved = np.any(self.mesh.positions != before, axis=1)
+        self.assertTrue(moved.any())
+        self.assertFalse(moved[self.mesh.points.fixed].any())
+        np.testing.assert_array_equal(self.mesh.positions, self.mesh.points.old_positions)
+        self.assertEqual(len(self.mesh._triangulation.triangles), len(self.mesh._triangulation.delaunay.simplices))
+
+    def test_threads_draw_like_one_by_one(self):
+        start = self.mesh.positions.copy()
+        np.random.seed(1)
+        for _ in range(2):
+            self.annealer.anneal(3, 0.5, absolute_error=True)
+        expected = self.mesh.positions.copy()
+
+        self.mesh.points.place(np.arange(len(start)), start)
+        pool = ThreadWorkerPool(self.mesh.context, 4)
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            np.random.seed(1)
+            annealer = TiledAnnealer(self.mesh, pool, tiles=(3, 2), steps=3)
+            for _ in range(2):
+                annealer.anneal(3, 0.5, absolute_error=True)
+        finally:
+            sys.setcheckinterval(interval)
+            pool.close()
+        np.testing.assert_array_equal(self.mesh.positions, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+__author__ = 'zieghailo'
+
+import sys
+import threading
+import unittest
+import numpy as np
+from numpy import testing
+
+from support.triangle_cache import TriangleCache
+
+
+class TriangleCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = TriangleCache(capacity=4)
+        self.triangle = np.array([[10.2, 30.0, 20.0], [5.0, 5.0, 40.4]])
+
+    def test_get_missing(self):
+        self.assertRaises(KeyError, self.cache.get, self.triangle)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_set_get(self):
+        self.cache.set(self.triangle, ((0.1, 0.2, 0.3), 42))
+        color, error = self.cache.get(self.triangle)
+        testing.assert_allclose(color, (0.1, 0.2, 0.3))
+        self.assertEqual(error, 42)
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_permuted_vertices(self):
+        self.cache.set(self.triangle, ((0.1, 0.2, 0.3), 42))
+        self.assertEqual(self.cache.get(self.triangle[:, [2, 0, 1]])[1], 42)
+        self.assertEqual(self.cache.get(self.triangle[:, [1, 0, 2]])[1], 42)
+
+    def test_quantization(self):
+        self.cache.set(self.triangle, ((0.1, 0.2, 0.3), 42))
+        self.assertEqual(self.cache.get(self.triangle + 0.05)[1], 42)
+        self.assertRaises(KeyError, self.cache.get, self.triangle + 0.7)
+
+    def test_eviction(self):
+        triangles = [self.triangle + 10 * i for i in range(6)]
+        for i, tr in enumerate(triangles):
+            self.cache.set(tr, ((0, 0, 0), i))
+
+        self.assertEqual(len(self.cache), 4)
+        self.assertEqual(self.cache.evictions, 2)
+        self.assertEqual(self.cache.get(triangles[-1])[1], 5)
+
+    def test_clock_keeps_referenced(self):
+        triangles = [self.triangle + 10 * i for i in range(5)]
+        for i, tr in enumerate(triangles[:4]):
+            self.cache.set(tr, ((0, 0, 0), i))
+
+        # the first sweep clears every bit, then the slots are reused in order
+        self.cache.set(triangles[4], ((0, 0, 0), 4))
+        self.cache.get(triangles[2])
+        self.cache.set(triangles[0], ((0, 0, 0), 0))
+        self.assertEqual(self.cache.get(triangles[2])[1], 2)
+        self.assertRaises(KeyError, self.cache.get, triangles[1])
+
+    def test_batch(self):
+        triangles = np.array([self.triangle + 10 * i for i in range(3)])
+        keys = self.cache.keys(triangles)
+        self.cache.store(keys, np.ones([3, 3]), np.arange(3))
+
+        slots = self.cache.lookup(keys + self.cache.keys(triangles + 100))
+        testing.assert_array_equal(slots >= 0, [True, True, True, False, False, False])
+        colors, errors = self.cache.results(slots[:3])
+        testing.assert_array_equal(errors, np.arange(3))
+
+    def test_dump_load(self):
+        triangles = np.array([self.triangle + 10 * i for i in range(3)])
+        self.cache.store(self.cache.keys(triangles), np.ones([3, 3]), np.arange(3))
+
+        other = TriangleCache(capacity=4)
+        other.load(*self.cache.dump())
+        self.assertEqual(other.get(triangles[2])[1], 2)
+        self.assertEqual(len(other), 3)
+
+    def test_channels(self):
+        cache = TriangleCache(capacity=4, channels=9)
+        cache.set(self.triangle, (np.arange(9), 1))
+        testing.assert_array_equal(cache.get(self.triangle)[0], np.arange(9))
+        self.assertEqual(cache.dump()[1].shape, (1, 9))
+        cache.clear()
+        self.assertEqual(cache.dump()[1].shape, (0, 9))
+
+    def test_threads(self):
+        cache = TriangleCache(capacity=64)
+        failures = []
+
+        def hammer(seed):
+            rng = np.random.RandomState(seed)
+            try:
+                for _ in range(200):
+                    triangles = np.round(rng.rand(20, 2, 3) * 30)
+                    keys = cache.keys(triangles)
+                    # the error of a triangle is a function of its key, a result stored under another key shows
+                    errors = np.array([sum(key) % 1000 for key in keys], dtype=float)
+                    cache.store(keys, np.zeros([20, 3]), errors)
+                    found, colors, cached = cache.fetch(keys)
+                    expected = errors[found]
+                    if not np.array_equal(cached, expected):
+                        failures.append('wrong result')
+            except Exception as e:
+                failures.append(repr(e))
+
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            threads = [threading.Thread(target=hammer, args=(seed,)) for seed in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+
+        self.assertEqual(failures, [])
+        self.assertEqual(len(cache), 64)
+        self.assertEqual(len(set(cache._slots.values())), 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 __author__ = 'zieghailo'
 
+import math
 import unittest
+from fractions import Fraction
 import numpy.testing as nptest
 from trimath import *
 
@@ -8,20 +10,13 @@ class MyTestCase(unittest.TestCase):
 
     def test_cv2_triangle_sum(self):
         #chessboard
-        img = np.ones([1000, 1000, 3])
-        for x in range(1000):
-            for y in range(1000):
-                for z in range(3):
-                    img[x,y,z] = (x + y) % 2
+        x, y = np.indices([1000, 1000])
+        img = np.repeat(((x + y) % 2 * 255).astype(np.uint8)[:, :, np.newaxis], 3, axis=2)
+        heuristic = np.ones([1000, 1000], dtype=np.uint16)
 
-        img *= 255
+        tr = np.array([[100, 200, 300], [300, 100, 200]], dtype=np.float64)
 
-        tr = np.array([[100, 200, 300], [300, 100, 200]])
-
-        from trimath import cv2_triangle_sum
-        import numpy.testing as nptest
-
-        res = cv2_triangle_sum(img, tr)
+        res = RasterContext(img, heuristic).cv2_triangle_sum(tr)
         color = res[0]
         error = res[1]
         nptest.assert_allclose(color[0], 0.5, atol=0.01)
@@ -29,6 +24,243 @@ class MyTestCase(unittest.TestCase):
         nptest.assert_allclose(color[2], 0.5, atol=0.01)
 
 
+def covered_pixels(tr, width, height):
+    """
+    Reference of the rasterization rule of the scanline kernels, in exact arithmetic:
+    every row the triangle crosses is covered from the pixel its left end touches
+    to the pixel its right end touches, the pixels being [x - 1/2, x + 1/2).
+    :return: set of the (x, y) pixels covered by the triangle
+    """
+    vertices = [(int(np.floor(x + 0.5)), int(np.floor(y + 0.5))) for x, y in zip(tr[0], tr[1])]
+    pixels = set()
+    for y in range(min(v[1] for v in vertices), max(v[1] for v in vertices) + 1):
+        ends = []
+        for (x0, y0), (x1, y1) in zip(vertices, vertices[1:] + vertices[:1]):
+            if y0 == y1 == y:
+                ends += [Fraction(x0), Fraction(x1)]
+            elif min(y0, y1) <= y <= max(y0, y1) and y0 != y1:
+                ends.append(x0 + Fraction((y - y0) * (x1 - x0), y1 - y0))
+        if not ends:
+            continue
+        first = int(math.floor(min(ends) - Fraction(1, 2))) + 1
+        last = int(math.floor(max(ends) + Fraction(1, 2)))
+        pixels.update((x, y) for x in range(max(0, first), min(width - 1, last) + 1) if 0 <= y < height)
+    return pixels
+
+
+def set_up_image(test):
+    np.random.seed(0)
+    test.img = (np.random.rand(300, 400, 3) * 255).astype(np.uint8)
+    test.img[:, 200:] = [10, 200, 90]
+    test.focus = (np.random.rand(300, 400) * 5 + 1).astype(np.uint16)
+    test.context = RasterContext(test.img, test.focus)
+
+    # big enough triangles, so that the rasterization rules on the edges don't matter much
+    test.triangles = np.array([[[20, 180, 60], [10, 40, 250]],
+                               [[100, 390, 250], [20, 60, 290]],
+                               [[210, 390, 300], [10, 100, 200]],
+                               [[5, 395, 200], [5, 5, 295]]], dtype=np.float64)
+
+
+class BatchTriangleSumTest(unittest.TestCase):
+
+    def setUp(self):
+        set_up_image(self)
+
+    def test_matches_single_triangle(self):
+        # fillConvexPoly also covers the outline of the triangles, so they only agree on big ones
+        colors, errors, pixnums = self.context.triangle_sum_batch(self.triangles)
+        for i, tr in enumerate(self.triangles):
+            color, error, pixnum = self.context.cv2_triangle_sum(tr)
+            nptest.assert_allclose(colors[i], color, atol=0.01)
+            nptest.assert_allclose(errors[i], error, rtol=0.05, atol=1)
+            nptest.assert_allclose(pixnums[i], pixnum, rtol=0.05)
+
+    def test_small_and_thin_triangles(self):
+        np.random.seed(1)
+        small = np.random.rand(100, 1, 1) * [[[390], [290]]] + np.random.rand(100, 2, 3) * 10 - 5
+        thin = np.array([[[5, 30, 6], [5, 6, 7]], [[10, 10.4, 60], [10, 80, 45]], [[100, 140, 180], [50, 50.6, 51]],
+                         [[3, 3, 3], [3, 9, 20]], [[-3.2, 8, 2], [-4, 4, 30]], [[395, 420, 399.6], [290, 310, 299]]])
+        triangles = np.vstack((small, thin))
+        colors, errors, pixnums = self.context.triangle_sum_batch(triangles)
+
+        for i, tr in enumerate(triangles):
+            pixels = covered_pixels(tr, 400, 300)
+            self.assertEqual(pixnums[i], len(pixels), tr)
+            if pixels:
+                xs, ys = np.array(sorted(pixels)).transpose()
+                nptest.assert_allclose(colors[i], self.img[ys, xs].mean(axis=0) / 255.0, rtol=1e-12)
+        self.assertEqual(pixnums[len(small)], 27)
+
+    def test_uniform_triangle(self):
+        colors, errors, pixnums = self.context.triangle_sum_batch(self.triangles[2:3])
+        nptest.assert_allclose(colors[0], np.array([10, 200, 90]) / 255.0)
+        self.assertEqual(errors[0], 0)
+
+    def test_vertex_order(self):
+        permuted = self.triangles[:, :, [2, 0, 1]]
+        nptest.assert_array_equal(self.context.triangle_sum_batch(self.triangles)[2],
+                                  self.context.triangle_sum_batch(permuted)[2])
+
+    def test_outside_image(self):
+        tr = np.array([[[-50, -10, -30], [-50, -40, -10]]], dtype=np.float64)
+        colors, errors, pixnums = self.context.triangle_sum_batch(tr)
+        self.assertEqual(pixnums[0], 0)
+
+class PrefixTriangleSumTest(unittest.TestCase):
+
+    def setUp(self):
+        set_up_image(self)
+        self.context.build_tables()
+
+    def test_matches_exact_engine(self):
+        colors, errors, pixnums = self.context.prefix_triangle_sum_batch(self.triangles)
+        exact_colors, _, exact_pixnums = self.context.triangle_sum_batch(self.triangles)
+        nptest.assert_allclose(colors, exact_colors)
+        nptest.assert_array_equal(pixnums, exact_pixnums)
+
+    def test_squared_error(self):
+        import cv2
+        tr = self.triangles[1]
+        mask = np.zeros(self.focus.shape, dtype=np.uint8)
+        cv2.fillConvexPoly(mask, tr.transpose().round().astype(int), 1)
+        pixels = self.img[mask == 1].astype(np.float64)
+        weights = self.focus[mask == 1][:, np.newaxis]
+        expected = np.sum((pixels - pixels.mean(axis=0)) ** 2 * weights)
+
+        errors = self.context.prefix_triangle_sum_batch(self.triangles[1:2])[1]
+        nptest.assert_allclose(errors[0], expected, rtol=0.05)
+
+    def test_uniform_triangle(self):
+        colors, errors, pixnums = self.context.prefix_triangle_sum_batch(self.triangles[2:3])
+        nptest.assert_allclose(colors[0], np.array([10, 200, 90]) / 255.0)
+        nptest.assert_allclose(errors[0], 0, atol=1e-6)
+
+
+class SquaredTriangleSumTest(unittest.TestCase):
+
+    def setUp(self):
+        set_up_image(self)
+        self.context.build_tables()
+
+    def test_matches_prefix_engine(self):
+        colors, errors, pixnums = self.context.squared_triangle_sum_batch(self.triangles)
+        prefix_colors, prefix_errors, prefix_pixnums = self.context.prefix_triangle_sum_batch(self.triangles)
+        nptest.assert_allclose(colors, prefix_colors)
+        nptest.assert_allclose(errors, prefix_errors, rtol=1e-9)
+        nptest.assert_array_equal(pixnums, prefix_pixnums)
+
+    def test_uniform_triangle(self):
+        colors, errors, pixnums = self.context.squared_triangle_sum_batch(self.triangles[2:3])
+        nptest.assert_allclose(colors[0], np.array([10, 200, 90]) / 255.0)
+        nptest.assert_allclose(errors[0], 0, atol=1e-6)
+
+    def test_no_tables_needed(self):
+        context = RasterContext(self.img, self.focus)
+        nptest.assert_array_equal(context.squared_triangle_sum_batch(self.triangles)[1],
+                                  self.context.squared_triangle_sum_batch(self.triangles)[1])
+
+
+class GradientTriangleSumTest(unittest.TestCase):
+
+    def setUp(self):
+        set_up_image(self)
+
+    def test_fits_linear_image(self):
+        y, x = np.mgrid[:100, :120]
+        img = np.dstack((2 * x, 2 * y, 100 + x - y)).astype(np.uint8)
+        context = RasterContext(img, np.ones([100, 120], dtype=np.uint16))
+        tr = np.array([[[10, 100, 30], [10, 20, 90]]], dtype=np.float64)
+
+        planes, errors, pixnums = context.gradient_triangle_sum_batch(tr)
+        nptest.assert_allclose(planes[0] * 255, [0, 0, 100, 2, 0, 1, 0, 2, -1], atol=1e-9)
+        nptest.assert_allclose(errors[0], 0, atol=1e-6)
+        self.assertEqual(pixnums[0], context.triangle_sum_batch(tr)[2][0])
+
+    def test_better_than_flat(self):
+        planes, errors, pixnums = self.context.gradient_triangle_sum_batch(self.triangles)
+        flat_errors = self.context.squared_triangle_sum_batch(self.triangles)[1]
+        self.assertTrue(np.all(errors <= flat_errors * (1 + 1e-9)))
+        nptest.assert_allclose(planes[2], np.array([10, 200, 90, 0, 0, 0, 0, 0, 0]) / 255.0, atol=1e-9)
+
+    def test_collinear_pixels(self):
+        # the pixels of a flat triangle lie on one row, only the mean color can be fit
+        context = RasterContext(self.img, np.ones_like(self.focus))
+        tr = np.array([[[20, 40, 60], [50, 50, 50]]], dtype=np.float64)
+        planes = context.gradient_triangle_sum_batch(tr)[0]
+        nptest.assert_array_equal(planes[0, 3:], 0)
+        nptest.assert_allclose(planes[0, :3], context.triangle_sum_batch(tr)[0][0])
+
+    def test_worst_pixel_of_plane(self):
+        y, x = np.mgrid[:50, :60]
+        img = np.dstack((4 * x, 4 * x, 4 * x)).astype(np.uint8)
+        img[20, 30] = 0
+        context = RasterContext(img, np.ones([50, 60], dtype=np.uint16))
+        tr = np.array([[[0, 59, 0], [0, 0, 49]]], dtype=np.float64)
+
+        planes = context.gradient_triangle_sum_batch(tr)[0]
+        nptest.assert_array_equal(context.worst_pixels(tr, planes)[0], [30, 20])
+
+
+class RasterContextTest(unittest.TestCase):
+
+    def setUp(self):
+        set_up_image(self)
+
+    def test_validation(self):
+        self.assertRaises(ValueError, RasterContext, self.img.astype(np.float64), self.focus)
+        self.assertRaises(ValueError, RasterContext, self.img, self.focus[:100])
+        self.assertRaises(ValueError, self.context.set_tables, np.zeros([3, 3, 10]))
+        self.assertRaises(ValueError, self.context.prefix_triangle_sum_batch, self.triangles)
+
+    def test_single_triangle(self):
+        color, error, pixnum = self.context.triangle_sum(self.triangles[0])
+        colors, errors, pixnums = self.context.triangle_sum_batch(self.triangles[:1])
+        nptest.assert_allclose(color, colors[0])
+        self.assertEqual((error, pixnum), (errors[0], pixnums[0]))
+
+    def test_worst_pixels(self):
+        img = np.full([50, 60, 3], 100, dtype=np.uint8)
+        img[20, 30] = [200, 0, 0]
+        context = RasterContext(img, np.ones([50, 60], dtype=np.uint16))
+        triangles = np.array([[[0, 60, 0], [0, 0, 50]], [[100, 130, 100], [0, 0, 30]]], dtype=np.float64)
+
+        colors = context.triangle_sum_batch(triangles)[0]
+        pixels = context.worst_pixels(triangles, colors)
+        nptest.assert_array_equal(pixels[0], [30, 20])
+        # outside of the image, falls back to the centroid
+        nptest.assert_allclose(pixels[1], [110, 10])
+
+    def test_independent_contexts(self):
+        other = RasterContext(255 - self.img, self.focus)
+        colors = self.context.triangle_sum_batch(self.triangles)[0]
+        other_colors = other.triangle_sum_batch(self.triangles)[0]
+        nptest.assert_allclose(colors + other_colors, 1, atol=1e-9)
+
+    def test_pickle(self):
+        import pickle
+        self.context.build_tables()
+        copy = pickle.loads(pickle.dumps(self.context, pickle.HIGHEST_PROTOCOL))
+        nptest.assert_array_equal(copy.image, self.img)
+        nptest.assert_array_equal(copy.prefix_triangle_sum_batch(self.triangles)[1],
+                                  self.context.prefix_triangle_sum_batch(self.triangles)[1])
+
+    def test_read_only_arrays(self):
+        self.img.setflags(write=False)
+        self.focus.setflags(write=False)
+        context = RasterContext(self.img, self.focus)
+        nptest.assert_array_equal(context.triangle_sum_batch(self.triangles)[2],
+                                  self.context.triangle_sum_batch(self.triangles)[2])
+
+    def test_threads(self):
+        from multiprocessing.pool import ThreadPool
+        triangles = np.tile(self.triangles, (50, 1, 1))
+        pool = ThreadPool(4)
+        results = pool.map(self.context.triangle_sum_batch, np.array_split(triangles, 8))
+        pool.close()
+        nptest.assert_array_equal(np.concatenate([res[1] for res in results]),
+                                  self.context.triangle_sum_batch(triangles)[1])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,43 @@
+__author__ = 'zieghailo'
+
+import unittest
+import numpy as np
+
+from trimath import RasterContext
+from triangulation import colorize
+from support.workerpool import BACKENDS
+
+
+class BackendTest(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        img = (np.random.rand(100, 120, 3) * 255).astype(np.uint8)
+        focus = (np.random.rand(100, 120) * 5 + 1).astype(np.uint16)
+        self.context = RasterContext(img, focus)
+        self.context.build_tables()
+        self.triangles = np.random.rand(200, 2, 3) * [[120], [100]]
+
+    def check_backend(self, backend):
+        pool = BACKENDS[backend](self.context, 2)
+        try:
+            for engine in ('exact', 'squared', 'prefix', 'gradient'):
+                colors, errors = colorize(self.triangles, parallel=True, pool=pool, engine=engine)
+                expected_colors, expected_errors = colorize(self.triangles, parallel=False, engine=engine,
+                                                            context=self.context)
+                np.testing.assert_array_equal(colors, expected_colors)
+                np.testing.assert_array_equal(errors, expected_errors)
+        finally:
+            pool.close()
+
+    def test_process_backend(self):
+        self.check_backend('process')
+
+    def test_thread_backend(self):
+        self.check_backend('thread')
+
+    def test_serial_needs_context(self):
+        self.assertRaises(ValueError, colorize, self.triangles, parallel=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+__author__ = 'zieghailo'
+
+"""
+Partitioned annealing: the image is split into tiles, and every tile is annealed
+by its own worker process, against the image the WorkerPool holds in shared memory.
+A tile owns the movable points inside it, minus a margin along its border, and sees the
+points of a halo around it as fixed, so that the stars of its points look the same as
+in the whole mesh. The tile grid is shifted by half a tile every other round, so the
+points left in the margins get optimized as well. After each round the moved points
+are written back, and the whole mesh is triangulated again.
+"""
+
+import numpy as np
+
+from mesh import Mesh
+from pointset import PointSet
+from support import metrics
+from support.workerpool import worker_context
+
+
+def _anneal_tile(job):
+    """
+    Runs in a worker process. Builds a mesh out of the points of a tile and its halo,
+    and anneals the owned points with local moves, keeping them inside the tile.
+    :param job: tuple created by TiledAnnealer._jobs
+    :return: (positions of the owned points, accepted moves, rejected moves, metrics) tuple,
+             metrics are the drained counts of a worker process, None in the main process
+    """
+    positions, owned, bounds, shape, steps, temp, metropolis, absolute_error, engine, seed, context = job
+    worker = context is None
+    if worker:
+        context = worker_context()
+
+    h, w = shape
+    points = PointSet(w, h, capacity=len(positions))
+    points.add(positions, fixed=~owned)
+
+    # tiles annealed in threads at the same time don't share the global generator
+    mesh = Mesh(None, len(points), parallel=False, points=points, context=context,
+                random_state=np.random.RandomState(seed))
+    for _ in range(steps):
+        mesh.evolve_local(temp, metropolis, absolute_error, parallel=False, engine=engine, bounds=bounds)
+
+    return points.positions[owned], points.accepted, points.rejected, metrics.registry.drain() if worker else None
+
+
+class TiledAnnealer(object):
+
+    def __init__(self, mesh, pool=None, tiles=None, steps=10):
+        """
+        :param mesh: the mesh whose points are annealed
+        :param pool: WorkerPool the tiles are annealed in, if None they are annealed one by one
+        :param tiles: (columns, rows) of the tile grid, if None there are about two tiles per worker
+        :param steps: number of local moves every tile makes per round
+        """
+        self._mesh = mesh
+        self._pool = pool
+        self._steps = steps
+        self._round = 0
+
+        if tiles is None:
+            workers = pool.processes if pool is not None else 1
+            h, w = mesh.image.shape[:2]
+            columns = max(1, int(round(np.sqrt(2.0 * workers * w / h))))
+            rows = max(1, int(np.ceil(2.0 * workers / columns)))
+            tiles = (columns, rows)
+        self._tiles = tiles
+
+    def anneal(self, temp, metropolis=0.0, absolute_error=False, engine='exact'):
+        """
+        Runs one round: every tile is annealed for the given number of steps,
+        then the mesh is triangulated and colorized with the new positions.
+        Takes the same parameters as Mesh.evolve_local.
+        """
+        jobs, owners = self._jobs(temp, metropolis, absolute_error, engine)
+        if self._pool is not None:
+            results = self._pool.map(_anneal_tile, jobs, 1)
+        else:
+            results = map(_anneal_tile, jobs)
+
+        points = self._mesh.points
+        for indices, (positions, accepted, rejected, counts) in zip(owners, results):
+            points.place(indices, positions)
+            points.accepted += accepted
+            points.rejected += rejected
+            if counts is not None:
+                metrics.registry.merge(counts)
+
+        self._round += 1
+        self._mesh.retriangulate(absolute_error, self._pool is not None, engine)
+
+    def _jobs(self, temp, metropolis, absolute_error, engine):
+        """
+        Splits the points between the tiles.
+        :return: list of jobs for _anneal_tile, and the indices of the points each job owns
+        """
+        mesh = self._mesh
+        positions = mesh.positions
+        movable = mesh.points.movable
+        h, w = mesh.image.shape[:2]
+
+        # about the length of an edge, the halo has to hold the stars of the owned points
+        spacing = np.sqrt(w * h / float(len(positions)))
+        halo = 3 * spacing + temp
+        margin = spacing + temp
+
+        jobs, owners = [], []
+        for x0, y0, x1, y1 in self._grid(w, h):
+            inside = (positions[:, 0] >= x0) & (positions[:, 0] < x1) & \
+                     (positions[:, 1] >= y0) & (positions[:, 1] < y1)
+            # the margin is only needed on the borders shared with other tiles
+            lo = [x0 + margin if x0 > 0 else 0, y0 + margin if y0 > 0 else 0]
+            hi = [x1 - margin if x1 < w else w, y1 - margin if y1 < h else h]
+            owned = inside & movable & np.all((positions >= lo) & (positions <= hi), axis=1)
+            if not owned.any() or lo[0] >= hi[0] or lo[1] >= hi[1]:
+                continue
+
+            seen = np.all((positions >= [x0 - halo, y0 - halo]) & (positions <= [x1 + halo, y1 + halo]), axis=1)
+            indices = np.flatnonzero(seen)
+
+            # the corners of the halo keep the sub mesh from collapsing where there are few points
+            box = np.clip([[x0 - halo, y0 - halo], [x1 + halo, y0 - halo],
+                           [x0 - halo, y1 + halo], [x1 + halo, y1 + halo]], [0, 0], [w, h])
+            sub_positions = np.vstack((positions[indices], box))
+            sub_owned = np.concatenate((owned[indices], np.zeros(4, dtype=bool)))
+
+            # process workers have their own context, and get None
+            context = mesh.context if self._pool is None else self._pool.context
+            jobs.append((sub_positions, sub_owned, (lo[0], lo[1], hi[0], hi[1]), (h, w), self._steps,
+                         temp, metropolis, absolute_error, engine, np.random.randint(2 ** 31), context))
+            owners.append(indices[owned[indices]])
+        return jobs, owners
+
+    def _grid(self, w, h):
+        """
+        The tiles of the current round, every other round the grid is shifted by half a tile.
+        :return: list of (x0, y0, x1, y1) rectangles covering the image
+        """
+        columns, rows = self._tiles
+        tw, th = w / float(columns), h / float(rows)
+        shift = 0.5 * (self._round % 2)
+
+        xs = np.unique(np.clip(np.arange(-shift, columns + 1) * tw, 0, w))
+        ys = np.unique(np.clip(np.arange(-shift, rows + 1) * th, 0, h))
+        xs[-1], ys[-1] = w + 1, h + 1  # so that the points on the right and bottom border belong to a tile
+        return [(x0, y0, x1, y1) for x0, x1 in zip(xs[:-1], xs[1:]) for y0, y1 in zip(ys[:-1], ys[1:])]
@@ -2,25 +2,116 @@ __author__ = 'zieghailo'
 
 from collections import deque
 import numpy as np
-from multiprocessing import Pool
+from scipy.sparse import csr_matrix, identity
 
 from support.profiler_fix import *
 
-from trimath import DelaunayXY, cv2_triangle_sum
-from support import lru_cache as cache
+from trimath import DelaunayXY
+from support import metrics, triangle_cache
+from support.workerpool import WorkerPool
 
-__all__ = ['nptriangle2result', 'nptriangle2color', 'nptriangle2error', 'Triangulation']
+__all__ = ['nptriangle2result', 'nptriangle2color', 'nptriangle2error', 'colorize', 'triangles2results',
+           'Triangulation', 'ENGINES', 'CHANNELS']
+
+# error engines, selected with the ERROR_ENGINE setting, mapped to the RasterContext method that runs them:
+# exact sums the absolute error pixel by pixel, in two passes over the pixels,
+# squared sums the squared error pixel by pixel, in a single pass,
+# prefix sums the squared error row by row from the tables built by trimath.build_prefix_tables,
+# gradient fits a linear color gradient instead of a flat color, and sums its squared error pixel by pixel
+ENGINES = {
+    'exact': 'triangle_sum_batch',
+    'squared': 'squared_triangle_sum_batch',
+    'prefix': 'prefix_triangle_sum_batch',
+    'gradient': 'gradient_triangle_sum_batch',
+}
+
+# width of the colors an engine returns, the gradient engine returns a plane for each of the three channels
+CHANNELS = {
+    'gradient': 9,
+}
 
 
 def nptriangle2result(triangle):
     try:
-        result = cache.get(triangle)
+        result = triangle_cache.get(triangle)
     except KeyError:
         raise KeyError("The triangle was not previously colorized.")
         return ((0, 1, 0), 0)
     return result
 
 
+def colorize(triangles, absolute_error=False, parallel=True, pool=None, engine='exact', context=None):
+    """
+    Runs the error engine over the triangles, without looking at the cache.
+    :param triangles: Nx2x3 numpy array of triangle coordinates.
+    :param absolute_error: Bool specifying if the error is the sum or the per pixel error.
+    :param parallel: Bool specifying if the colorization should be parallel.
+    :param pool: WorkerPool or ThreadWorkerPool shared between calls. If None and parallel is set,
+    a temporary WorkerPool is created for this call.
+    :param engine: name of the error engine in ENGINES.
+    :param context: trimath.RasterContext of the image, not needed when the pool is given.
+    :return: NxC colors and N errors, see CHANNELS
+    """
+    method = ENGINES[engine]
+    metrics.count('triangles_colorized', len(triangles))
+    with metrics.timer('colorize'):
+        colors, errors, pixnums = _run_engine(triangles, method, parallel, pool, context)
+
+    if not absolute_error:
+        errors = errors / np.maximum(1, pixnums)
+    return colors, errors
+
+
+def _run_engine(triangles, method, parallel, pool, context):
+    """
+    :return: NxC colors, N errors and N pixel counts
+    """
+    if not parallel:
+        if context is None:
+            raise ValueError("Colorizing without a pool needs a RasterContext.")
+        colors, errors, pixnums = getattr(context, method)(triangles)
+    else:
+        temporary = pool is None
+        if temporary:
+            pool = WorkerPool(context)
+        # a few batches per worker, so that the results are pickled in large chunks,
+        # and the workers that finish early pick up more
+        chunks = np.array_split(triangles, min(len(triangles), 4 * pool.processes))
+        results = pool.evaluate(method, chunks)
+        if temporary:
+            pool.close()
+        colors = np.concatenate([res[0] for res in results])
+        errors = np.concatenate([res[1] for res in results])
+        pixnums = np.concatenate([res[2] for res in results])
+    return colors, errors, pixnums
+
+
+def triangles2results(triangles, absolute_error=False, parallel=True, pool=None, engine='exact', context=None):
+    """
+    Looks the triangles up in the cache, and colorizes the ones that are missing.
+    Takes the same parameters as colorize.
+    :return: NxC colors and N errors
+    """
+    cache = triangle_cache.cache
+    with metrics.timer('cache'):
+        keys = cache.keys(triangles)
+        found, cached_colors, cached_errors = cache.fetch(keys)
+
+        colors = np.zeros([len(triangles), cache.channels])
+        errors = np.zeros(len(triangles))
+        colors[found], errors[found] = cached_colors, cached_errors
+    missing = np.flatnonzero(~found)
+    metrics.count('cache_hits', len(triangles) - len(missing))
+    metrics.count('cache_misses', len(missing))
+
+    if len(missing) > 0:
+        colors[missing], errors[missing] = colorize(triangles[missing], absolute_error, parallel, pool, engine,
+                                                    context)
+        with metrics.timer('cache'):
+            cache.store([keys[i] for i in missing], colors[missing], errors[missing])
+    return colors, errors
+
+
 def nptriangle2color(triangle):
     return nptriangle2result(triangle)[0]
 
@@ -37,132 +128,177 @@ class Triangulation():
     is created, with its own colors and errors.
     """
 
-    def __init__(self, points):
+    def __init__(self, positions, delaunay=None, previous=None):
         """
-        Triangulate the current points,
+        Triangulate the current positions,
         add the triangle numpy arrays to self.triangles,
         salvage results from the cache,q
         add missing results to the stack.
+        :param positions: Nx2 numpy array of the point positions, it is copied.
+        :param delaunay: IncrementalDelaunay kept up to date with the positions.
+        If None, the points are triangulated from scratch.
+        :param previous: Colorized triangulation created from the same IncrementalDelaunay.
+        Simplices it shares with this one are neither looked up nor colorized again.
         """
-        self.positions = np.array([p.position for p in points])
-        x = np.array([p.x for p in points])
-        y = np.array([p.y for p in points])
+        self.positions = np.array(positions, dtype=np.float64)
+        x = self.positions[:, 0]
+        y = self.positions[:, 1]
 
-        self._triangles = deque()
         self._triangle_stack = deque()
-
-        try:
-            self.delaunay = DelaunayXY(x, y)
-        except RuntimeError("Triangulation failed."):
-            pass
-
-        if len(self.delaunay.simplices) > cache.CAPACITY:
+        self._stack_indices = []
+        self._stack_keys = []
+        self._index_by_id = None
+
+        with metrics.timer('triangulate'):
+            if delaunay is None:
+                try:
+                    self.delaunay = DelaunayXY(x, y)
+                except RuntimeError("Triangulation failed."):
+                    pass
+            else:
+                self.delaunay = delaunay.snapshot()
+
+        simplices = self.delaunay.simplices
+        if len(simplices) > triangle_cache.cache.capacity:
             raise MemoryError("Cache is smaller than the number of triangles in the mesh.")
 
-        # goes through the triangles and sifts the new ones out, throws them on the stack
-        for i, t in enumerate(self.delaunay.simplices):
-            triangle = self.points2nptriangle(t)
-            self._triangles.append(triangle)
-            self.process_triangle(triangle)
+        # Tx2x3 array of the triangle coordinates, and their results
+        self._triangles = self.positions[simplices].transpose(0, 2, 1)
+        self._colors = np.zeros([len(simplices), triangle_cache.cache.channels])
+        self._errors = np.zeros(len(simplices))
+
+        lookup = np.ones(len(simplices), dtype=bool)
+        if delaunay is not None:
+            ids = self.delaunay.ids.tolist()
+            self._index_by_id = dict(zip(ids, range(len(ids))))
+
+            if previous is not None and previous._index_by_id is not None:
+                pairs = [(i, previous._index_by_id[tid]) for i, tid in enumerate(ids)
+                         if tid in previous._index_by_id]
+                if pairs:
+                    here, there = np.array(pairs).transpose()
+                    self._colors[here] = previous._colors[there]
+                    self._errors[here] = previous._errors[there]
+                    lookup[here] = False
+
+        # salvage results from the cache, throw the new triangles on the stack
+        with metrics.timer('cache'):
+            indices = np.flatnonzero(lookup)
+            keys = triangle_cache.cache.keys(self._triangles[indices])
+            found, colors, errors = triangle_cache.cache.fetch(keys)
+            self._colors[indices[found]], self._errors[indices[found]] = colors, errors
+
+            for i, key, cached in zip(indices.tolist(), keys, found.tolist()):
+                if not cached:
+                    self._triangle_stack.append(self._triangles[i])
+                    self._stack_indices.append(i)
+                    self._stack_keys.append(key)
+        metrics.count('cache_hits', np.count_nonzero(found))
+        metrics.count('cache_misses', len(found) - np.count_nonzero(found))
 
     @property
     def triangles(self):
         return self._triangles
 
-    def process_triangle(self, nptriangle):
-        """
-        Lookup the color/error of the triangle. If the result has already been calculated,
-        return it. Otherwise, add it to the triangle stack and return None.
-        :param nptriangle: 2x3 numpy array of the triangles coordinates.
-        :return: color and error tuple if the result was calculated before, otherwise None.
-        """
-        try:
-            result = cache.get(nptriangle)
-        except KeyError:
-            self._triangle_stack.append(nptriangle)
-            result = None
-        return result
-
-    def colorize_stack(self, absolute_error=False, parallel=True):
-        if not parallel:
-            while len(self._triangle_stack) > 0:
-                triangle = self._triangle_stack.pop()
-
-                # triangle sum should have image as a global variable
-                result = cv2_triangle_sum(triangle)
-
-                cache.set(triangle, result)
-            if len(self._triangle_stack) != 0:
-                raise AssertionError("Stack not fully colored")
-        else:
-            pool = Pool()
-            triangles = list(self._triangle_stack)
-            results = pool.map(cv2_triangle_sum, triangles)
-            pool.close()
-            pool.join()
+    @property
+    def colors(self):
+        return self._colors
 
-            for triangle, res in zip(self._triangle_stack, results):
-                if absolute_error:
-                    newres = (res[0], res[1])
-                else:
-                    pixnum = max(1, res[2])
-                    newres = (res[0], res[1] / pixnum)
-                cache.set(triangle, newres)
+    @property
+    def flat_colors(self):
+        """
+        :return: Tx3 colors, for the planes of the gradient engine the colors at the centroids
+        """
+        if self._colors.shape[1] == 3:
+            return self._colors
+        centroids = self._triangles.mean(axis=2)
+        colors = (self._colors[:, :3] + centroids[:, :1] * self._colors[:, 3:6] +
+                  centroids[:, 1:] * self._colors[:, 6:])
+        return np.clip(colors, 0, 1)
+
+    def colorize_stack(self, absolute_error=False, parallel=True, pool=None, engine='exact', context=None):
+        """
+        Colorizes all the triangles on the stack and stores the results in the cache.
+        :param absolute_error: Bool specifying if the error is the sum or the per pixel error.
+        :param parallel: Bool specifying if the colorization should be parallel.
+        :param pool: WorkerPool shared between triangulations. If None and parallel is set,
+        a temporary pool is created for this call.
+        :param engine: name of the error engine in ENGINES.
+        :param context: trimath.RasterContext of the image, not needed when the pool is given.
+        """
+        if len(self._triangle_stack) == 0:
+            return
 
-            self._triangle_stack.clear()
+        triangles = np.array(self._triangle_stack)
+        colors, errors = colorize(triangles, absolute_error, parallel, pool, engine, context)
+
+        self._colors[self._stack_indices] = colors
+        self._errors[self._stack_indices] = errors
+        with metrics.timer('cache'):
+            triangle_cache.cache.store(self._stack_keys, colors, errors)
+
+        self._triangle_stack.clear()
+        self._stack_indices = []
+        self._stack_keys = []
+
+    def adjacency(self, n):
+        """
+        The edges of the triangulation as a sparse matrix.
+        :param n: The number of points the triangulation is created with.
+        :return: nxn CSR matrix, nonzero where two points share an edge
+        """
+        indptr, indices = self.delaunay.vertex_neighbor_vertices
+        return csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(n, n))
 
-    def assign_neighbors(self, current_points):
+    def incidence(self, n):
         """
-        For the same points the triangulation is created, each point is updated with the list of neighbors
-        as specified by the triangulation
-        :param current_points: The list of points the triangulation is created with.
-        :return:
+        :param n: The number of points the triangulation is created with.
+        :return: Txn CSR matrix, nonzero where the point is a vertex of the triangle
         """
-        for verts in self.delaunay.simplices:
-            points = [current_points[x] for x in verts]
-            for p in points:
-                p.neighbors.update(set(verts))
+        simplices = self.delaunay.simplices
+        t = len(simplices)
+        return csr_matrix((np.ones(3 * t, dtype=np.int32), simplices.ravel(), np.arange(0, 3 * t + 1, 3)),
+                          shape=(t, n))
 
-    def neighborhood_errors(self, points, nb_list):
+    @staticmethod
+    def neighborhood(triangulations, n):
         """
-        Goes through the list of triangles in the current triangulation,
-        and assigns each triangle's error to all points that are responsible for it.
+        The neighborhood of a point are the point itself, and all the points that share an edge
+        with it in any of the triangulations (before and after the point shift).
+        :param triangulations: Triangulations of the same n points.
+        :return: nxn CSR matrix, nonzero where the column point is in the neighborhood of the row point
+        """
+        neighborhood = identity(n, dtype=np.int32, format='csr')
+        for triangulation in triangulations:
+            neighborhood = neighborhood + triangulation.adjacency(n)
+        neighborhood.data[:] = 1
+        return neighborhood
+
+    def neighborhood_errors(self, neighborhood):
+        """
+        Assigns each triangle's error to all points that are responsible for it.
         A point is responsible for a triangle if all the triangles vertices are in the
-        points neighbors set.
-        :param nb_list: each element in nb_list is a set of all the points who control that
-        points error. A points error is determined by all the points that come in contact
+        points neighborhood. A points error is determined by all the points that come in contact
         with it, (before and after the point shift) so we need to optimize all the teritory
         those points control.
-        :return:
+        :param neighborhood: sparse matrix returned by Triangulation.neighborhood
+        :return: numpy array of errors, one for each point
         """
-        errors = np.zeros(len(points))
-
-        for tr in self.delaunay.simplices:
-            responsible_points = set.intersection(nb_list[tr[0]], nb_list[tr[1]], nb_list[tr[2]])
-            error = nptriangle2error(self.points2nptriangle(tr))
-            for pi in responsible_points:
-                errors[pi] += error
-        return errors
+        n = neighborhood.shape[0]
+        # the number of the triangles vertices in each points neighborhood
+        counts = self.incidence(n).dot(neighborhood).tocoo()
+        responsible = counts.data == 3
+        return np.bincount(counts.col[responsible], weights=self._errors[counts.row[responsible]], minlength=n)
 
     def calculate_triangle_errors(self):
-        errors = np.zeros(len(self.delaunay.simplices))
-
-        for i, tr in enumerate(self.delaunay.simplices):
-            errors[i] = nptriangle2error(self.points2nptriangle(tr))
-
-        return errors
+        return self._errors.copy()
 
     def calculate_point_errors(self, points, assign_errors=False):
-        errors = np.zeros(len(points))
-
-        for i, tr_index in enumerate(self.delaunay.simplices):
-            err = self.trindex2result(i)[1]
-            for p_i in tr_index:
-                errors[p_i] += err
+        errors = np.bincount(self.delaunay.simplices.ravel(), weights=np.repeat(self._errors, 3),
+                             minlength=len(points))
 
         if assign_errors:
-            for i in range(len(points)):
-                points[i].error = errors[i]
+            points.errors[:] = errors
 
         return errors
 
@@ -182,5 +318,4 @@ class Triangulation():
         return triangle
 
     def trindex2result(self, triangle_index):
-        triangle = self._triangles[triangle_index]
-        return nptriangle2result(triangle)
\ No newline at end of file
+        return tuple(self._colors[triangle_index]), self._errors[triangle_index]
\ No newline at end of file
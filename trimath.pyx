@@ -6,6 +6,7 @@ import numpy as np
 import cython
 cimport cython
 cimport numpy as np
+from libc.math cimport floor, fabs
 
 from cv2 import fillConvexPoly
 from collections import namedtuple
@@ -15,27 +16,25 @@ ctypedef np.float64_t FLOAT_t
 
 Rect = namedtuple('Rect', ['north', 'south', 'east', 'west'])
 
-# The image being processed, in module scope so that map doesn't require multiple arguments
-# cdef np.uint8_t[:, :, :] IMAGE
-
-def set_image(np.ndarray[np.uint8_t, ndim=3] img):
-    global IMAGE
-    IMAGE = img
-
-
-def set_heuristic(np.ndarray[np.uint16_t, ndim=2] img):
-    global HEURISTIC
-    HEURISTIC = img
-
-
-cdef np.ndarray[np.uint8_t, ndim=3] get_image():
-    global IMAGE
-    return IMAGE
+# the kernels RasterContext._sums runs over the triangles
+DEF _ABSOLUTE = 0
+DEF _SQUARED = 1
+DEF _PREFIX = 2
 
+def build_prefix_tables(np.ndarray[np.uint8_t, ndim=3] img, np.ndarray[np.uint16_t, ndim=2] heuristic):
+    """
+    Per row prefix sums of the image, the heuristic, the heuristic weighted image,
+    and the heuristic weighted squared image, so that the sums over a row span
+    of a triangle are a difference of two table entries.
+    :return: rows x (columns + 1) x 10 numpy array, column x holds the sum of the pixels left of x
+    """
+    cdef np.ndarray[FLOAT_t, ndim=3] pixels = img.astype(np.float64)
+    cdef np.ndarray[FLOAT_t, ndim=3] weights = heuristic.astype(np.float64)[:, :, np.newaxis]
+    values = np.concatenate((pixels, weights, weights * pixels, weights * pixels * pixels), axis=2)
 
-cdef np.ndarray[np.uint16_t, ndim=2] get_heuristic():
-    global HEURISTIC
-    return HEURISTIC
+    cdef np.ndarray[FLOAT_t, ndim=3] tables = np.zeros([img.shape[0], img.shape[1] + 1, 10])
+    np.cumsum(values, axis=1, out=tables[:, 1:])
+    return tables
 
 
 def DelaunayXY(x, y):
@@ -101,56 +100,601 @@ def rand_point_in_triangle(tr):
     return point
 
 
+cdef class RasterContext:
+    """
+    The image, the heuristic and the prefix tables the triangles are evaluated against.
+    The arrays are only read, and the kernels run without the GIL, so a context can be
+    shared between threads. Pickling a context copies the arrays, to share them between
+    processes without copying, wrap shared memory in numpy arrays and create a context from them.
+    Memory mapped arrays from support.rawcache are kept as they are, and pickled as the path of their file.
+    """
+    cdef readonly object image
+    cdef readonly object heuristic
+    cdef readonly object tables
+    cdef const np.uint8_t[:, :, :] _img
+    cdef const np.uint16_t[:, :] _focus
+    cdef const FLOAT_t[:, :, :] _tables
+
+    def __init__(self, image, heuristic, tables=None):
+        """
+        :param image: rows x columns x 3 uint8 numpy array
+        :param heuristic: rows x columns uint16 numpy array, the weight of every pixel in the error
+        :param tables: prefix tables from build_prefix_tables, needed by prefix_triangle_sum_batch
+        """
+        image = np.asanyarray(image)
+        heuristic = np.asanyarray(heuristic)
+        if image.dtype != np.uint8 or image.ndim != 3 or image.shape[2] != 3:
+            raise ValueError("The image has to be a rows x columns x 3 uint8 array.")
+        if heuristic.dtype != np.uint16 or heuristic.shape != image.shape[:2]:
+            raise ValueError("The heuristic has to be a uint16 array of the same size as the image.")
+
+        self.image = image
+        self.heuristic = heuristic
+        self._img = image
+        self._focus = heuristic
+
+        self.tables = None
+        if tables is not None:
+            self.set_tables(tables)
+
+    def set_tables(self, tables):
+        tables = np.asanyarray(tables)
+        if tables.dtype != np.float64 or tables.shape != (self.image.shape[0], self.image.shape[1] + 1, 10):
+            raise ValueError("The tables don't match the image, use build_prefix_tables.")
+        self.tables = tables
+        self._tables = tables
+
+    def build_tables(self):
+        """
+        Builds the prefix tables of the image, if the context doesn't have them yet.
+        """
+        if self.tables is None:
+            self.set_tables(build_prefix_tables(self.image, self.heuristic))
+
+    def __reduce__(self):
+        return RasterContext, (self.image, self.heuristic, self.tables)
+
+    @property
+    def shape(self):
+        return self.image.shape[:2]
+
+    def triangle_sum(self, tr):
+        """
+        Same as triangle_sum_batch, for a single 2x3 triangle.
+        :return: The color, error_sum, and number of pixels
+        """
+        colors, errors, pixnums = self.triangle_sum_batch(np.asarray(tr, dtype=np.float64).reshape(1, 2, 3))
+        return tuple(colors[0]), errors[0], pixnums[0]
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def triangle_sum_batch(self, const FLOAT_t[:, :, :] trs):
+        """
+        Each triangle is rasterized row by row from its rounded vertices,
+        without allocating masks or cutouts.
+        :param trs: Nx2x3 numpy array of the global triangle coordinates
+        :return: Nx3 colors, N heuristic weighted absolute errors, and N pixel counts
+        """
+        cdef Py_ssize_t n = trs.shape[0]
+        colors, errors, pixnums = np.zeros([n, 3]), np.zeros(n), np.zeros(n, dtype=np.int64)
+        cdef FLOAT_t[:, :] c = colors
+        cdef FLOAT_t[:] e = errors
+        cdef np.int64_t[:] p = pixnums
+
+        with nogil:
+            self._sums(trs, c, e, p, _ABSOLUTE)
+        return colors, errors, pixnums
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def squared_triangle_sum_batch(self, const FLOAT_t[:, :, :] trs):
+        """
+        Same as triangle_sum_batch, but the error is the heuristic weighted squared error,
+        which follows from the sums of a single pass over the pixels, like in prefix_triangle_sum_batch.
+        :param trs: Nx2x3 numpy array of the global triangle coordinates
+        :return: Nx3 colors, N errors, and N pixel counts
+        """
+        cdef Py_ssize_t n = trs.shape[0]
+        colors, errors, pixnums = np.zeros([n, 3]), np.zeros(n), np.zeros(n, dtype=np.int64)
+        cdef FLOAT_t[:, :] c = colors
+        cdef FLOAT_t[:] e = errors
+        cdef np.int64_t[:] p = pixnums
+
+        with nogil:
+            self._sums(trs, c, e, p, _SQUARED)
+        return colors, errors, pixnums
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def gradient_triangle_sum_batch(self, const FLOAT_t[:, :, :] trs):
+        """
+        Fits a linear color gradient to each triangle, instead of a flat color,
+        by heuristic weighted least squares over the sums of a single pass over the pixels.
+        The gradient is a plane in the coordinates of the image, the color of the pixel x, y being
+        color + x * x_slope + y * y_slope, so like the flat colors it only depends on the rounded vertices.
+        :param trs: Nx2x3 numpy array of the global triangle coordinates
+        :return: Nx9 planes, the red, green and blue of the color at the origin, of the x slope and of the y slope,
+        N heuristic weighted squared errors of the fit, and N pixel counts
+        """
+        cdef Py_ssize_t n = trs.shape[0]
+        colors, errors, pixnums = np.zeros([n, 9]), np.zeros(n), np.zeros(n, dtype=np.int64)
+        cdef FLOAT_t[:, :] c = colors
+        cdef FLOAT_t[:] e = errors
+        cdef np.int64_t[:] p = pixnums
+        cdef long edges[9]
+        cdef long bounds[4]
+        cdef double out[11]
+        cdef Py_ssize_t i
+        cdef int k
+
+        with nogil:
+            for i in range(n):
+                if not _setup_triangle(trs[i, 0, 0], trs[i, 1, 0], trs[i, 0, 1], trs[i, 1, 1], trs[i, 0, 2],
+                                       trs[i, 1, 2], self._img.shape[1], self._img.shape[0], edges, bounds):
+                    continue
+                _gradient_sum(self._img, self._focus, edges, bounds, out)
+                for k in range(9):
+                    c[i, k] = out[k]
+                e[i] = out[9]
+                p[i] = <np.int64_t> out[10]
+        return colors, errors, pixnums
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def prefix_triangle_sum_batch(self, const FLOAT_t[:, :, :] trs):
+        """
+        Same as triangle_sum_batch, but the sums come from the prefix tables,
+        one lookup per row instead of one per pixel. Absolute errors can't be summed
+        this way, so the error is the heuristic weighted squared error.
+        :param trs: Nx2x3 numpy array of the global triangle coordinates
+        :return: Nx3 colors, N errors, and N pixel counts
+        """
+        if self.tables is None:
+            raise ValueError("The context has no prefix tables, call build_tables first.")
+
+        cdef Py_ssize_t n = trs.shape[0]
+        colors, errors, pixnums = np.zeros([n, 3]), np.zeros(n), np.zeros(n, dtype=np.int64)
+        cdef FLOAT_t[:, :] c = colors
+        cdef FLOAT_t[:] e = errors
+        cdef np.int64_t[:] p = pixnums
+
+        with nogil:
+            self._sums(trs, c, e, p, _PREFIX)
+        return colors, errors, pixnums
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void _sums(self, const FLOAT_t[:, :, :] trs, FLOAT_t[:, :] colors, FLOAT_t[:] errors,
+                    np.int64_t[:] pixnums, int kernel) nogil:
+        cdef long edges[9]
+        cdef long bounds[4]
+        cdef double out[5]
+        cdef Py_ssize_t i
+
+        for i in range(trs.shape[0]):
+            if not _setup_triangle(trs[i, 0, 0], trs[i, 1, 0], trs[i, 0, 1], trs[i, 1, 1], trs[i, 0, 2], trs[i, 1, 2],
+                                   self._img.shape[1], self._img.shape[0], edges, bounds):
+                continue
+            if kernel == _PREFIX:
+                _prefix_sum(self._tables, edges, bounds, out)
+            elif kernel == _SQUARED:
+                _squared_sum(self._img, self._focus, edges, bounds, out)
+            else:
+                _abs_sum(self._img, self._focus, edges, bounds, out)
+            colors[i, 0] = out[0]
+            colors[i, 1] = out[1]
+            colors[i, 2] = out[2]
+            errors[i] = out[3]
+            pixnums[i] = <np.int64_t> out[4]
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def worst_pixels(self, const FLOAT_t[:, :, :] trs, const FLOAT_t[:, :] colors):
+        """
+        Finds the pixel of each triangle that its color fits worst,
+        the heuristic weighted absolute error being the largest there.
+        :param trs: Nx2x3 numpy array of the global triangle coordinates
+        :param colors: Nx3 colors of the triangles, as returned by triangle_sum_batch,
+        or Nx9 planes, as returned by gradient_triangle_sum_batch
+        :return: Nx2 pixel coordinates, the centroid for the triangles that cover no pixel
+        """
+        cdef Py_ssize_t n = trs.shape[0]
+        pixels = np.zeros([n, 2])
+        cdef FLOAT_t[:, :] px = pixels
+        cdef bint gradient = colors.shape[1] == 9
+        cdef long edges[9]
+        cdef long bounds[4]
+        cdef long x, y, l, r
+        cdef double worst, error
+        cdef double base[3]
+        cdef double gx[3]
+        cdef double gy[3]
+        cdef Py_ssize_t i
+        cdef int k
+
+        with nogil:
+            for i in range(n):
+                px[i, 0] = (trs[i, 0, 0] + trs[i, 0, 1] + trs[i, 0, 2]) / 3
+                px[i, 1] = (trs[i, 1, 0] + trs[i, 1, 1] + trs[i, 1, 2]) / 3
+                if not _setup_triangle(trs[i, 0, 0], trs[i, 1, 0], trs[i, 0, 1], trs[i, 1, 1], trs[i, 0, 2],
+                                       trs[i, 1, 2], self._img.shape[1], self._img.shape[0], edges, bounds):
+                    continue
+
+                # the color of the triangle at the pixel x, y is base + x * gx + y * gy
+                for k in range(3):
+                    base[k] = 255 * colors[i, k]
+                    gx[k] = gy[k] = 0
+                    if gradient:
+                        gx[k] = 255 * colors[i, 3 + k]
+                        gy[k] = 255 * colors[i, 6 + k]
+
+                worst = -1
+                for y in range(bounds[2], bounds[3] + 1):
+                    if not _row_span(edges, bounds, y, &l, &r):
+                        continue
+                    for x in range(l, r + 1):
+                        error = 0
+                        for k in range(3):
+                            error = error + fabs(self._img[y, x, k] - base[k] - x * gx[k] - y * gy[k])
+                        error = error * self._focus[y, x]
+                        if error > worst:
+                            worst = error
+                            px[i, 0] = x
+                            px[i, 1] = y
+        return pixels
+
+    def cv2_triangle_sum(self, np.ndarray[FLOAT_t, ndim=2] tr):
+        """
+        Creates a binary mask of pixels inside the triangle,
+        and multiplies it with the image.
+        It then calculates the sum of the whole matrix.
+        Much slower than triangle_sum, kept as a reference for the scanline kernels.
+        :param tr:  The global triangle coordinates, 2x3 numpy array
+        :return: The color, error_sum, and number of pixels
+        """
+        cdef np.ndarray[np.uint8_t, ndim=3] cutout = _image_cutout(self.image, tr)
+        cdef np.ndarray[np.uint16_t, ndim=2] focus_cutout = _focus_image_cutout(self.heuristic, tr)
+
+        cdef np.ndarray[FLOAT_t, ndim=2] reltr = _relative_triangle(tr)
+        cdef np.ndarray[np.long_t, ndim=2] normtr = reltr.round().astype(int).transpose()
+
+        cdef np.ndarray[np.uint8_t, ndim=2] mask = _make_mask(cutout, normtr)
+        cdef np.uint64_t pixnum = np.sum(mask)
+
+        if pixnum == 0:
+            return (0,0,0), 0, 0
+
+        cdef FLOAT_t red = 0
+        cdef FLOAT_t blue = 0
+        cdef FLOAT_t green = 0
+
+        red = np.sum(cutout[:, :, 0] * mask)
+        green = np.sum(cutout[:, :, 1] * mask)
+        blue = np.sum(cutout[:, :, 2] * mask)
+
+        red = red / pixnum
+        blue = blue / pixnum
+        green = green / pixnum
+
+        cdef FLOAT_t red_err   = 0
+        cdef FLOAT_t green_err = 0
+        cdef FLOAT_t blue_err  = 0
+
+        red_err =   np.sum(np.abs(cutout[:, :, 0] - red  ) * mask * focus_cutout)
+        green_err = np.sum(np.abs(cutout[:, :, 1] - green) * mask * focus_cutout)
+        blue_err =  np.sum(np.abs(cutout[:, :, 2] - blue ) * mask * focus_cutout)
+
+        cdef FLOAT_t error = red_err + green_err + blue_err
+        color = (red / 255.0, green / 255.0, blue / 255.0)
+        return color, error, pixnum
+
+
+# region scanline rasterization
+@cython.cdivision(True)
+cdef inline long _floor_div(long a, long b) nogil:
+    # b is always positive
+    cdef long q = a / b
+    if a % b != 0 and a < 0:
+        q -= 1
+    return q
+
+
+cdef inline long _round(double v) nogil:
+    return <long> floor(v + 0.5)
+
+
+cdef bint _setup_triangle(double x0, double y0, double x1, double y1, double x2, double y2,
+                          long width, long height, long *edges, long *bounds) nogil:
+    """
+    Rounds the vertices to whole pixels, and fills in the edge functions A*x + B*y + C,
+    which are non negative inside the triangle, and the bounding box clipped to the image.
+    :return: False if the bounding box lies outside of the image
+    """
+    cdef long xs[3]
+    cdef long ys[3]
+    cdef long t
+    cdef int e, f
+
+    xs[0] = _round(x0)
+    ys[0] = _round(y0)
+    xs[1] = _round(x1)
+    ys[1] = _round(y1)
+    xs[2] = _round(x2)
+    ys[2] = _round(y2)
+
+    # make the triangle counter clockwise, so that the inside is left of every edge
+    if (xs[1] - xs[0]) * (ys[2] - ys[0]) - (ys[1] - ys[0]) * (xs[2] - xs[0]) < 0:
+        t = xs[1]
+        xs[1] = xs[2]
+        xs[2] = t
+        t = ys[1]
+        ys[1] = ys[2]
+        ys[2] = t
+
+    for e in range(3):
+        f = (e + 1) % 3
+        edges[3 * e] = ys[e] - ys[f]
+        edges[3 * e + 1] = xs[f] - xs[e]
+        edges[3 * e + 2] = (ys[f] - ys[e]) * xs[e] - (xs[f] - xs[e]) * ys[e]
+
+    bounds[0] = max(0, min(xs[0], min(xs[1], xs[2])))
+    bounds[1] = min(width - 1, max(xs[0], max(xs[1], xs[2])))
+    bounds[2] = max(0, min(ys[0], min(ys[1], ys[2])))
+    bounds[3] = min(height - 1, max(ys[0], max(ys[1], ys[2])))
+    return bounds[0] <= bounds[1] and bounds[2] <= bounds[3]
+
+
+cdef inline bint _row_span(long *edges, long *bounds, long y, long *left, long *right) nogil:
+    """
+    Finds the first and the last pixel of row y covered by the triangle, whose vertices are rounded to whole pixels.
+    The triangle cuts a segment out of the line through the centers of the row, and the pixels
+    the segment touches are covered, a pixel being [x - 1/2, x + 1/2). That covers about as many
+    pixels as the area of the triangle, fillConvexPoly also draws the outline, and covers up to
+    twice as many pixels of thin triangles.
+    :return: False if the row doesn't cross the triangle
+    """
+    cdef long l = bounds[0]
+    cdef long r = bounds[1]
+    cdef long a, k
+    cdef int e
+
+    for e in range(3):
+        a = edges[3 * e]
+        k = edges[3 * e + 1] * y + edges[3 * e + 2]
+        if a > 0:
+            l = max(l, _floor_div(a - 2 * k, 2 * a))
+        elif a < 0:
+            r = min(r, _floor_div(2 * k - a, -2 * a))
+        elif k < 0:
+            return False
+
+    left[0] = l
+    right[0] = r
+    return l <= r
+
+
 @cython.boundscheck(False)
+@cython.wraparound(False)
 @cython.cdivision(True)
-def cv2_triangle_sum(np.ndarray[FLOAT_t, ndim=2] tr):
+cdef void _abs_sum(const np.uint8_t[:, :, :] img, const np.uint16_t[:, :] focus,
+                   long *edges, long *bounds, double *out) nogil:
     """
-    Creates a binary mask of pixels inside the triangle,
-    and multiplies it with the image.
-    It then calculates the sum of the whole matrix.
-    :param img: The minimal image containing the triangle, defined by _get_rect
-    :param tr:  The global triangle coordinates, 2x3 numpy array
-    :return: The color, error_sum, and number of pixels
+    Two passes over the pixels of the triangle, the first for the mean color,
+    the second for the heuristic weighted absolute error.
+    :param out: filled with red, green, blue, error and the number of pixels
     """
+    cdef long x, y, l, r
+    cdef double red = 0, green = 0, blue = 0, error = 0, w
+    cdef long pixnum = 0
+
+    for y in range(bounds[2], bounds[3] + 1):
+        if not _row_span(edges, bounds, y, &l, &r):
+            continue
+        pixnum += r - l + 1
+        for x in range(l, r + 1):
+            red += img[y, x, 0]
+            green += img[y, x, 1]
+            blue += img[y, x, 2]
+
+    out[0] = out[1] = out[2] = out[3] = out[4] = 0
+    if pixnum == 0:
+        return
 
-    cdef np.ndarray[np.uint8_t, ndim=3] IMAGE = get_image()
-    cdef np.ndarray[np.uint16_t, ndim=2] FOCUS = get_heuristic()
+    red /= pixnum
+    green /= pixnum
+    blue /= pixnum
 
-    cdef np.ndarray[np.uint8_t, ndim=3] cutout = _image_cutout(IMAGE, tr)
-    cdef np.ndarray[np.uint16_t, ndim=2] focus_cutout = _focus_image_cutout(FOCUS, tr)
+    for y in range(bounds[2], bounds[3] + 1):
+        if not _row_span(edges, bounds, y, &l, &r):
+            continue
+        for x in range(l, r + 1):
+            w = focus[y, x]
+            error += (fabs(img[y, x, 0] - red) + fabs(img[y, x, 1] - green) + fabs(img[y, x, 2] - blue)) * w
 
-    cdef np.ndarray[FLOAT_t, ndim=2] reltr = _relative_triangle(tr)
-    cdef np.ndarray[np.long_t, ndim=2] normtr = reltr.round().astype(int).transpose()
+    out[0] = red / 255.0
+    out[1] = green / 255.0
+    out[2] = blue / 255.0
+    out[3] = error
+    out[4] = pixnum
 
-    cdef np.ndarray[np.uint8_t, ndim=2] mask = _make_mask(cutout, normtr)
-    cdef np.uint64_t pixnum = np.sum(mask)
 
+@cython.cdivision(True)
+cdef inline void _squared_error(double *sums, long pixnum, double *out) nogil:
+    """
+    The mean color and the squared error of the ten sums of the prefix tables,
+    the error of a channel is sum(h*i^2) - 2*mean*sum(h*i) + mean^2*sum(h).
+    :param out: filled with red, green, blue, error and the number of pixels
+    """
+    cdef int k
+    cdef double mean, error = 0
+
+    out[0] = out[1] = out[2] = out[3] = out[4] = 0
     if pixnum == 0:
-        return (0,0,0), 0, 0
+        return
 
-    cdef FLOAT_t red = 0
-    cdef FLOAT_t blue = 0
-    cdef FLOAT_t green = 0
+    for k in range(3):
+        mean = sums[k] / pixnum
+        error += sums[7 + k] - 2 * mean * sums[4 + k] + mean * mean * sums[3]
+        out[k] = mean / 255.0
+    _store_error(out + 3, error, pixnum)
 
-    red = np.sum(cutout[:, :, 0] * mask)
-    green = np.sum(cutout[:, :, 1] * mask)
-    blue = np.sum(cutout[:, :, 2] * mask)
 
-    red = red / pixnum
-    blue = blue / pixnum
-    green = green / pixnum
+cdef inline void _store_error(double *out, double error, long pixnum) nogil:
+    """
+    :param out: filled with the error and the number of pixels
+    """
+    # the error is a difference of large sums, the subtraction can leave a tiny negative rounding error
+    out[0] = max(0, error)
+    out[1] = pixnum
 
-    cdef FLOAT_t red_err   = 0
-    cdef FLOAT_t green_err = 0
-    cdef FLOAT_t blue_err  = 0
 
-    red_err =   np.sum(np.abs(cutout[:, :, 0] - red  ) * mask * focus_cutout)
-    green_err = np.sum(np.abs(cutout[:, :, 1] - green) * mask * focus_cutout)
-    blue_err =  np.sum(np.abs(cutout[:, :, 2] - blue ) * mask * focus_cutout)
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _squared_sum(const np.uint8_t[:, :, :] img, const np.uint16_t[:, :] focus,
+                       long *edges, long *bounds, double *out) nogil:
+    """
+    A single pass over the pixels of the triangle, summing the same terms as the prefix tables.
+    :param out: filled with red, green, blue, error and the number of pixels
+    """
+    cdef long x, y, l, r
+    cdef int k
+    cdef double sums[10]
+    cdef double value, w
+    cdef long pixnum = 0
+
+    for k in range(10):
+        sums[k] = 0
+
+    for y in range(bounds[2], bounds[3] + 1):
+        if not _row_span(edges, bounds, y, &l, &r):
+            continue
+        pixnum += r - l + 1
+        for x in range(l, r + 1):
+            w = focus[y, x]
+            sums[3] += w
+            for k in range(3):
+                value = img[y, x, k]
+                sums[k] += value
+                sums[4 + k] += w * value
+                sums[7 + k] += w * value * value
+
+    _squared_error(sums, pixnum, out)
 
-    cdef FLOAT_t error = red_err + green_err + blue_err
-    color = (red / 255.0, green / 255.0, blue / 255.0)
-    return color, error, pixnum
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _gradient_sum(const np.uint8_t[:, :, :] img, const np.uint16_t[:, :] focus,
+                        long *edges, long *bounds, double *out) nogil:
+    """
+    A single pass over the pixels of the triangle, summing the heuristic weighted moments of the
+    pixel coordinates and colors. The plane of each channel that minimizes the weighted squared error
+    passes through the weighted mean, and its slopes solve the 2x2 normal equations of the centered moments.
+    Triangles whose pixels lie on a line, or carry no weight, get a flat color.
+    The coordinates are relative to the corner of the bounding box, which keeps the moments small.
+    :param out: filled with the red, green, blue of the color at the origin, of the x and of the y slope,
+    error and the number of pixels
+    """
+    cdef long x, y, l, r
+    cdef int k
+    cdef double w, dx, dy, value
+    cdef double sw = 0, sx = 0, sy = 0, sxx = 0, sxy = 0, syy = 0
+    cdef double s[3]
+    cdef double si[3]
+    cdef double sxi[3]
+    cdef double syi[3]
+    cdef double sii[3]
+    cdef double mx = 0, my = 0, cxx = 0, cxy = 0, cyy = 0, det = 0
+    cdef double mean, gx, gy, b, c, residual, error = 0
+    cdef long pixnum = 0
+
+    for k in range(3):
+        s[k] = si[k] = sxi[k] = syi[k] = sii[k] = 0
+
+    for y in range(bounds[2], bounds[3] + 1):
+        if not _row_span(edges, bounds, y, &l, &r):
+            continue
+        pixnum += r - l + 1
+        dy = y - bounds[2]
+        for x in range(l, r + 1):
+            w = focus[y, x]
+            dx = x - bounds[0]
+            sw += w
+            sx += w * dx
+            sy += w * dy
+            sxx += w * dx * dx
+            sxy += w * dx * dy
+            syy += w * dy * dy
+            for k in range(3):
+                value = img[y, x, k]
+                s[k] += value
+                si[k] += w * value
+                sxi[k] += w * dx * value
+                syi[k] += w * dy * value
+                sii[k] += w * value * value
+
+    for k in range(11):
+        out[k] = 0
+    if pixnum == 0:
+        return
+
+    if sw > 0:
+        mx = sx / sw
+        my = sy / sw
+        cxx = sxx - sx * mx
+        cxy = sxy - sx * my
+        cyy = syy - sy * my
+        det = cxx * cyy - cxy * cxy
+
+    for k in range(3):
+        b = c = 0
+        if sw > 0:
+            mean = si[k] / sw
+            residual = sii[k] - si[k] * mean
+            # collinear pixels only fix the slope along their line, those get a flat color
+            if det > 1e-6 * cxx * cyy:
+                gx = sxi[k] - mx * si[k]
+                gy = syi[k] - my * si[k]
+                b = (cyy * gx - cxy * gy) / det
+                c = (cxx * gy - cxy * gx) / det
+                residual -= b * gx + c * gy
+            error += residual
+        else:
+            mean = s[k] / pixnum
+
+        out[k] = (mean - b * (bounds[0] + mx) - c * (bounds[2] + my)) / 255.0
+        out[3 + k] = b / 255.0
+        out[6 + k] = c / 255.0
+
+    _store_error(out + 9, error, pixnum)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _prefix_sum(const FLOAT_t[:, :, :] tables, long *edges, long *bounds, double *out) nogil:
+    """
+    Sums the prefix tables over the rows of the triangle.
+    :param out: filled with red, green, blue, error and the number of pixels
+    """
+    cdef long y, l, r
+    cdef int k
+    cdef double sums[10]
+    cdef long pixnum = 0
+
+    for k in range(10):
+        sums[k] = 0
+
+    for y in range(bounds[2], bounds[3] + 1):
+        if not _row_span(edges, bounds, y, &l, &r):
+            continue
+        pixnum += r - l + 1
+        for k in range(10):
+            sums[k] += tables[y, r + 1, k] - tables[y, l, k]
+
+    _squared_error(sums, pixnum, out)
+# endregion
 
 
 cdef _make_mask(np.ndarray[np.uint8_t, ndim=3] cutout, np.ndarray[np.long_t, ndim=2] rel_tri):